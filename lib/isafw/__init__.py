@@ -31,6 +31,8 @@
 Current Contents:
 
 * isafw.py - main class
+* inventory.py - inventory of the rootfs shared by the plugins
+* findings.py - findings store shared by the build tasks
 * plugins - ISA plugins
 * plugins/configs - configuration data for the plugins
 """
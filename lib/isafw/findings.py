@@ -0,0 +1,211 @@
+#
+# findings.py - Findings of the plugins shared by the build tasks, part of ISA FW
+#
+# Copyright (c) 2015, Intel Corporation
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of Intel Corporation nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import json
+import os
+import sqlite3
+import time
+
+__all__ = [
+    'ISA_findings',
+    ]
+
+
+class ISA_findings:
+    # The findings of all the builds are kept in one SQLite database in WAL
+    # mode, so that the bitbake tasks analysing recipes in parallel can add
+    # theirs while reports are read. A finding is (plugin, kind, subject,
+    # detail), e.g. ("LA", "license", package, license), recorded once per
+    # build; the builds table also lists the builds in which a plugin ran
+    # without finding anything. Findings are buffered by add() and written
+    # in one transaction by commit(); the database is only created by the
+    # first commit with something to write. Only the last keep builds are
+    # kept, 0 keeps all of them.
+    stores = {}
+
+    def __init__(self, path, build, keep=0):
+        self.path = path
+        self.build = build
+        self.keep = keep
+        self.pending = []
+        self.ran = set()
+        self.plugins = set()
+        self.conn = None
+        self.pid = None
+
+    # the plugins of a process share one store per database and build
+    @classmethod
+    def open(cls, path, build, keep=0):
+        store = cls.stores.get((path, build))
+        if store is None:
+            store = cls.stores[(path, build)] = cls(path, build, keep)
+        return store
+
+    @classmethod
+    def commit_all(cls):
+        for store in cls.stores.values():
+            store.commit()
+
+    # called once the reports are written, the stores reconnect if they
+    # are used again
+    @classmethod
+    def close_all(cls):
+        for store in cls.stores.values():
+            store.close()
+
+    # sqlite connections can not be shared with forked processes, so every
+    # process opens its own one on first use; returns None if create is
+    # False and the database does not exist
+    def connect(self, create=True):
+        if self.conn is None or self.pid != os.getpid():
+            if not create and not os.path.exists(self.path):
+                return None
+            # transactions are started and ended explicitly
+            conn = sqlite3.connect(self.path, timeout=300, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS builds (build TEXT, plugin TEXT, time REAL, "
+                         "PRIMARY KEY (build, plugin))")
+            conn.execute("CREATE TABLE IF NOT EXISTS findings (id INTEGER PRIMARY KEY, build TEXT, plugin TEXT, "
+                         "kind TEXT, subject TEXT, detail TEXT)")
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS findings_key "
+                         "ON findings (build, plugin, kind, subject, detail)")
+            self.conn = conn
+            self.pid = os.getpid()
+        return self.conn
+
+    # writes what is pending, drops the builds before the last keep ones and
+    # closes the connection; the checkpoint leaves no WAL content behind,
+    # and closing the last connection removes the -wal and -shm files
+    def close(self):
+        self.commit()
+        if self.conn is None or self.pid != os.getpid():
+            self.conn = None
+            return
+        try:
+            if self.keep:
+                self.prune()
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            self.conn.close()
+            self.conn = None
+
+    def prune(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            kept = "SELECT build FROM builds GROUP BY build ORDER BY MAX(time) DESC LIMIT ?"
+            self.conn.execute("DELETE FROM findings WHERE build NOT IN (" + kept + ")", (self.keep,))
+            self.conn.execute("DELETE FROM builds WHERE build NOT IN (" + kept + ")", (self.keep,))
+        except:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    # the rows of a query, none while the database does not exist
+    def query(self, sql, args):
+        conn = self.connect(create=False)
+        if conn is None:
+            return []
+        return conn.execute(sql, args).fetchall()
+
+    def add(self, plugin, kind, subject, detail):
+        self.mark(plugin)
+        self.pending.append((self.build, plugin, kind, subject, detail))
+
+    # records that the plugin ran in this build, even without findings
+    def mark(self, plugin):
+        self.ran.add(plugin)
+        self.plugins.add(plugin)
+
+    def commit(self):
+        if not self.pending and not self.ran:
+            return
+        conn = self.connect()
+        # take the write lock up front, the busy timeout then covers
+        # the whole transaction
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR IGNORE INTO builds VALUES (?, ?, ?)",
+                             [(self.build, plugin, time.time()) for plugin in self.ran])
+            conn.executemany("INSERT OR IGNORE INTO findings (build, plugin, kind, subject, detail) "
+                             "VALUES (?, ?, ?, ?, ?)", self.pending)
+        except:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        self.pending = []
+        self.ran = set()
+
+    # [(subject, detail)] of the build, this one by default, in the order
+    # they were found
+    def findings(self, plugin, kind, build=None):
+        return self.query(
+            "SELECT subject, detail FROM findings WHERE build = ? AND plugin = ? AND kind = ? ORDER BY id",
+            (build or self.build, plugin, kind))
+
+    # the findings of the build, this one by default, that since_build did
+    # not have
+    def new_since(self, plugin, kind, since_build, build=None):
+        return self.query(
+            "SELECT subject, detail FROM findings AS f WHERE build = ? AND plugin = ? AND kind = ? "
+            "AND NOT EXISTS (SELECT 1 FROM findings WHERE build = ? AND plugin = f.plugin "
+            "AND kind = f.kind AND subject = f.subject AND detail = f.detail) ORDER BY id",
+            (build or self.build, plugin, kind, since_build))
+
+    # the builds the plugin ran in before this one, the latest first
+    def previous_builds(self, plugin):
+        return [row[0] for row in self.query(
+            "SELECT build FROM builds WHERE plugin = ? AND build != ? ORDER BY time DESC",
+            (plugin, self.build))]
+
+    # Writes the findings of this build about subject, e.g. a recipe, so
+    # that the build system can keep them with the task that produced
+    # them; load() adds them to the build of another store.
+    def save(self, file_name, subject):
+        self.commit()
+        rows = self.query(
+            "SELECT plugin, kind, detail FROM findings WHERE build = ? AND subject = ? ORDER BY id",
+            (self.build, subject))
+        results = {
+            "subject": subject,
+            "plugins": sorted(self.plugins),
+            "findings": [list(row) for row in rows],
+        }
+        tmp_name = file_name + ".tmp"
+        with open(tmp_name, 'w') as f:
+            json.dump(results, f)
+        os.rename(tmp_name, file_name)
+
+    def load(self, file_name):
+        with open(file_name, 'r') as f:
+            results = json.load(f)
+        subject = results["subject"]
+        for plugin in results["plugins"]:
+            self.mark(plugin)
+        for plugin, kind, detail in results["findings"]:
+            self.add(plugin, kind, subject, detail)
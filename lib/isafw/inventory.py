@@ -0,0 +1,822 @@
+#
+# inventory.py - Inventory of the rootfs of an image, part of ISA FW
+#
+# Copyright (c) 2015, Intel Corporation
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of Intel Corporation nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import bisect
+import errno
+import json
+import os
+import re
+import sqlite3
+import stat
+import subprocess
+import sys
+import tarfile
+import threading
+from array import array
+from collections import deque
+
+__all__ = [
+    'ISA_fsentry',
+    'ISA_inventory',
+    'ISA_names',
+    'ISA_tar_inventory',
+    'walk',
+    ]
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+# the part of os.DirEntry the walker needs, for Pythons without scandir
+class ListdirEntry:
+    def __init__(self, dirpath, name):
+        self.name = name
+        self.path = os.path.join(dirpath, name)
+        self.lstat = None
+
+    def stat(self, follow_symlinks=True):
+        if follow_symlinks:
+            return os.stat(self.path)
+        if self.lstat is None:
+            self.lstat = os.lstat(self.path)
+        return self.lstat
+
+    def is_symlink(self):
+        try:
+            return stat.S_ISLNK(self.stat(follow_symlinks=False).st_mode)
+        except OSError:
+            return False
+
+    def is_dir(self):
+        try:
+            return stat.S_ISDIR(self.stat().st_mode)
+        except OSError:
+            return False
+
+
+def scan(dirpath):
+    if scandir is not None:
+        return scandir(dirpath)
+    return [ListdirEntry(dirpath, name) for name in os.listdir(dirpath)]
+
+
+# Lists a directory: returns the entries that are not directories and the
+# paths of the subdirectories, or None if it can not be listed. Symlinks to
+# directories are left out.
+def list_dir(dirpath):
+    try:
+        entries = list(scan(dirpath or "/"))
+    except OSError:
+        return None
+    objects = []
+    subdirs = []
+    for e in entries:
+        if e.is_dir():
+            if not e.is_symlink():
+                subdirs.append(dirpath + "/" + e.name)
+        else:
+            objects.append(e)
+    return objects, subdirs
+
+
+def lstat_entries(dirpath, entries):
+    objects = []
+    for e in entries:
+        try:
+            objects.append((dirpath + "/" + e.name, e.stat(follow_symlinks=False)))
+        except OSError:
+            continue
+    return objects
+
+
+def lstat_dir(dirpath):
+    try:
+        return os.lstat(dirpath)
+    except OSError:
+        return None
+
+
+# entries of a directory one thread lstats in a go
+stat_batch = 64
+
+
+# Reads the directories below top with a pool of threads, so that the round
+# trips to slow storage overlap. A job either lists a directory or lstats a
+# batch of its entries. Every thread takes the jobs it created itself last
+# in, depth first, and steals the oldest jobs of the other threads when it
+# runs out. Finished directories wait in results until read() asks for them.
+class ParallelReader:
+    def __init__(self, top, threads):
+        self.top = top
+        self.queues = [deque() for i in range(threads)]
+        self.queues[0].append((top, None, 0))
+        self.outstanding = 1
+        self.partial = {}
+        self.results = {}
+        self.stopped = False
+        self.cond = threading.Condition()
+        self.threads = []
+        for i in range(threads):
+            t = threading.Thread(target=self.run, args=(i,))
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+
+    def next_job(self, i):
+        if self.queues[i]:
+            return self.queues[i].pop()
+        for j in range(1, len(self.queues)):
+            queue = self.queues[(i + j) % len(self.queues)]
+            if queue:
+                return queue.popleft()
+        return None
+
+    def run(self, i):
+        while True:
+            with self.cond:
+                job = self.next_job(i)
+                while job is None:
+                    if self.stopped or not self.outstanding:
+                        return
+                    self.cond.wait()
+                    job = self.next_job(i)
+                if self.stopped:
+                    return
+            dirpath, entries, batch = job
+            try:
+                if entries is None:
+                    self.list(i, dirpath)
+                else:
+                    self.done(dirpath, batch, lstat_entries(dirpath, entries))
+            except Exception as e:
+                with self.cond:
+                    self.results[dirpath] = e
+                    self.outstanding -= 1
+                    self.cond.notify_all()
+
+    # the subdirectories and all batches but the first are queued before
+    # anything is lstat'ed, so that other threads can start on them
+    def list(self, i, dirpath):
+        listing = list_dir(dirpath)
+        if listing is None:
+            with self.cond:
+                self.results[dirpath] = None
+                self.outstanding -= 1
+                self.cond.notify_all()
+            return
+        objects, subdirs = listing
+        batches = [objects[b:b + stat_batch] for b in range(0, len(objects), stat_batch)] or [[]]
+        # lstat of the directory, lstat'ed batches, subdirectories and the
+        # number of batches still to do
+        partial = [None, [None] * len(batches), subdirs, len(batches)]
+        with self.cond:
+            self.partial[dirpath] = partial
+            self.queues[i].extend((path, None, 0) for path in reversed(subdirs))
+            self.queues[i].extend((dirpath, batches[b], b) for b in range(len(batches) - 1, 0, -1))
+            self.outstanding += len(subdirs) + len(batches) - 1
+            self.cond.notify_all()
+        if dirpath != self.top:
+            partial[0] = lstat_dir(dirpath)
+        self.done(dirpath, 0, lstat_entries(dirpath, batches[0]))
+
+    def done(self, dirpath, batch, objects):
+        with self.cond:
+            partial = self.partial[dirpath]
+            partial[1][batch] = objects
+            partial[3] -= 1
+            if not partial[3]:
+                del self.partial[dirpath]
+                self.results[dirpath] = (partial[0], [o for b in partial[1] for o in b], partial[2])
+            self.outstanding -= 1
+            self.cond.notify_all()
+
+    def read(self, dirpath):
+        with self.cond:
+            while dirpath not in self.results:
+                self.cond.wait()
+            listing = self.results.pop(dirpath)
+        if isinstance(listing, Exception):
+            raise listing
+        return listing
+
+    def close(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        for t in self.threads:
+            t.join()
+
+
+# Reads a directory in the calling thread, see ParallelReader.read()
+def read_dir(dirpath, top):
+    listing = list_dir(dirpath)
+    if listing is None:
+        return None
+    objects, subdirs = listing
+    st = lstat_dir(dirpath) if dirpath != top else None
+    return st, lstat_entries(dirpath, objects), subdirs
+
+
+# Yields (path, lstat) for every object below top in the order os.walk
+# lists them: a directory, then its other entries, then its subdirectories.
+# Like os.walk, directories that can not be listed are skipped and
+# symlinks to directories are neither listed nor followed. With more than
+# one thread the directories are read ahead by a ParallelReader, the order
+# of the results stays the same.
+def walk(top, threads=1):
+    top = top.rstrip("/")
+    reader = ParallelReader(top, threads) if threads > 1 else None
+    try:
+        pending = [top]
+        while pending:
+            dirpath = pending.pop()
+            listing = reader.read(dirpath) if reader else read_dir(dirpath, top)
+            if listing is None:
+                continue
+            st, objects, subdirs = listing
+            if st is not None:
+                yield dirpath, st
+            for path_st in objects:
+                yield path_st
+            pending.extend(reversed(subdirs))
+    finally:
+        if reader:
+            reader.close()
+
+# lstat fields kept for every entry
+columns = ('st_dev', 'st_ino', 'st_mode', 'st_nlink', 'st_uid', 'st_gid', 'st_size', 'st_mtime')
+# unsigned 64-bit where the array module supports it
+try:
+    wide_typecode = 'Q'
+    array(wide_typecode)
+except ValueError:
+    wide_typecode = 'L'
+inventory_version = 1
+kinds = {
+    stat.S_IFREG: "file",
+    stat.S_IFDIR: "dir",
+    stat.S_IFLNK: "symlink",
+    stat.S_IFCHR: "chardev",
+    stat.S_IFBLK: "blockdev",
+    stat.S_IFIFO: "fifo",
+    stat.S_IFSOCK: "socket",
+}
+
+fsencode = getattr(os, 'fsencode', lambda f: f)
+fsdecode = getattr(os, 'fsdecode', lambda f: f)
+
+
+def typecode(column):
+    return 'd' if column == 'st_mtime' else wide_typecode
+
+
+# 'Q' and 'L' store the same thing where both are 64-bit, so saved
+# inventories are checked against the kind and size of the columns
+def column_formats():
+    return [[c, 'float' if c == 'st_mtime' else 'unsigned', array(typecode(c)).itemsize] for c in columns]
+
+
+# tostring and fromstring were renamed in Python 3
+def array_bytes(values):
+    return getattr(values, 'tobytes', getattr(values, 'tostring', None))()
+
+
+def array_from_bytes(code, data):
+    values = array(code)
+    getattr(values, 'frombytes', getattr(values, 'fromstring', None))(data)
+    return values
+
+
+nul_re = re.compile(b"\0")
+
+
+# The relative paths of the objects, NUL separated in a single buffer that
+# starts with a NUL, and the offset of every path in it. A list would cost
+# a Python object per object of the rootfs.
+class ISA_names:
+    def __init__(self):
+        self.data = bytearray(b"\0")
+        self.offsets = array(wide_typecode)
+
+    def append(self, name):
+        self.offsets.append(len(self.data))
+        self.data += fsencode(name) + b"\0"
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self.offsets)
+        start = self.offsets[i]
+        end = self.offsets[i + 1] if i + 1 < len(self.offsets) else len(self.data)
+        return fsdecode(bytes(self.data[start:end - 1]))
+
+    def __iter__(self):
+        for i in range(len(self.offsets)):
+            yield self[i]
+
+    # the index of name, None if it is not listed
+    def find(self, name):
+        pos = self.data.find(b"\0" + fsencode(name) + b"\0")
+        if pos < 0:
+            return None
+        return bisect.bisect_left(self.offsets, pos + 1)
+
+    # the paths as saved by ISA_inventory.write_to()
+    def to_bytes(self):
+        return bytes(self.data[1:-1])
+
+    @classmethod
+    def from_bytes(cls, data, count):
+        names = cls()
+        if count:
+            names.data = bytearray(b"\0" + data + b"\0")
+            ends = nul_re.finditer(names.data, 0, len(names.data) - 1)
+            names.offsets = array(wide_typecode, (m.end() for m in ends))
+        return names
+
+
+# one object of the rootfs, with the lstat fields as st_* attributes
+class ISA_fsentry:
+    __slots__ = ('path', 'name', 'target') + columns
+
+    # path is the absolute path, name the path relative to the rootfs
+    # and target the symlink target, None for other objects
+    def __init__(self, path, name, target, values):
+        self.path = path
+        self.name = name
+        self.target = target
+        for column, value in zip(columns, values):
+            setattr(self, column, value)
+
+    @property
+    def kind(self):
+        return kinds.get(stat.S_IFMT(self.st_mode), "unknown")
+
+
+class ISA_inventory:
+    # Every object below the rootfs, in walk() order, kept in columns: the
+    # relative paths as ISA_names, one array per lstat field and the
+    # targets of the symlinks. The rootfs is walked on first use, so an inventory no plugin
+    # asks for costs nothing.
+    archive = False
+
+    def __init__(self, path_to_fs, threads=1, pseudo_db=""):
+        self.path_to_fs = path_to_fs.rstrip("/")
+        self.threads = threads
+        self.pseudo_db = pseudo_db
+        self.names = None
+        self.columns = None
+        self.targets = None
+
+    def build(self):
+        if self.names is not None:
+            return
+        if self.pseudo_db:
+            try:
+                self.build_native()
+                self.apply_pseudo_db(self.pseudo_db)
+                return
+            except (EnvironmentError, ValueError, sqlite3.Error):
+                print("Not able to use the pseudo database, walking the filesystem instead: ", sys.exc_info())
+                self.names = None
+        self.walk_fs()
+
+    def walk_fs(self):
+        names = ISA_names()
+        values = [array(typecode(c)) for c in columns]
+        targets = {}
+        prefix = len(self.path_to_fs)
+        for path, st in walk(self.path_to_fs, self.threads):
+            if stat.S_ISLNK(st.st_mode):
+                try:
+                    targets[len(names)] = os.readlink(path)
+                except OSError:
+                    pass
+            names.append(path[prefix:])
+            for column, value in zip(columns, values):
+                value.append(getattr(st, column))
+        self.names = names
+        self.columns = values
+        self.targets = targets
+
+    # Under pseudo every lstat is a round trip to the pseudo server, so the
+    # rootfs is walked by a child with pseudo disabled, which sends the
+    # inventory back through a pipe
+    def build_native(self):
+        if not under_pseudo():
+            self.walk_fs()
+            return
+        env = dict(os.environ, PSEUDO_DISABLED="1")
+        child = subprocess.Popen([sys.executable, "-c", native_walker,
+                                  os.path.dirname(os.path.abspath(__file__)),
+                                  self.path_to_fs, str(self.threads)],
+                                 stdout=subprocess.PIPE, env=env)
+        try:
+            inventory = self.read_from(child.stdout)
+        finally:
+            child.stdout.close()
+            if child.wait() != 0:
+                raise OSError("Not able to walk " + self.path_to_fs + " without pseudo")
+        self.names = inventory.names
+        self.columns = inventory.columns
+        self.targets = inventory.targets
+
+    # Overlays the ownership and permissions pseudo recorded for the rootfs
+    # on the native lstat fields, which still give the type and size. A
+    # record applies to the entry at its path if that still has the inode
+    # pseudo recorded, and then to the other hardlinks of that inode; the
+    # record of a path deleted behind the back of pseudo does not apply to
+    # a file that reuses its inode. Entries pseudo does not know or knows
+    # with another type keep the native values.
+    def apply_pseudo_db(self, db_path):
+        records = read_pseudo_db(db_path, self.path_to_fs)
+        st_dev, st_ino, st_mode, st_uid, st_gid = [self.columns[columns.index(c)] for c in
+                                                   ('st_dev', 'st_ino', 'st_mode', 'st_uid', 'st_gid')]
+        inodes = {}
+        for i, name in enumerate(self.names):
+            record = records.get(self.path_to_fs + name)
+            if record is not None and record[:2] == (st_dev[i], st_ino[i]):
+                inodes[record[:2]] = record[2:]
+        for i in range(len(self.names)):
+            values = inodes.get((st_dev[i], st_ino[i]))
+            if values is None or stat.S_IFMT(values[2]) != stat.S_IFMT(st_mode[i]):
+                continue
+            st_uid[i], st_gid[i], st_mode[i] = values
+
+    def built(self):
+        return self.names is not None
+
+    # the array of the values of one of the lstat fields in columns
+    def column(self, name):
+        self.build()
+        return self.columns[columns.index(name)]
+
+    def __len__(self):
+        self.build()
+        return len(self.names)
+
+    def __iter__(self):
+        self.build()
+        for i in range(len(self.names)):
+            yield self.entry(i)
+
+    # Python 2 reads 'Q' and 'L' arrays back as longs, which oct() and
+    # str() print with a trailing L
+    def entry(self, i):
+        name = self.names[i]
+        return ISA_fsentry(self.path_to_fs + name, name, self.targets.get(i),
+                           [value[i] if column == 'st_mtime' else int(value[i])
+                            for column, value in zip(columns, self.columns)])
+
+    # The inventory is saved as a JSON header line followed by the raw
+    # columns: the lstat arrays, the NUL separated relative paths, the
+    # indexes of the symlinks and their NUL separated targets.
+    def save(self, file_name):
+        tmp_name = file_name + ".tmp"
+        with open(tmp_name, 'wb') as f:
+            self.write_to(f)
+        os.rename(tmp_name, file_name)
+
+    def write_to(self, f):
+        self.build()
+        links = array(wide_typecode, sorted(self.targets))
+        blobs = [array_bytes(value) for value in self.columns]
+        blobs.append(self.names.to_bytes())
+        blobs.append(array_bytes(links))
+        blobs.append(b"\0".join(fsencode(self.targets[i]) for i in links))
+        header = {
+            "version": inventory_version,
+            "path_to_fs": self.path_to_fs,
+            "count": len(self.names),
+            "columns": column_formats(),
+            "sizes": [len(blob) for blob in blobs],
+        }
+        f.write(json.dumps(header).encode('utf-8') + b"\n")
+        for blob in blobs:
+            f.write(blob)
+
+    # reads an inventory written by save(), raises ValueError if the file is
+    # not usable on this host
+    @classmethod
+    def load(cls, file_name):
+        with open(file_name, 'rb') as f:
+            return cls.read_from(f)
+
+    @classmethod
+    def read_from(cls, f):
+        header = json.loads(f.readline().decode('utf-8') or "{}")
+        if header.get("version") != inventory_version:
+            raise ValueError("Unsupported inventory version")
+        if header["columns"] != column_formats():
+            raise ValueError("Inventory columns do not match")
+        blobs = [f.read(size) for size in header["sizes"]]
+        path_to_fs = header["path_to_fs"]
+        # Python 2 reads JSON strings as unicode, the names are byte strings
+        if not isinstance(path_to_fs, str):
+            path_to_fs = path_to_fs.encode('utf-8')
+        inventory = cls(path_to_fs)
+        values = [array_from_bytes(typecode(column), blob) for column, blob in zip(columns, blobs)]
+        names = ISA_names.from_bytes(blobs[len(columns)], header["count"])
+        links = array_from_bytes(wide_typecode, blobs[len(columns) + 1])
+        link_targets = blobs[len(columns) + 2].split(b"\0") if len(links) else []
+        if len(names) != header["count"] or len(link_targets) != len(links):
+            raise ValueError("Truncated inventory")
+        inventory.names = names
+        inventory.columns = values
+        inventory.targets = dict(zip(links, (fsdecode(t) for t in link_targets)))
+        return inventory
+
+
+# run by ISA_inventory.build_native() with the directory of this module,
+# the rootfs and the number of threads as arguments
+native_walker = """
+import sys
+sys.path.insert(0, sys.argv[1])
+from inventory import ISA_inventory
+inventory = ISA_inventory(sys.argv[2], int(sys.argv[3]))
+inventory.write_to(getattr(sys.stdout, 'buffer', sys.stdout))
+"""
+
+
+def under_pseudo():
+    return "libpseudo" in os.environ.get("LD_PRELOAD", "") and os.environ.get("PSEUDO_DISABLED", "0") == "0"
+
+
+# The files database of pseudo, the fakeroot of the build system, keeps
+# the ownership and mode of every object created under it. The records of
+# path_to_fs and everything below it are read in one query and returned as
+# {path: (dev, ino, uid, gid, mode)}.
+def read_pseudo_db(db_path, path_to_fs):
+    if not os.path.isfile(db_path):
+        raise OSError(errno.ENOENT, "No pseudo database", db_path)
+    db = sqlite3.connect(db_path)
+    try:
+        query = "SELECT path, dev, ino, uid, gid, mode FROM files WHERE (path = ? OR (path >= ? AND path < ?))"
+        if "deleting" in [column[1] for column in db.execute("PRAGMA table_info(files)")]:
+            query += " AND deleting = 0"
+        # the paths are stored as they were given to the file system calls
+        db.text_factory = bytes
+        records = {}
+        # "0" is the character following "/", so the range is everything
+        # below path_to_fs
+        for path, dev, ino, uid, gid, mode in db.execute(query, (path_to_fs, path_to_fs + "/", path_to_fs + "0")):
+            records[fsdecode(path)] = (dev, ino, uid, gid, mode)
+        return records
+    finally:
+        db.close()
+
+
+# the relative path of a tar member, "" for the root and None for names
+# that would end up outside of the rootfs
+def member_name(name):
+    parts = [p for p in name.split("/") if p and p != "."]
+    if ".." in parts:
+        return None
+    return "/" + "/".join(parts) if parts else ""
+
+
+def member_type(member):
+    if member.isreg():
+        return stat.S_IFREG
+    if member.isdir():
+        return stat.S_IFDIR
+    if member.issym():
+        return stat.S_IFLNK
+    if member.ischr():
+        return stat.S_IFCHR
+    if member.isblk():
+        return stat.S_IFBLK
+    if member.isfifo():
+        return stat.S_IFIFO
+    return None
+
+
+# resolves the symlinks of a path relative to the rootfs, links maps the
+# relative paths of the symlinks to their targets
+def resolve_links(name, links, max_links=40):
+    pending = [p for p in name.split('/') if p]
+    pending.reverse()
+    resolved = ""
+    count = 0
+    while pending:
+        part = pending.pop()
+        if part == '.':
+            continue
+        if part == '..':
+            resolved = resolved.rsplit('/', 1)[0]
+            continue
+        candidate = resolved + '/' + part
+        if candidate in links:
+            count += 1
+            if count > max_links:
+                raise OSError(errno.ELOOP, "Too many levels of symbolic links", name)
+            target = links[candidate]
+            if target.startswith('/'):
+                resolved = ""
+            parts = [p for p in target.split('/') if p]
+            parts.reverse()
+            pending.extend(parts)
+        else:
+            resolved = candidate
+    return resolved
+
+
+class ISA_tar_inventory(ISA_inventory):
+    # Inventory of a rootfs tarball, compressed or not, read in a single
+    # sequential pass without extracting anything. The objects are listed in
+    # the order walk() would list the extracted rootfs in, directories
+    # missing from the tarball are added and hardlinks share the inode of
+    # their target. Of the files starting with one of content_magics, the
+    # ELF files for the compile flag analysis, only the position of their
+    # member is kept; read_contents() reads them in a second pass, seeking
+    # to their data in uncompressed tarballs.
+    archive = True
+    content_magics = (b'\x7fELF',)
+    compression_magics = (b'\x1f\x8b', b'BZh', b'\xfd7zXZ\x00')
+
+    def __init__(self, path_to_tar):
+        ISA_inventory.__init__(self, path_to_tar)
+        self.links = None
+        self.contents = None
+
+    def build(self):
+        if self.names is not None:
+            return
+        values = {"": None}
+        children = {"": []}
+        links = {}
+        contents = {}
+        magic_size = max(len(m) for m in self.content_magics)
+        with open(self.path_to_fs, 'rb') as f:
+            seekable = not f.read(8).startswith(self.compression_magics)
+        with tarfile.open(self.path_to_fs, 'r|*') as tar:
+            for position, member in enumerate(tar):
+                # tarfile would otherwise keep every member it has read
+                tar.members = []
+                name = member_name(member.name)
+                kind = member_type(member)
+                if not name or (kind is None and not member.islnk()):
+                    continue
+                content = None
+                if member.islnk():
+                    target = member_name(member.linkname)
+                    if not values.get(target):
+                        continue
+                    entry = values[target]
+                    content = contents.get(target)
+                else:
+                    size = member.size if kind == stat.S_IFREG else 0
+                    if kind == stat.S_IFLNK:
+                        size = len(fsencode(member.linkname))
+                    entry = [0, len(values), kind | member.mode, 1, member.uid, member.gid, size,
+                             float(member.mtime)]
+                    if kind == stat.S_IFREG:
+                        f = tar.extractfile(member)
+                        header = f.read(magic_size)
+                        if not header.startswith(self.content_magics):
+                            pass
+                        elif seekable and not member.issparse():
+                            content = (position, member.offset_data, member.size)
+                        else:
+                            content = (position, None, None)
+                self.add_parents(name, values, children)
+                if name not in values:
+                    children[name.rsplit("/", 1)[0]].append(name)
+                values[name] = entry
+                if stat.S_ISDIR(entry[2]):
+                    children.setdefault(name, [])
+                if not stat.S_ISLNK(entry[2]):
+                    links.pop(name, None)
+                elif member.islnk():
+                    links[name] = links[target]
+                else:
+                    links[name] = member.linkname
+                if content is not None:
+                    contents[name] = content
+                else:
+                    contents.pop(name, None)
+        self.links = links
+        self.contents = contents
+        self.order(values, children)
+
+    def add_parents(self, name, values, children):
+        missing = []
+        parent = name.rsplit("/", 1)[0]
+        while parent not in values:
+            missing.append(parent)
+            parent = parent.rsplit("/", 1)[0]
+        for parent in reversed(missing):
+            values[parent] = [0, len(values), stat.S_IFDIR | 0o755, 1, 0, 0, 0, 0.0]
+            children[parent] = []
+            children[parent.rsplit("/", 1)[0]].append(parent)
+
+    # lays the objects out in walk() order; like there, symlinks to
+    # directories are left out
+    def order(self, values, children):
+        names = ISA_names()
+        columns_values = [array(typecode(c)) for c in columns]
+        targets = {}
+        pending = [""]
+        while pending:
+            dirpath = pending.pop()
+            subdirs = []
+            for name in [dirpath] + children[dirpath] if dirpath else children[dirpath]:
+                entry = values[name]
+                if name != dirpath and stat.S_ISDIR(entry[2]):
+                    subdirs.append(name)
+                    continue
+                if name in self.links:
+                    target = values.get(resolve_links(name, self.links))
+                    if target and stat.S_ISDIR(target[2]):
+                        continue
+                    targets[len(names)] = self.links[name]
+                names.append(name)
+                for value, column in zip(entry, columns_values):
+                    column.append(value)
+            subdirs.reverse()
+            pending.extend(subdirs)
+        self.names = names
+        self.columns = columns_values
+        self.targets = targets
+
+    # returns the relative path a path resolves to and its entry, the
+    # equivalent of os.path.realpath() and os.stat()
+    def resolve(self, name):
+        self.build()
+        resolved = resolve_links(name, self.links)
+        i = self.names.find(resolved)
+        if i is None:
+            raise OSError(errno.ENOENT, "No such file or directory", name)
+        return resolved, self.entry(i)
+
+    # the position in the tarball of the member holding the content of a
+    # regular file, None unless the content is kept
+    def content_position(self, name):
+        self.build()
+        content = self.contents.get(name)
+        return content[0] if content else None
+
+    # Yields (name, size, f) for the names whose content is kept, in the
+    # order of content_position(), f being positioned at the start of the
+    # size bytes of content, to be read before the next name is asked for.
+    # Hardlinks share the content of a member, which is given once, under
+    # the first of their names. Compressed tarballs are read again in a
+    # single sequential pass.
+    def read_contents(self, names):
+        self.build()
+        wanted = {}
+        for name in sorted(set(names)):
+            if name in self.contents:
+                wanted.setdefault(self.contents[name], name)
+        if all(offset is not None for position, offset, size in wanted):
+            with open(self.path_to_fs, 'rb') as f:
+                for (position, offset, size), name in sorted(wanted.items()):
+                    f.seek(offset)
+                    yield name, size, f
+            return
+        by_position = dict((content[0], name) for content, name in wanted.items())
+        with tarfile.open(self.path_to_fs, 'r|*') as tar:
+            for position, member in enumerate(tar):
+                tar.members = []
+                if position in by_position:
+                    yield by_position.pop(position), member.size, tar.extractfile(member)
+                    if not by_position:
+                        break
+
+    # the content of a regular file, None unless it is kept
+    def read(self, name):
+        for name, size, f in self.read_contents([name]):
+            return f.read(size)
+        return None
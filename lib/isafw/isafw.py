@@ -27,9 +27,13 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 
+import atexit
+import fcntl
 import os
 import sys
 import isaplugins
+from inventory import ISA_inventory, ISA_tar_inventory
+from findings import ISA_findings
 
 
 __all__ = [
@@ -37,9 +41,118 @@ __all__ = [
     'ISA_pkg_list',
     'ISA_kernel',
     'ISA_filesystem',
+    'ISA_log',
+    'ISA_findings',
     'ISA',
     ]
 
+# logging for ISA plugins
+
+# levels from the most to the least important one
+log_levels = ["error", "warning", "info", "debug"]
+# records are buffered up to this many bytes before they are written
+log_buffer_size = 65536
+encoding_errors = 'surrogateescape' if sys.version_info[0] >= 3 else 'strict'
+
+
+class ISA_log:
+    # Buffered log file of a plugin, opened once per process. Records are
+    # only written as whole lines by a single write() under a lock of the
+    # file, so the logs of several bitbake workers sharing the logdir do not
+    # mix within a line. Processes forked from the one that opened the log,
+    # like the CFA workers, write their records straight away.
+    logs = {}
+
+    def __init__(self, file_name, level, list_limit):
+        self.file_name = file_name
+        self.fd = os.open(file_name, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self.configure(level, list_limit)
+        self.pid = os.getpid()
+        self.buffer = []
+        self.size = 0
+
+    # returns the log of file_name, which a plugin normally truncates when it
+    # is initialized
+    @classmethod
+    def open(cls, file_name, level="info", list_limit=20, truncate=False):
+        log = cls.logs.get(file_name)
+        if log is None:
+            log = cls.logs[file_name] = cls(file_name, level, list_limit)
+        else:
+            log.configure(level, list_limit)
+        if truncate:
+            log.buffer = []
+            log.size = 0
+            os.ftruncate(log.fd, 0)
+        return log
+
+    @classmethod
+    def flush_all(cls):
+        for log in cls.logs.values():
+            log.flush()
+
+    def configure(self, level, list_limit):
+        self.level = log_levels.index(level) if level in log_levels else log_levels.index("info")
+        self.list_limit = int(list_limit)
+
+    def enabled(self, level):
+        return log_levels.index(level) <= self.level
+
+    def write(self, level, message):
+        if not self.enabled(level):
+            return
+        if level != "info":
+            message = level.upper() + ": " + message
+        if not isinstance(message, bytes):
+            message = message.encode('utf-8', encoding_errors)
+        self.buffer.append(message + b"\n")
+        self.size += len(message) + 1
+        if self.pid != os.getpid():
+            # the buffer of the parent is its own to write
+            self.buffer = self.buffer[-1:]
+            self.flush()
+        elif self.size >= log_buffer_size:
+            self.flush()
+
+    def error(self, message):
+        self.write("error", message)
+
+    def warning(self, message):
+        self.write("warning", message)
+
+    def info(self, message):
+        self.write("info", message)
+
+    def debug(self, message):
+        self.write("debug", message)
+
+    # Bulk lists only get their length logged, their first list_limit items
+    # are added at the debug level
+    def list(self, title, items):
+        items = list(items)
+        self.info(title + ": " + str(len(items)) + " items")
+        if self.enabled("debug"):
+            for item in items[:self.list_limit]:
+                self.debug("    " + str(item))
+            if len(items) > self.list_limit:
+                self.debug("    ... " + str(len(items) - self.list_limit) + " more")
+
+    def flush(self):
+        if not self.buffer:
+            return
+        data = b"".join(self.buffer)
+        self.buffer = []
+        self.size = 0
+        fcntl.lockf(self.fd, fcntl.LOCK_EX)
+        try:
+            while data:
+                data = data[os.write(self.fd, data):]
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN)
+
+
+atexit.register(ISA_log.flush_all)
+
 # classes for representing objects for ISA plugins
 
 # source package
@@ -47,6 +160,7 @@ class ISA_package:
     name = ""                     # pkg name                            (mandatory argument)
     version = ""                  # full version                        (mandatory argument)
     licenses = []                 # list of licences for all subpackages
+    license_expression = ""       # licenses combined with "&" and "|", checked instead of licenses if set
     aliases = []                  # list of alias names for packages if exist
     source_files = []             # list of strings of source files 
     patch_files = []              # list of patch files to be applied
@@ -65,8 +179,11 @@ class ISA_kernel:
 # filesystem
 class ISA_filesystem:
     img_name = ""                 # image name                          (mandatory argument)
-    type = ""                     # filesystem type
+    type = ""                     # filesystem type: "dir" (default) or "tar" for a rootfs tarball
     path_to_fs = ""               # path to the fs location             (mandatory argument)
+    path_to_inventory = ""        # saved inventory of the fs to use instead of walking it
+    path_to_pseudo_db = ""        # pseudo files database with the ownership and modes of the fs
+    inventory = None              # ISA_inventory of the fs, provided to the plugins by ISA
 
 # configuration of ISAFW
 # if both whitelist and blacklist is empty, all avaliable plugins will be used
@@ -79,6 +196,34 @@ class ISA_config:
     reportdir = ""                # location of produced reports
     logdir = ""                   # location of produced logs
     timestamp = ""                # timestamp of the build provided by build system
+    cfa_jobs = 1                  # number of parallel jobs for compile flag analysis
+    cfa_timeout = 300             # seconds the analysis of a single binary may take, 0 disables the deadline
+    cfa_memory_limit = 2048       # MiB of address space the analysis of a binary may add, 0 disables the limit
+    cfa_backend = "elf"           # compile flag analysis backend: "elf" (in-process) or "tools" (external tools)
+    cachedir = ""                 # location of persistent caches, caching is disabled if empty
+    cfa_cache_size = 100000       # maximum number of cached compile flag analysis results
+    walk_threads = 1              # number of threads listing the analysed fs
+    fsa_rules = ""                # rules file of additional filesystem checks, the default one if empty
+    save_inventory = False        # save the inventory of every analysed fs in logdir
+    snapshotdir = ""              # location of snapshots of previous runs, delta reports are disabled if empty
+    loglevel = "info"             # least important level logged: "error", "warning", "info" or "debug"
+    log_list_limit = 20           # items of a bulk list logged at the "debug" level
+    la_first_spec = False         # use the licenses of the first spec file found in the sources only
+    la_license_dir = ""           # license texts the license detection index is built from
+    la_match_threshold = 0.8      # share of a license text a file must contain to be detected as that license
+    la_cache_size = 100000        # maximum number of cached spec file licenses
+    cve_feed_dir = ""             # NVD JSON feeds CVEs are matched against instead of running cve-check-tool
+    findings_db = ""              # findings database shared by builds, findings.db in reportdir if empty
+    findings_keep = 10            # builds kept in the findings database, 0 keeps all of them
+
+    # returns the ISA_log of a plugin, log_name being its file in logdir
+    def open_log(self, log_name, truncate=False):
+        return ISA_log.open(self.logdir + log_name, self.loglevel, self.log_list_limit, truncate)
+
+    # returns the ISA_findings store of this build
+    def open_findings(self):
+        return ISA_findings.open(self.findings_db or self.reportdir + "/findings.db", self.timestamp,
+                                 int(self.findings_keep))
 
 
 class ISA:
@@ -103,6 +248,8 @@ class ISA:
                     register_plugin(ISA_config)
                 except:
                     print("Exception in plugin init: ", sys.exc_info())
+        ISA_findings.commit_all()
+        ISA_log.flush_all()
 
     def process_package(self, ISA_package):
         for name in isaplugins.__all__:
@@ -122,6 +269,8 @@ class ISA:
                     process_package(ISA_package)
                 except:
                     print("Exception in plugin: ", sys.exc_info())
+        ISA_findings.commit_all()
+        ISA_log.flush_all()
 
     def process_pkg_list(self, ISA_pkg_list):
         for name in isaplugins.__all__:
@@ -141,6 +290,8 @@ class ISA:
                     process_pkg_list(ISA_pkg_list)
                 except:
                     print("Exception in plugin: ", sys.exc_info())
+        ISA_findings.commit_all()
+        ISA_log.flush_all()
 
     def process_kernel(self, ISA_kernel):
         for name in isaplugins.__all__:
@@ -160,8 +311,42 @@ class ISA:
                     process_kernel(ISA_kernel)
                 except:
                     print("Exception in plugin: ", sys.exc_info())
+        ISA_findings.commit_all()
+        ISA_log.flush_all()
+
+    # all plugins share one inventory of the fs, built on first use
+    def get_inventory(self, ISA_filesystem):
+        # saved inventories do not keep the file contents of archives
+        if ISA_filesystem.type == "tar":
+            return ISA_tar_inventory(ISA_filesystem.path_to_fs)
+        if ISA_filesystem.path_to_inventory:
+            try:
+                inventory = ISA_inventory.load(ISA_filesystem.path_to_inventory)
+                # the rootfs may have moved since the inventory was saved
+                if ISA_filesystem.path_to_fs:
+                    inventory.path_to_fs = ISA_filesystem.path_to_fs.rstrip("/")
+                return inventory
+            except (EnvironmentError, ValueError):
+                print("Not able to load the inventory, walking the filesystem instead: ", sys.exc_info())
+        return ISA_inventory(ISA_filesystem.path_to_fs, int(self.ISA_config.walk_threads),
+                             ISA_filesystem.path_to_pseudo_db)
 
     def process_filesystem(self, ISA_filesystem):
+        if ISA_filesystem.type not in ("", "dir", "tar"):
+            print("Unsupported filesystem type: " + ISA_filesystem.type)
+            return
+        ISA_filesystem.inventory = self.get_inventory(ISA_filesystem)
+        try:
+            self.process_filesystem_plugins(ISA_filesystem)
+            if self.ISA_config.save_inventory and ISA_filesystem.inventory.built():
+                try:
+                    ISA_filesystem.inventory.save(self.ISA_config.logdir + "/inventory_" + ISA_filesystem.img_name)
+                except EnvironmentError:
+                    print("Not able to save the inventory: ", sys.exc_info())
+        finally:
+            ISA_filesystem.inventory = None
+
+    def process_filesystem_plugins(self, ISA_filesystem):
         for name in isaplugins.__all__:
             plugin = getattr(isaplugins, name)
             try:
@@ -179,6 +364,8 @@ class ISA:
                     process_filesystem(ISA_filesystem)
                 except:
                     print("Exception in plugin: ", sys.exc_info())
+        ISA_findings.commit_all()
+        ISA_log.flush_all()
 
     def process_report(self):
         for name in isaplugins.__all__:
@@ -198,6 +385,8 @@ class ISA:
                     process_report()
                 except:
                     print("Exception in plugin: ", sys.exc_info())
+        ISA_findings.close_all()
+        ISA_log.flush_all()
 
 
 
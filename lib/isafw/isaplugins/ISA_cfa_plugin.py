@@ -27,209 +27,205 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import errno
 import subprocess
 import os
+import shutil
+import sqlite3
 import stat
-from re import compile
-from re import sub
+import tempfile
+from array import array
 from lxml import etree
+from ._elf import ELFImage, ELFError, NotELFError, is_nodrop_groups, setid_symbols
+from ._filetype import ELF, classify_file
+from ._cache import ResultCache
+from ._tools import ToolResults
+from ._workers import WorkerPool, Aborted, run
+from ._snapshot import Snapshot, stat_signature, write_delta_report
 
 CFChecker = None
 full_report = "/cfa_full_report_"
 problems_report = "/cfa_problems_report_"
+delta_report = "/cfa_delta_report_"
+snapshot_file = "/cfa_snapshot_"
 log = "/isafw_cfalog"
+cache_file = "/cfa_cache.db"
+# bump whenever the analysis results change, invalidates the result cache
+analyzer_version = 1
+# checks in report order: problem name, report title and XML test case name
+checks = [
+    ("no_relo", "Files with no RELO", "files_with_no_RELO"),
+    ("no_canary", "Files with no canary", "files_with_no_canary"),
+    ("no_pie", "Files with no PIE", "files_with_no_PIE"),
+    ("no_nx", "Files with no NX", "files_with_no_NX"),
+    ("execstack", "Files with executable stack enabled", "files_with_execstack"),
+    ("execstack_not_defined", "Files with no ability to fetch executable stack status",
+     "files_with_execstack_not_defined"),
+    ("nodrop_groups", "Files that don't initialize groups while using setuid/setgid", "files_with_nodrop_groups"),
+    ("no_mpx", "Files that don't have MPX protection enabled", "files_with_no_mpx"),
+    ("timed_out", "Files whose analysis failed, timed out or exceeded the memory limit", "files_with_analysis_timed_out"),
+]
+check_bits = dict((c[0], 1 << n) for n, c in enumerate(checks))
+
+try:
+    from sys import intern
+except ImportError:
+    pass
+
+# failed checks of the files of one image: paths relative to the rootfs
+# and a bitmask of failed checks per path, in file list order
+class CFAResults:
+    def __init__(self):
+        self.paths = []
+        self.masks = array('H')
+
+    def add(self, path, problems):
+        mask = 0
+        for p in problems:
+            mask |= check_bits[p]
+        if mask:
+            self.paths.append(intern(path))
+            self.masks.append(mask)
+
+    def failed(self, name):
+        bit = check_bits[name]
+        return [path for path, mask in zip(self.paths, self.masks) if mask & bit]
 
 class ISA_CFChecker():    
     initialized = False
-    no_relo = []
-    no_canary = []
-    no_pie = []
-    no_nx = []
-    execstack = []
-    execstack_not_defined = []
-    nodrop_groups = []
-    no_mpx = []
 
     def __init__(self, ISA_config):
         self.proxy = ISA_config.proxy
         self.reportdir = ISA_config.reportdir
-        self.logdir = ISA_config.logdir
+        self.log = ISA_config.open_log(log, truncate=True)
         self.timestamp = ISA_config.timestamp
-        # check that checksec is installed
-        rc = subprocess.call(["which", "checksec.sh"])
-        if rc == 0:
-            # check that execstack is installed
-            rc = subprocess.call(["which", "execstack"])
-            if rc == 0:
-                # check that execstack is installed
-                rc = subprocess.call(["which", "readelf"])
-                if rc == 0:
-                    self.initialized = True
-                    print("Plugin ISA_CFChecker initialized!")
-                    with open(self.logdir + log, 'w') as flog:
-                        flog.write("\nPlugin ISA_CFChecker initialized!\n")
-                    return
-        print("checksec, execstack or readelf tools are missing!")
-        print("Please install checksec from http://www.trapkit.de/tools/checksec.html")
-        print("Please install execstack from prelink package")
-        with open(self.logdir + log, 'w') as flog:
-            flog.write("checksec, execstack or readelf tools are missing!\n")
-            flog.write("Please install checksec from http://www.trapkit.de/tools/checksec.html\n")
-            flog.write("Please install execstack from prelink package\n")
+        self.jobs = int(ISA_config.cfa_jobs or 1)
+        self.timeout = int(ISA_config.cfa_timeout or 0)
+        self.memory_limit = int(ISA_config.cfa_memory_limit or 0)
+        self.cachedir = ISA_config.cachedir
+        self.cache_size = int(ISA_config.cfa_cache_size)
+        self.cache = None
+        self.snapshotdir = ISA_config.snapshotdir
+        self.results = None
+        self.archive = None
+        # ELF files are parsed in-process by the "elf" backend, the external
+        # tools are then only used as a fallback for files the parser can not
+        # handle; the "tools" backend runs them on all files
+        self.backend = ISA_config.cfa_backend
+        self.tools_available = False
+        self.initialized = True
+        print("Plugin ISA_CFChecker initialized!")
+        self.log.info("Plugin ISA_CFChecker initialized!")
+        # check that checksec, execstack, readelf and objdump are installed
+        for tool in ["checksec.sh", "execstack", "readelf", "objdump"]:
+            if subprocess.call(["which", tool]) != 0:
+                break
+        else:
+            self.tools_available = True
+            return
+        print("checksec, execstack, readelf or objdump tools are missing, no fallback for unparsable ELF files!")
+        self.log.warning("checksec, execstack, readelf or objdump tools are missing, no fallback for unparsable ELF files!")
+        self.log.warning("Please install checksec from http://www.trapkit.de/tools/checksec.html")
+        self.log.warning("Please install execstack from prelink package")
+        if self.backend == "tools":
+            self.backend = "elf"
+            self.log.info("Using the elf backend instead of the tools one")
 
     def process_filesystem(self, ISA_filesystem):
         if (self.initialized == True):
             if (ISA_filesystem.img_name and ISA_filesystem.path_to_fs):
-                with open(self.logdir + log, 'a') as flog:
-                    flog.write("\n\nFilesystem path is: " + ISA_filesystem.path_to_fs)
+                self.log.info("Filesystem path is: " + ISA_filesystem.path_to_fs)
                 with open(self.reportdir + full_report + ISA_filesystem.img_name + "_" + self.timestamp, 'w') as ffull_report:
                     ffull_report.write("Security-relevant flags for executables for image: " + ISA_filesystem.img_name + '\n')
                     ffull_report.write("With rootfs location at " +  ISA_filesystem.path_to_fs + "\n\n")
-                self.files = self.find_files(ISA_filesystem.path_to_fs)
-                with open(self.logdir + log, 'a') as flog:
-                    flog.write("\n\nFile list is: " + str(self.files))
-                self.process_files(ISA_filesystem.img_name, ISA_filesystem.path_to_fs)
+                self.results = CFAResults()
+                # the ELF files of archived rootfs are copied out of the
+                # inventory one at a time for the analysis
+                if ISA_filesystem.inventory.archive:
+                    self.archive = ISA_filesystem.inventory
+                self.process_files(ISA_filesystem.img_name, ISA_filesystem.path_to_fs, ISA_filesystem.inventory)
+                self.archive = None
                 self.write_report(ISA_filesystem)
                 self.write_report_xml(ISA_filesystem)
+                self.results = None
             else:
                 print("Mandatory arguments such as image name and path to the filesystem are not provided!")
                 print("Not performing the call.")
-                with open(self.logdir + log, 'a') as flog:
-                    flog.write("Mandatory arguments such as image name and path to the filesystem are not provided!\n")
-                    flog.write("Not performing the call.\n")
+                self.log.warning("Mandatory arguments such as image name and path to the filesystem are not provided!")
+                self.log.warning("Not performing the call.")
         else:
             print("Plugin hasn't initialized! Not performing the call.")
-            with open(self.logdir + log, 'a') as flog:
-                flog.write("Plugin hasn't initialized! Not performing the call.\n")
+            self.log.warning("Plugin hasn't initialized! Not performing the call.")
 
     def write_report(self, ISA_filesystem):
         with open(self.reportdir + problems_report + ISA_filesystem.img_name + "_" + self.timestamp, 'w') as fproblems_report:
             fproblems_report.write("Report for image: " + ISA_filesystem.img_name + '\n')
             fproblems_report.write("With rootfs location at " + ISA_filesystem.path_to_fs + "\n\n")
-            fproblems_report.write("Files with no RELO:\n")
-            for item in self.no_relo:
-                item = item.replace(ISA_filesystem.path_to_fs, "")
-                fproblems_report.write(item + '\n')
-            fproblems_report.write("\n\nFiles with no canary:\n")
-            for item in self.no_canary:
-                item = item.replace(ISA_filesystem.path_to_fs, "")
-                fproblems_report.write(item + '\n')
-            fproblems_report.write("\n\nFiles with no PIE:\n")
-            for item in self.no_pie:
-                item = item.replace(ISA_filesystem.path_to_fs, "")
-                fproblems_report.write(item + '\n')
-            fproblems_report.write("\n\nFiles with no NX:\n")
-            for item in self.no_nx:
-                item = item.replace(ISA_filesystem.path_to_fs, "")
-                fproblems_report.write(item + '\n')
-            fproblems_report.write("\n\nFiles with executable stack enabled:\n")
-            for item in self.execstack:
-                item = item.replace(ISA_filesystem.path_to_fs, "")
-                fproblems_report.write(item + '\n')
-            fproblems_report.write("\n\nFiles with no ability to fetch executable stack status:\n")
-            for item in self.execstack_not_defined:
-                item = item.replace(ISA_filesystem.path_to_fs, "")
-                fproblems_report.write(item + '\n')
-            fproblems_report.write("\n\nFiles that don't initialize groups while using setuid/setgid:\n")
-            for item in self.nodrop_groups:
-                item = item.replace(ISA_filesystem.path_to_fs, "")
-                fproblems_report.write(item + '\n')
-            fproblems_report.write("\n\nFiles that don't have MPX protection enabled:\n")
-            for item in self.no_mpx:
-                item = item.replace(ISA_filesystem.path_to_fs, "")
-                fproblems_report.write(item + '\n')
+            for n, (name, title, test) in enumerate(checks):
+                if n:
+                    fproblems_report.write("\n\n")
+                fproblems_report.write(title + ":\n")
+                for item in self.results.failed(name):
+                    fproblems_report.write(item + '\n')
 
     def write_report_xml(self, ISA_filesystem):
-        root = etree.Element('testsuite', name='CFA_Plugin', tests='8')
-        tcase1 = etree.SubElement(root, 'testcase', classname='ISA_CFChecker', name='files_with_no_RELO')
-        if self.no_relo:
-            for item in self.no_relo:
-                item = item.replace(ISA_filesystem.path_to_fs, "")
-                etree.SubElement(tcase1, 'failure', message=item, type='violation')
-        tcase2 = etree.SubElement(root, 'testcase', classname='ISA_CFChecker', name='files_with_no_canary')
-        if self.no_canary: 
-            for item in self.no_canary:
-                item = item.replace(ISA_filesystem.path_to_fs, "")
-                etree.SubElement(tcase2, 'failure', message=item, type='violation')
-        tcase3 = etree.SubElement(root, 'testcase', classname='ISA_CFChecker', name='files_with_no_PIE')
-        if self.no_pie: 
-            for item in self.no_pie:
-                item = item.replace(ISA_filesystem.path_to_fs, "")
-                etree.SubElement(tcase3, 'failure', message=item, type='violation')
-        tcase4 = etree.SubElement(root, 'testcase', classname='ISA_CFChecker', name='files_with_no_NX')
-        if self.no_nx: 
-            for item in self.no_nx:
-                item = item.replace(ISA_filesystem.path_to_fs, "")
-                etree.SubElement(tcase4, 'failure', message=item, type='violation')
-        tcase5 = etree.SubElement(root, 'testcase', classname='ISA_CFChecker', name='files_with_execstack')
-        if self.execstack: 
-            for item in self.execstack:
-                item = item.replace(ISA_filesystem.path_to_fs, "")
-                etree.SubElement(tcase5, 'failure', message=item, type='violation')
-        tcase6 = etree.SubElement(root, 'testcase', classname='ISA_CFChecker', name='files_with_execstack_not_defined')
-        if self.execstack_not_defined: 
-            for item in self.execstack_not_defined:
-                item = item.replace(ISA_filesystem.path_to_fs, "")
-                etree.SubElement(tcase6, 'failure', message=item, type='violation')
-        tcase7 = etree.SubElement(root, 'testcase', classname='ISA_CFChecker', name='files_with_nodrop_groups')
-        if self.nodrop_groups: 
-            for item in self.nodrop_groups:
-                item = item.replace(ISA_filesystem.path_to_fs, "")
-                etree.SubElement(tcase7, 'failure', message=item, type='violation')
-        tcase8 = etree.SubElement(root, 'testcase', classname='ISA_CFChecker', name='files_with_no_mpx')
-        if self.no_mpx: 
-            for item in self.no_mpx:
-                item = item.replace(ISA_filesystem.path_to_fs, "")
-                etree.SubElement(tcase8, 'failure', message=item, type='violation')
+        root = etree.Element('testsuite', name='CFA_Plugin', tests=str(len(checks)))
+        for name, title, test in checks:
+            tcase = etree.SubElement(root, 'testcase', classname='ISA_CFChecker', name=test)
+            for item in self.results.failed(name):
+                etree.SubElement(tcase, 'failure', message=item, type='violation')
         tree = etree.ElementTree(root)
         output = self.reportdir + problems_report + ISA_filesystem.img_name + "_" + self.timestamp + '.xml' 
         tree.write(output, encoding= 'UTF-8', pretty_print=True, xml_declaration=True)
 
-    def find_files(self, init_path):
-        list_of_files = []
-        for (dirpath, dirnames, filenames) in os.walk(init_path):
-            for f in filenames:
-                list_of_files.append(str(dirpath+"/"+f)[:])
-        return list_of_files
-
-    def get_execstack(self, file_name):
-        cmd = ['execstack', '-q', file_name]
-        try:
-            result = subprocess.check_output(cmd).decode("utf-8")
-        except:
-            return "Not able to fetch execstack status"
+    def get_execstack(self, file_name, problems, elf=None, tools=None):
+        if elf:
+            try:
+                result = elf.get_execstack()
+            except ELFError:
+                return "Not able to fetch execstack status"
         else:
-            if result.startswith("X "):
-                self.execstack.append(file_name[:])
-            if result.startswith("? "):
-                self.execstack_not_defined.append(file_name[:])             
-            return result
+            result = tools.execstack.get(file_name)
+            if result is None:
+                return "Not able to fetch execstack status"
+        if result == "X":
+            problems.append("execstack")
+        if result == "?":
+            problems.append("execstack_not_defined")
+        return result
 
-    def get_nodrop_groups(self, file_name):
-        cmd = ['readelf', '-s', file_name]
-        try:
-            result = subprocess.check_output(cmd).decode("utf-8")
-        except:
-            return "Not able to fetch nodrop groups status"
+    def get_nodrop_groups(self, file_name, problems, elf=None, tools=None):
+        if elf:
+            try:
+                symbols = elf.get_setid_symbols()
+            except ELFError:
+                return "Not able to fetch nodrop groups status"
         else:
-            if ("setgid@GLIBC" in result) or ("setegid@GLIBC" in result) or ("setresgid@GLIBC" in result):
-                if ("setuid@GLIBC" in result) or ("seteuid@GLIBC" in result) or ("setresuid@GLIBC" in result):
-                    if ("setgroups@GLIBC" not in result) and ("initgroups@GLIBC" not in result):
-                        self.nodrop_groups.append(file_name[:])       
-            return result
+            symbols = tools.symbols.get(file_name)
+            if symbols is None:
+                return "Not able to fetch nodrop groups status"
+            symbols = setid_symbols(symbols)
+        result = ' '.join(s.decode("utf-8", "replace") for s in symbols)
+        if is_nodrop_groups(symbols):
+            problems.append("nodrop_groups")
+        return result
 
-    def get_mpx(self, file_name):
-        cmd = ['objdump', '-d', file_name]
-        try:
-            result = subprocess.check_output(cmd).decode("utf-8")
-        except:
-            return "Not able to fetch mpx status"
+    def get_mpx(self, file_name, problems, elf=None, tools=None):
+        if elf:
+            try:
+                mpx = elf.has_mpx()
+            except ELFError:
+                return "Not able to fetch mpx status"
         else:
-            if ("bndcu" not in result) and ("bndcl" not in result) and ("bndmov" not in result):
-                self.no_mpx.append(file_name[:])       
-            return result
+            mpx = tools.mpx.get(file_name)
+            if mpx is None:
+                return "Not able to fetch mpx status"
+        if not mpx:
+            problems.append("no_mpx")
+            return "No MPX instructions found"
+        return "MPX instructions found"
 
-    def get_security_flags(self, file_name):
+    def get_security_flags(self, file_name, problems, elf=None, tools=None):
         SF = {
 	        'No RELRO'        : 0,
 	        'Full RELRO'      : 2,
@@ -247,87 +243,287 @@ class ISA_CFChecker():
 	        'RUNPATH'         : 0,
 	        'No RUNPATH'      : 1
         }
-        cmd = ['checksec.sh', '--file', file_name]
-        try:
-            result = subprocess.check_output(cmd).decode("utf-8").split('\n')[1]
-        except:
-            return "Not able to fetch flags"
+        if elf:
+            try:
+                text2 = elf.get_security_flags()
+            except ELFError:
+                return "Not able to fetch flags"
+        else:
+            text2 = tools.flags.get(file_name)
+            if text2 is None:
+                return "Not able to fetch flags"
+        text = []
+        for t2 in text2:
+            if t2 == "No RELRO":
+                problems.append("no_relo")
+            elif t2 == "No canary found" :
+                problems.append("no_canary")
+            elif t2 == "No PIE" :
+                problems.append("no_pie")
+            elif t2 == "NX disabled" :
+                problems.append("no_nx")
+            text.append((t2, SF[t2]))
+        return text
+
+    # returns None if the file has to be analysed by the external tools,
+    # which are run in batches by analyse_with_tools()
+    def analyse_elf(self, file_name, tools=None):
+        problems = []
+        elf = None
+        if not tools:
+            if self.backend == "tools":
+                return None
+            try:
+                elf = ELFImage(file_name)
+            except NotELFError:
+                pass
+            except (ELFError, EnvironmentError) as e:
+                self.log.warning("Not able to parse " + file_name + ": " + str(e))
+                if self.tools_available:
+                    return None
+        if elf or tools:
+            try:
+                sec_field = self.get_security_flags(file_name, problems, elf, tools)
+                execstack = self.get_execstack(file_name, problems, elf, tools)
+                nodrop_groups = self.get_nodrop_groups(file_name, problems, elf, tools)
+                no_mpx = self.get_mpx(file_name, problems, elf, tools)
+            finally:
+                if elf:
+                    elf.close()
         else:
-            ansi_escape = compile(r'\x1b[^m]*m')
-            text = ansi_escape.sub('', result)
-            text2 = sub(r'\ \ \ *', ',', text).split(',')[:-1]
-            text = []
-            for t2 in text2:
-                if t2 == "No RELRO":
-                    self.no_relo.append(file_name[:])
-                elif t2 == "No canary found" :
-                    self.no_canary.append(file_name[:])
-                elif t2 == "No PIE" :
-                    self.no_pie.append(file_name[:])
-                elif t2 == "NX disabled" :
-                    self.no_nx.append(file_name[:])
-                text.append((t2, SF[t2]))               
-            return text
+            sec_field = "Not able to fetch flags"
+            execstack = "Not able to fetch execstack status"
+            nodrop_groups = "Not able to fetch nodrop groups status"
+            no_mpx = "Not able to fetch mpx status"
+        return sec_field, execstack, nodrop_groups, no_mpx, problems
+
+    # the number of tool processes grows with the number of argument
+    # batches, not with the number of files
+    def analyse_with_tools(self, files):
+        self.log.info("Analyzing " + str(len(files)) + " files with the external tools")
+        tools = ToolResults(files, self.timeout, self.memory_limit)
+        results = []
+        for f in files:
+            if f in tools.aborted:
+                results.append(self.aborted_result(f, tools.aborted[f]))
+            else:
+                results.append(self.analyse_elf(f, tools))
+        return results
 
-    def process_files(self, img_name, path_to_fs):
-        for i in self.files:
-            real_file = i
-            if os.path.isfile(i):
-                # getting file type
-                cmd = ['file', '--mime-type', i]
+    def aborted_result(self, file_name, reason):
+        self.log.warning("Analysis of " + file_name + " " + reason)
+        message = "Analysis " + reason
+        return [(message,)], message, message, message, ["timed_out"]
+
+    # groups the file list by the object each path refers to, so that
+    # hardlinks and symlinks to the same binary are analyzed only once
+    def find_objects(self, inventory):
+        objects = []
+        paths = []
+        seen = set()
+        # files of archives are named by their path relative to the rootfs
+        root = "" if self.archive else inventory.path_to_fs
+        count = 0
+        for st in inventory:
+            if stat.S_ISDIR(st.st_mode):
+                continue
+            count += 1
+            name = st.name
+            real_file = root + name
+            if stat.S_ISLNK(st.st_mode):
                 try:
-                    result = subprocess.check_output(cmd).decode("utf-8")
-                except:
-                    print("Not able to decode mime type", sys.exc_info())
-                    with open(self.logdir + log, 'a') as flog:
-                        flog.write("Not able to decode mime type" + sys.exc_info())
-                    continue
-                type = result.split()[-1]
-                # looking for links
-                if type.find("symlink") != -1:
-                    real_file = os.path.realpath(i)
-                    cmd = ['file', '--mime-type', real_file]
-                    try:
-                        result = subprocess.check_output(cmd).decode("utf-8")
-                    except:
-                        print("Not able to decode mime type", sys.exc_info())
-                        with open(self.logdir + log, 'a') as flog:
-                            flog.write("Not able to decode mime type" + sys.exc_info())
-                        continue
-                    type = result.split()[-1]
-                # checking security flags if applies
-                if type.find("application") != -1:
-                    if type.find("octet-stream") != -1:
-                        sec_field = "File is octect-stream, can not be analyzed with checksec.sh"
-                    elif type.find("dosexec") != -1:
-                        sec_field = "File MS Windows binary"
-                    elif type.find("archive") != -1:
-                        sec_field = "File is an archive"
-                    elif type.find("xml") != -1:
-                        sec_field = "File is xml"
-                    elif type.find("gzip") != -1:
-                        sec_field = "File is gzip"
-                    elif type.find("postscript") != -1:
-                        sec_field = "File is postscript"
-                    elif type.find("pdf") != -1:
-                        sec_field = "File is pdf"
+                    if self.archive:
+                        real_file, st = self.archive.resolve(name)
                     else:
-                        sec_field = self.get_security_flags(real_file)
-                        execstack = self.get_execstack(real_file)
-                        nodrop_groups = self.get_nodrop_groups(real_file)
-                        no_mpx = self.get_mpx(real_file)
-                        with open(self.reportdir + full_report + img_name + "_" + self.timestamp, 'a') as ffull_report:
-                            real_file = real_file.replace(path_to_fs, "")
-                            ffull_report.write(real_file + ": ")
-                            for s in sec_field:
-                                line = ' '.join(str(x) for x in s)
-                                ffull_report.write(line + ' ')
-                            ffull_report.write('\nexecstack: ' + execstack +' ')
-                            ffull_report.write('\nnodrop_groups: ' + nodrop_groups +' ')
-                            ffull_report.write('\nno mpx: ' + no_mpx +' ')
-                            ffull_report.write('\n')                            
+                        real_file = rootfs_realpath(st.path, root)
+                        st = os.stat(real_file)
+                except EnvironmentError:
+                    continue
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            obj = (st.st_dev, st.st_ino)
+            if obj not in seen:
+                seen.add(obj)
+                objects.append((obj, real_file))
+            paths.append((name, obj, stat_signature(st) + [real_file[len(root):]]))
+        self.log.info("Found " + str(count) + " files")
+        return objects, paths
+
+    # classifies a single file and runs all checks on it, returns None for
+    # files that are not analyzed; can be called from a worker process
+    def analyse_file(self, real_file):
+        # getting file type from the magic number
+        try:
+            sec_field = classify_file(real_file)
+        except EnvironmentError as e:
+            self.log.warning("Not able to read " + real_file + ": " + str(e))
+            return None
+        # checking security flags if applies
+        if sec_field == ELF:
+            key = None
+            if self.cache:
+                # the copies of archived files are temporary
+                try:
+                    key, result = self.cache.lookup(real_file, by_stat=not self.archive)
+                except (sqlite3.Error, EnvironmentError) as e:
+                    self.log.warning("Result cache lookup failed for " + real_file + ": " + str(e))
                 else:
+                    if result is not None:
+                        return result, key, True
+            return self.analyse_elf(real_file), key, False
+        if sec_field:
+            self.log.debug(real_file + ": " + sec_field)
+        return None
+
+    # copies the ELF files of an archive to spooldir in the order of the
+    # archive, each one only when the analysis asks for it, and yields
+    # the paths of the copies
+    def spool(self, spooldir, objects):
+        for name, size, f in self.archive.read_contents([real_file for obj, real_file in objects]):
+            path = spooldir + name
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'wb') as out:
+                while size > 0:
+                    block = f.read(min(size, 1 << 20))
+                    if not block:
+                        break
+                    out.write(block)
+                    size -= len(block)
+            yield path
+
+    def open_snapshot(self, img_name):
+        if not self.snapshotdir:
+            return None
+        try:
+            if not os.path.isdir(self.snapshotdir):
+                os.makedirs(self.snapshotdir)
+        except EnvironmentError as e:
+            self.log.warning("Not able to create snapshot directory: " + str(e))
+            return None
+        return Snapshot(self.snapshotdir + snapshot_file + img_name + ".json.gz",
+                        str(analyzer_version) + "-" + self.backend)
+
+    def process_files(self, img_name, path_to_fs, inventory):
+        objects, paths = self.find_objects(inventory)
+        self.log.info(str(len(paths)) + " files refer to " + str(len(objects)) + " unique objects")
+        # objects reached through a path that has not changed since the
+        # previous run keep their previous verdict
+        snapshot = self.open_snapshot(img_name)
+        verdicts = {}
+        if snapshot:
+            for i, obj, signature in paths:
+                if obj not in verdicts and snapshot.unchanged(i, signature):
+                    verdicts[obj] = snapshot.verdict(i)
+            objects = [(obj, real_file) for obj, real_file in objects if obj not in verdicts]
+            self.log.info(str(len(verdicts)) + " objects unchanged since the previous run, " +
+                          str(len(objects)) + " to analyze")
+        # the cache has to exist before the workers are forked; the tools
+        # backend is meant for parity audits, its results are not cached
+        self.cache = None
+        if self.cachedir and self.backend == "elf":
+            try:
+                if not os.path.isdir(self.cachedir):
+                    os.makedirs(self.cachedir)
+                self.cache = ResultCache(self.cachedir + cache_file, analyzer_version, self.cache_size)
+            except (sqlite3.Error, EnvironmentError) as e:
+                self.log.warning("Not able to open result cache: " + str(e))
+        # the inventory of an archive only keeps the content of the ELF
+        # files, the other files are not analyzed
+        spooldir = None
+        if self.archive:
+            for obj, real_file in objects:
+                if self.archive.content_position(real_file) is None:
+                    verdicts[obj] = None
+            objects = [(obj, real_file) for obj, real_file in objects if obj not in verdicts]
+            objects.sort(key=lambda o: self.archive.content_position(o[1]))
+            spooldir = tempfile.mkdtemp(prefix="isafw-cfa-")
+            real_files = self.spool(spooldir, objects)
+        else:
+            real_files = [real_file for obj, real_file in objects]
+        # workers are killed once they spend more than the deadline on a
+        # file, the analysis then carries on with the next one
+        if self.jobs > 1 or self.timeout or self.memory_limit:
+            # the workers would otherwise start with a copy of the buffer
+            self.log.flush()
+            pool = WorkerPool(analyse_file, self.jobs, self.timeout, self.memory_limit)
+            results = pool.imap(real_files)
+        else:
+            pool = None
+            results = (run(self.analyse_file, real_file) for real_file in real_files)
+        pending = []
+        try:
+            for (obj, real_file), result in zip(objects, results):
+                path = spooldir + real_file if spooldir else real_file
+                if result is None:
+                    verdicts[obj] = None
+                elif isinstance(result, Aborted):
+                    verdicts[obj] = self.aborted_result(real_file, result.reason)
+                else:
+                    result, key, cached = result
+                    if result is None:
+                        pending.append((obj, path, key))
+                        continue
+                    if key:
+                        if cached:
+                            self.cache.touch(key)
+                        else:
+                            self.cache.store(key, result)
+                    verdicts[obj] = result
+                # the copy of an archived file is only kept for the tools
+                if spooldir:
+                    os.remove(path)
+            if pending:
+                tool_results = self.analyse_with_tools([path for obj, path, key in pending])
+                for (obj, path, key), result in zip(pending, tool_results):
+                    if key and "timed_out" not in result[4]:
+                        self.cache.store(key, result)
+                    verdicts[obj] = result
+        finally:
+            if pool:
+                pool.close()
+            if spooldir:
+                shutil.rmtree(spooldir, ignore_errors=True)
+            if self.cache:
+                self.cache.close()
+                self.log.info("Result cache: " + str(self.cache.hits) + " hits, " +
+                              str(self.cache.misses) + " misses")
+                self.cache = None
+        # every path gets the verdict of the object it refers to, in the
+        # order of the file list
+        with open(self.reportdir + full_report + img_name + "_" + self.timestamp, 'a') as ffull_report:
+            for i, obj, signature in paths:
+                result = verdicts.get(obj)
+                # aborted analyses are retried by the next run
+                if snapshot and not (result and "timed_out" in result[4]):
+                    snapshot.add(i, signature, result)
+                if result is None:
                     continue
+                sec_field, execstack, nodrop_groups, no_mpx, problems = result
+                self.results.add(i, problems)
+                ffull_report.write(i + ": ")
+                for s in sec_field:
+                    line = ' '.join(str(x) for x in s)
+                    ffull_report.write(line + ' ')
+                ffull_report.write('\nexecstack: ' + execstack +' ')
+                ffull_report.write('\nnodrop_groups: ' + nodrop_groups +' ')
+                ffull_report.write('\nno mpx: ' + no_mpx +' ')
+                ffull_report.write('\n')
+        if snapshot:
+            self.write_delta_report(img_name, path_to_fs, snapshot)
+
+    def write_delta_report(self, img_name, path_to_fs, snapshot):
+        current = dict((path, entry[1][4]) for path, entry in snapshot.current.items() if entry[1])
+        try:
+            snapshot.save()
+        except EnvironmentError as e:
+            self.log.warning("Not able to save snapshot: " + str(e))
+        if snapshot.previous is None:
+            self.log.info("No snapshot of a previous run, not writing the delta report")
+            return
+        previous = dict((path, entry[1][4]) for path, entry in snapshot.previous.items() if entry[1])
+        write_delta_report(self.reportdir + delta_report + img_name + "_" + self.timestamp,
+                           img_name, path_to_fs, [c[:2] for c in checks], previous, current)
 
 #======== supported callbacks from ISA =============#
 
@@ -340,5 +536,38 @@ def process_filesystem(ISA_filesystem):
     global CFChecker 
     return CFChecker.process_filesystem(ISA_filesystem)
 
+# entry point for the worker processes, they inherit CFChecker on fork
+def analyse_file(file_name):
+    return CFChecker.analyse_file(file_name)
+
+# like os.path.realpath, but absolute links are resolved against the rootfs
+# instead of the host root
+def rootfs_realpath(path, root, max_links=40):
+    pending = [p for p in path[len(root):].split('/') if p]
+    pending.reverse()
+    resolved = ""
+    links = 0
+    while pending:
+        part = pending.pop()
+        if part == '.':
+            continue
+        if part == '..':
+            resolved = resolved.rsplit('/', 1)[0]
+            continue
+        candidate = resolved + '/' + part
+        if os.path.islink(root + candidate):
+            links += 1
+            if links > max_links:
+                raise OSError(errno.ELOOP, "Too many levels of symbolic links", path)
+            target = os.readlink(root + candidate)
+            if target.startswith('/'):
+                resolved = ""
+            parts = [p for p in target.split('/') if p]
+            parts.reverse()
+            pending.extend(parts)
+        else:
+            resolved = candidate
+    return root + resolved
+
 #====================================================#
 
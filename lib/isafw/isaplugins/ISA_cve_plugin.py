@@ -26,14 +26,22 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import io
 import subprocess
 import os
 import re
+import sqlite3
+import sys
 import tempfile
+from ._nvd import NVDIndex
 
 CVEChecker = None
 cve_report = "/cve-report"
 pkglist = "/cve_check_tool_pkglist"
+nvd_url = "https://nvd.nist.gov/vuln/detail/"
+nvd_index = "/cve_nvd_index.db"
+# the NVD database cve-check-tool downloads and matches against
+cve_check_tool_db = "~/NVDS/nvd.db"
 log = "/isafw_cvelog"
 
 class ISA_CVEChecker:    
@@ -41,21 +49,32 @@ class ISA_CVEChecker:
     def __init__(self, ISA_config):
         self.proxy = ISA_config.proxy
         self.reportdir = ISA_config.reportdir
-        self.logdir = ISA_config.logdir
+        self.log = ISA_config.open_log(log)
         self.timestamp = ISA_config.timestamp
+        self.findings = ISA_config.open_findings()
+        self.feed_dir = ISA_config.cve_feed_dir
+        self.index_dir = ISA_config.cachedir or ISA_config.logdir
+        if self.feed_dir:
+            # the packages are matched against local NVD feeds instead
+            if os.path.isdir(self.feed_dir):
+                self.initialized = True
+                print("Plugin ISA_CVEChecker initialized!")
+                self.log.info("Plugin ISA_CVEChecker initialized with the NVD feeds in " + self.feed_dir)
+            else:
+                print("NVD feed directory " + self.feed_dir + " is missing!")
+                self.log.warning("NVD feed directory " + self.feed_dir + " is missing!")
+            return
         # check that cve-check-tool is installed
         rc = subprocess.call(["which", "cve-check-tool"])
         if rc == 0:
             self.initialized = True
             print("Plugin ISA_CVEChecker initialized!")
-            with open(self.logdir + log, 'a') as flog:
-                flog.write("\nPlugin ISA_CVEChecker initialized!\n")
+            self.log.info("Plugin ISA_CVEChecker initialized!")
         else:
             print("cve-check-tool is missing!")
             print("Please install it from https://github.com/ikeydoherty/cve-check-tool.")
-            with open(self.logdir + log, 'a') as flog:
-                flog.write("cve-check-tool is missing!\n")
-                flog.write("Please install it from https://github.com/ikeydoherty/cve-check-tool.\n")
+            self.log.warning("cve-check-tool is missing!")
+            self.log.warning("Please install it from https://github.com/ikeydoherty/cve-check-tool.")
 
     def process_package(self, ISA_pkg):
         if (self.initialized == True):
@@ -63,88 +82,197 @@ class ISA_CVEChecker:
                 alias_pkgs_faux = []
                 # need to compose faux format line for cve-check-tool
                 cve_patch_info = self.process_patch_list(ISA_pkg.patch_files)
-                pkgline_faux = ISA_pkg.name + "," + ISA_pkg.version + "," + cve_patch_info + ",\n"
+                pkgline_faux = ISA_pkg.name + "," + ISA_pkg.version + "," + cve_patch_info + ","
                 if ISA_pkg.aliases:
                     for a in ISA_pkg.aliases:
-                        alias_pkgs_faux.append(a + "," + ISA_pkg.version + "," + cve_patch_info + ",\n")
-                pkglist_faux = pkglist + "_" + self.timestamp + ".faux"
-                with open(self.reportdir + pkglist_faux, 'a') as fauxfile:
-                    fauxfile.write(pkgline_faux)
-                    for a in alias_pkgs_faux:
-                        fauxfile.write(a)
-
-                with open(self.logdir + log, 'a') as flog:
-                    flog.write("\npkg info: " + pkgline_faux)
+                        alias_pkgs_faux.append(a + "," + ISA_pkg.version + "," + cve_patch_info + ",")
+                # the faux file for cve-check-tool is written from the
+                # findings database when the report is created
+                self.findings.add("CVE", "package", ISA_pkg.name, pkgline_faux)
+                for a in alias_pkgs_faux:
+                    self.findings.add("CVE", "package", ISA_pkg.name, a)
+
+                self.log.info("pkg info: " + pkgline_faux)
             else:
                 print("Mandatory arguments such as pkg name, version and list of patches are not provided!")
                 print("Not performing the call.")
                 self.initialized = False
-                with open(self.logdir + log, 'a') as flog:
-                    flog.write("Mandatory arguments such as pkg name, version and list of patches are not provided!\n")
-                    flog.write("Not performing the call.\n")
+                self.log.warning("Mandatory arguments such as pkg name, version and list of patches are not provided!")
+                self.log.warning("Not performing the call.")
         else:
             print("Plugin hasn't initialized! Not performing the call.")
-            with open(self.logdir + log, 'a') as flog:
-                flog.write("Plugin hasn't initialized! Not performing the call.\n")
+            self.log.warning("Plugin hasn't initialized! Not performing the call.")
 
     def process_report(self):
         if (self.initialized == True):
-            print("Creating report in HTML format.")
-            with open(self.logdir + log, 'a') as flog:
-                flog.write("Creating report in HTML format.\n")
-            self.process_report_type("html")
+            packages = [line for name, line in self.findings.findings("CVE", "package")]
+            # the packages are matched against NVD once, all the reports
+            # are made from the CSV output of cve-check-tool or of the
+            # offline matcher
+            if self.feed_dir:
+                print("Matching packages against the NVD feeds.")
+                self.log.info("Matching packages against the NVD feeds.")
+                output = self.match_nvd_feeds(packages)
+            else:
+                print("Running cve-check-tool.")
+                self.log.info("Running cve-check-tool.")
+                output = self.run_cve_check_tool(packages)
+            if output is None:
+                return
+            results = self.parse_csv(output)
 
             print("Creating report in CSV format.")
-            with open(self.logdir + log, 'a') as flog:
-                flog.write("Creating report in CSV format.\n")
-            self.process_report_type("csv")
+            self.log.info("Creating report in CSV format.")
+            with open(self.reportdir + cve_report + "_" + self.timestamp + ".csv", 'w') as freport:
+                freport.write(output)
 
-            pkglist_faux = pkglist + "_" + self.timestamp + ".faux"
-            os.remove(self.reportdir + pkglist_faux)
+            print("Creating report in HTML format.")
+            self.log.info("Creating report in HTML format.")
+            self.write_report_html(results, self.cve_details(results))
 
             print("Creating report in XML format.")
-            with open(self.logdir + log, 'a') as flog:
-                flog.write("Creating report in XML format.\n")
-            self.write_report_xml()
+            self.log.info("Creating report in XML format.")
+            self.write_report_xml(results)
+
+    # [(line, name, version, unpatched CVEs, patched CVEs)] of the packages
+    # in the CSV output of cve-check-tool
+    def parse_csv(self, output):
+        results = []
+        for line in output.splitlines():
+            line = line.strip()
+            fields = line.split(',')
+            if len(fields) < 3:
+                continue
+            patched = fields[3].split() if len(fields) > 3 else []
+            results.append((line, fields[0], fields[1], fields[2].split(), patched))
+        return results
+
+    # {CVE: (score, summary)} of the CVEs of the results, read from the
+    # NVD data they were matched against; CVEs without details are left out
+    def cve_details(self, results):
+        cves = set()
+        for line, name, version, unpatched, patched in results:
+            cves.update(unpatched + patched)
+        try:
+            if self.feed_dir:
+                index = NVDIndex(self.index_dir + nvd_index, self.feed_dir)
+                try:
+                    return index.details(cves)
+                finally:
+                    index.close()
+            db = os.path.expanduser(cve_check_tool_db)
+            if not os.path.isfile(db):
+                self.log.warning("No cve-check-tool database in " + db + ", the report has no CVE details")
+                return {}
+            conn = sqlite3.connect(db)
+            try:
+                details = {}
+                for cve in cves:
+                    row = conn.execute("SELECT SCORE, SUMMARY FROM NVD WHERE ID = ?", (cve,)).fetchone()
+                    if row is not None:
+                        details[cve] = row
+                return details
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            self.log.warning("Not able to read the CVE details: " + str(e))
+            return {}
 
-    def write_report_xml(self):
+    def write_report_html(self, results, details):
+        from xml.sax.saxutils import escape
+        def text(value):
+            return escape(u"%s" % value) if value is not None else ""
+        with io.open(self.reportdir + cve_report + "_" + self.timestamp + ".html", 'w', encoding='utf-8') as freport:
+            freport.write(u"<!DOCTYPE html>\n<html>\n<head><meta charset=\"utf-8\">"
+                          u"<title>CVE report " + text(self.timestamp) + u"</title></head>\n<body>\n")
+            freport.write(u"<h1>CVE report " + text(self.timestamp) + u"</h1>\n<table border=\"1\">\n")
+            freport.write(u"<tr><th>Package</th><th>Version</th><th>CVE</th><th>Score</th>"
+                          u"<th>Status</th><th>Summary</th></tr>\n")
+            # the packages with unpatched CVEs first, a row per CVE
+            for line, name, version, unpatched, patched in sorted(results, key=lambda r: (not r[3], r[1])):
+                cves = [(cve, "Unpatched") for cve in unpatched] + [(cve, "Patched") for cve in patched]
+                if not cves:
+                    freport.write(u"<tr><td>%s</td><td>%s</td><td colspan=\"4\">No known CVEs</td></tr>\n" %
+                                  (text(name), text(version)))
+                for cve, status in cves:
+                    score, summary = details.get(cve, (None, None))
+                    freport.write(u"<tr><td>%s</td><td>%s</td><td><a href=\"%s%s\">%s</a></td>"
+                                  u"<td>%s</td><td>%s</td><td>%s</td></tr>\n" %
+                                  (text(name), text(version), nvd_url, text(cve), text(cve),
+                                   text(score), status, text(summary)))
+            freport.write(u"</table>\n</body>\n</html>\n")
+
+    def write_report_xml(self, results):
         from lxml import etree
         root = etree.Element('testsuite', name='CVE_Plugin', tests='1')
         tcase1 = etree.SubElement(root, 'testcase', classname='ISA_CVEChecker', name='found_CVEs')
-        with open(self.reportdir + cve_report + "_" + self.timestamp + ".csv", 'r') as f:
-            for line in f:
-                line = line.strip()
-                line2 = line.split(',', 2)
-                if line2[2].startswith('CVE'):
-                    failrs1 = etree.SubElement(tcase1, 'failure', message=line, type='violation')
+        for line, name, version, unpatched, patched in results:
+            if unpatched:
+                self.findings.add("CVE", "cve", name, line)
+        self.findings.commit()
+        for name, line in self.findings.findings("CVE", "cve"):
+            failrs1 = etree.SubElement(tcase1, 'failure', message=line, type='violation')
         tree = etree.ElementTree(root)
         output = self.reportdir +  cve_report + "_" + self.timestamp + '.xml' 
         tree.write(output, encoding= 'UTF-8', pretty_print=True, xml_declaration=True)
 
-    def process_report_type(self, rtype):
-        # now faux file is ready and we can process it
+    # the CSV output of cve-check-tool for the faux lines of the packages,
+    # None if it failed
+    def run_cve_check_tool(self, packages):
+        pkglist_faux = pkglist + "_" + self.timestamp + ".faux"
+        with open(self.reportdir + pkglist_faux, 'w') as fauxfile:
+            for line in packages:
+                fauxfile.write(line + "\n")
+        try:
+            return self.run_cve_check_tool_faux(pkglist_faux)
+        finally:
+            os.remove(self.reportdir + pkglist_faux)
+
+    def run_cve_check_tool_faux(self, pkglist_faux):
         args = ""
         if self.proxy:
             args += "https_proxy=%s http_proxy=%s " % (self.proxy, self.proxy)
-        args += "cve-check-tool "
-        if rtype != "html":
-            args += "-c "
-            rtype = "csv"
-        pkglist_faux = pkglist + "_" + self.timestamp + ".faux"
-        args += "-a -t faux '" + self.reportdir + pkglist_faux  + "'"
+        args += "cve-check-tool -c -a -t faux '" + self.reportdir + pkglist_faux  + "'"
         try:
-            popen = subprocess.Popen(args, shell=True, stdout=subprocess.PIPE)
-            popen.wait()
-            output = popen.stdout.read()
+            popen = subprocess.Popen(args, shell=True, stdout=subprocess.PIPE, universal_newlines=True)
+            output = popen.communicate()[0]
         except:
             print("Error in executing cve-check-tool: ", sys.exc_info())
-            output = "Error in executing cve-check-tool"
-            with open(self.logdir + log, 'a') as flog:
-                flog.write("Error in executing cve-check-tool: " + sys.exc_info())
-        else:
-            report = cve_report + "_" + self.timestamp + "." + rtype
-            with open(self.reportdir + report, 'w') as freport:
-                freport.write(output)
+            self.log.error("Error in executing cve-check-tool: " + str(sys.exc_info()))
+            return None
+        if popen.returncode != 0:
+            self.log.warning("cve-check-tool exited with code " + str(popen.returncode))
+        return output
+
+    # the same CSV as cve-check-tool for the faux lines of the packages,
+    # matched against the NVD feeds in feed_dir; None if they can not be
+    # read
+    def match_nvd_feeds(self, packages):
+        try:
+            if not os.path.isdir(self.index_dir):
+                os.makedirs(self.index_dir)
+            index = NVDIndex(self.index_dir + nvd_index, self.feed_dir)
+            try:
+                updated = index.update()
+                if updated:
+                    self.log.list("NVD feeds indexed:", updated)
+                output = []
+                for line in packages:
+                    fields = line.split(',')
+                    if len(fields) < 3:
+                        continue
+                    name, version, fixed = fields[0], fields[1], fields[2].split()
+                    cves = index.match(name, version)
+                    output.append("%s,%s,%s,%s\n" % (name, version,
+                                                     " ".join(c for c in cves if c not in fixed),
+                                                     " ".join(c for c in cves if c in fixed)))
+                return "".join(output)
+            finally:
+                index.close()
+        except (EnvironmentError, ValueError, KeyError, sqlite3.Error) as e:
+            print("Not able to match packages against the NVD feeds: " + str(e))
+            self.log.error("Not able to match packages against the NVD feeds: " + str(e))
+            return None
 
     def process_patch_list(self, patch_files):
         patch_info = ""
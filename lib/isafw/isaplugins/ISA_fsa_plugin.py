@@ -26,117 +26,145 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 import os
-from stat import *
 from lxml import etree
+from ._snapshot import Snapshot, stat_signature, write_delta_report
+from ._rules import Rule, RuleTable, read_rules
 
 FSAnalyzer = None
 full_report = "/fsa_full_report_"
 problems_report = "/fsa_problems_report_"
+delta_report = "/fsa_delta_report_"
+snapshot_file = "/fsa_snapshot_"
 log = "/isafw_fsalog"
+rules_file = "/configs/fsa/rules"
+# bump whenever the checks change, invalidates the snapshots
+analyzer_version = 1
+# built-in checks, in report order; the rules of the rules file follow them
+builtin_rules = [
+    Rule("setuid_files", "Files with SETUID bit set", "mode & S_ISUID == S_ISUID"),
+    Rule("setgid_files", "Files with SETGID bit set", "mode & S_ISGID == S_ISGID"),
+    Rule("ww_files", "World-writable files",
+         "mode & S_IWOTH == S_IWOTH and mode & S_IFREG == S_IFREG and mode & S_IFLNK != S_IFLNK"),
+    Rule("no_sticky_bit_ww_dirs", "World-writable dirs with no sticky bit",
+         "mode & S_IWOTH == S_IWOTH and mode & S_IFDIR == S_IFDIR and mode & S_ISVTX != S_ISVTX"),
+]
 
 class ISA_FSChecker():    
     initialized = False
     def __init__(self, ISA_config):
         self.proxy = ISA_config.proxy
         self.reportdir = ISA_config.reportdir
-        self.logdir = ISA_config.logdir
+        self.log = ISA_config.open_log(log, truncate=True)
         self.timestamp = ISA_config.timestamp
+        self.snapshotdir = ISA_config.snapshotdir
+        self.rules = self.load_rules(ISA_config.fsa_rules or os.path.dirname(__file__) + rules_file)
+        self.findings = None
         self.initialized = True
-        self.setuid_files = []
-        self.setgid_files = []
-        self.ww_files = []
-        self.no_sticky_bit_ww_dirs = []
         print("Plugin ISA_FSChecker initialized!")
-        with open(self.logdir + log, 'w') as flog:
-            flog.write("\nPlugin ISA_FSChecker initialized!\n")
+        self.log.info("Plugin ISA_FSChecker initialized!")
+
+    def load_rules(self, file_name):
+        rules = list(builtin_rules)
+        try:
+            extra_rules, errors = read_rules(file_name)
+        except EnvironmentError as e:
+            self.log.warning("Not able to read the rules file: " + str(e))
+            return rules
+        for error in errors:
+            self.log.warning("Ignoring rule at " + error)
+        for rule in extra_rules:
+            if rule.name in [r.name for r in rules]:
+                self.log.warning("Ignoring rule " + rule.name + ", the name is already used")
+                continue
+            rules.append(rule)
+        self.log.info("Checking " + str(len(rules)) + " rules")
+        return rules
 
     def process_filesystem(self, ISA_filesystem):
         if (self.initialized == True):
             if (ISA_filesystem.img_name and ISA_filesystem.path_to_fs):
-                with open(self.logdir + log, 'a') as flog:
-                    flog.write("Analyzing filesystem at: " + ISA_filesystem.path_to_fs +
-                               " for the image: " + ISA_filesystem.img_name + "\n")
-                self.files = self.find_fsobjects(ISA_filesystem.path_to_fs)
-                with open(self.logdir + log, 'a') as flog:
-                    flog.write("\nFilelist is: " + str(self.files))
+                self.log.info("Analyzing filesystem at: " + ISA_filesystem.path_to_fs +
+                              " for the image: " + ISA_filesystem.img_name)
+                inventory = ISA_filesystem.inventory
+                # every rule is evaluated on all objects at once
+                matches = RuleTable(inventory).evaluate(self.rules)
+                self.findings = dict((rule.name, [inventory.names[row] for row in rows])
+                                     for rule, rows in zip(self.rules, matches))
+                snapshot = self.open_snapshot(ISA_filesystem.img_name)
+                if snapshot:
+                    problems = {}
+                    for rule, rows in zip(self.rules, matches):
+                        for row in rows:
+                            problems.setdefault(row, []).append(rule.name)
                 with open(self.reportdir + full_report + ISA_filesystem.img_name + "_" + self.timestamp, 'w') as ffull_report:
                     ffull_report.write("Report for image: " + ISA_filesystem.img_name + '\n')
                     ffull_report.write("With rootfs location at " + ISA_filesystem.path_to_fs + "\n\n")
-                    for f in self.files:
-                        st = os.lstat(f)
-                        i = f.replace(ISA_filesystem.path_to_fs, "")
-                        ffull_report.write("File: " + i + ' mode: ' + str(oct(st.st_mode)) + 
+                    for row, st in enumerate(inventory):
+                        ffull_report.write("File: " + st.name + ' mode: ' + str(oct(st.st_mode)) + 
                                            " uid: " + str(st.st_uid) + " gid: " + str(st.st_gid) + '\n')
-                        if ((st.st_mode&S_ISUID) == S_ISUID):
-                            self.setuid_files.append(i)
-                        if ((st.st_mode&S_ISGID) == S_ISGID):
-                            self.setgid_files.append(i)
-                        if ((st.st_mode&S_IWOTH) == S_IWOTH):
-                            if (((st.st_mode&S_IFDIR) == S_IFDIR) and ((st.st_mode&S_ISVTX) != S_ISVTX)):
-                                self.no_sticky_bit_ww_dirs.append(i)
-                            if (((st.st_mode&S_IFREG) == S_IFREG) and ((st.st_mode&S_IFLNK) != S_IFLNK)):        
-                                self.ww_files.append(i)
+                        if snapshot:
+                            snapshot.add(st.name, stat_signature(st), problems.get(row, []))
+                self.log.info("Analyzed " + str(len(inventory)) + " filesystem objects")
+                if snapshot:
+                    self.write_delta_report(ISA_filesystem, snapshot)
                 self.write_problems_report(ISA_filesystem)
                 self.write_problems_report_xml(ISA_filesystem)
+                self.findings = None
             else:
                 print("Mandatory arguments such as image name and path to the filesystem are not provided!")
                 print("Not performing the call.")
-                with open(self.logdir + log, 'a') as flog:
-                    flog.write("Mandatory arguments such as image name and path to the filesystem are not provided!\n")
-                    flog.write("Not performing the call.\n")
+                self.log.warning("Mandatory arguments such as image name and path to the filesystem are not provided!")
+                self.log.warning("Not performing the call.")
         else:
             print("Plugin hasn't initialized! Not performing the call.")
-            with open(self.logdir + log, 'a') as flog:
-                flog.write("Plugin hasn't initialized! Not performing the call.\n")
+            self.log.warning("Plugin hasn't initialized! Not performing the call.")
+
+    def open_snapshot(self, img_name):
+        if not self.snapshotdir:
+            return None
+        try:
+            if not os.path.isdir(self.snapshotdir):
+                os.makedirs(self.snapshotdir)
+        except EnvironmentError as e:
+            self.log.warning("Not able to create snapshot directory: " + str(e))
+            return None
+        return Snapshot(self.snapshotdir + snapshot_file + img_name + ".json.gz", analyzer_version)
+
+    def write_delta_report(self, ISA_filesystem, snapshot):
+        try:
+            snapshot.save()
+        except EnvironmentError as e:
+            self.log.warning("Not able to save snapshot: " + str(e))
+        if snapshot.previous is None:
+            self.log.info("No snapshot of a previous run, not writing the delta report")
+            return
+        previous = dict((path, entry[1]) for path, entry in snapshot.previous.items())
+        current = dict((path, entry[1]) for path, entry in snapshot.current.items())
+        write_delta_report(self.reportdir + delta_report + ISA_filesystem.img_name + "_" + self.timestamp,
+                           ISA_filesystem.img_name, ISA_filesystem.path_to_fs,
+                           [(rule.name, rule.title) for rule in self.rules], previous, current)
 
     def write_problems_report(self, ISA_filesystem):
         with open(self.reportdir + problems_report + ISA_filesystem.img_name + "_" + self.timestamp, 'w') as fproblems_report:
             fproblems_report.write("Report for image: " + ISA_filesystem.img_name + '\n')
             fproblems_report.write("With rootfs location at " + ISA_filesystem.path_to_fs + "\n\n")
-            fproblems_report.write("Files with SETUID bit set:\n")
-            for item in self.setuid_files:
-                fproblems_report.write(item + '\n')
-            fproblems_report.write("\n\nFiles with SETGID bit set:\n")
-            for item in self.setgid_files:
-                fproblems_report.write(item + '\n')
-            fproblems_report.write("\n\nWorld-writable files:\n")
-            for item in self.ww_files:
-                fproblems_report.write(item + '\n')
-            fproblems_report.write("\n\nWorld-writable dirs with no sticky bit:\n")
-            for item in self.no_sticky_bit_ww_dirs:
-                fproblems_report.write(item + '\n')
+            for n, rule in enumerate(self.rules):
+                if n:
+                    fproblems_report.write("\n\n")
+                fproblems_report.write(rule.title + ":\n")
+                for item in self.findings[rule.name]:
+                    fproblems_report.write(item + '\n')
 
     def write_problems_report_xml(self, ISA_filesystem):
-        root = etree.Element('testsuite', name = 'FSA_Plugin', tests = '4')
-        tcase1 = etree.SubElement(root, 'testcase', classname = 'ISA_FSChecker', name = 'Files_with_SETUID_bit_set')
-        if self.setuid_files:
-            for item in self.setuid_files:
-                failrs1 = etree.SubElement(tcase1, 'failure', message = item, type = 'violation')                    
-        tcase2 = etree.SubElement(root, 'testacase', classname = 'ISA_FSChecker', name = 'Files_with_SETGID_bit_set')
-        if self.setgid_files:
-            for item in self.setgid_files:
-                failrs2 = etree.SubElement(tcase2, 'failure', message = item, type = 'violation')                    
-        tcase3 = etree.SubElement(root, 'testase', classname = 'ISA_FSChecker', name = 'World-writable_files')
-        if self.ww_files:
-            for item in self.ww_files:
-                failrs3 = etree.SubElement(tcase3, 'failure', message = item, type = 'violation')
-        tcase4 = etree.SubElement(root, 'testcase', classname = 'ISA_FSChecker', name = 'World-writable_dirs_with_no_sticky_bit')
-        if self.no_sticky_bit_ww_dirs:
-            for item in self.no_sticky_bit_ww_dirs:
-                failrs4 = etree.SubElement(tcase4, 'failure', message = item, type = 'violation')            
+        root = etree.Element('testsuite', name = 'FSA_Plugin', tests = str(len(self.rules)))
+        for rule in self.rules:
+            tcase = etree.SubElement(root, 'testcase', classname = 'ISA_FSChecker', name = rule.title.replace(" ", "_"))
+            for item in self.findings[rule.name]:
+                etree.SubElement(tcase, 'failure', message = item, type = 'violation')
         tree = etree.ElementTree(root)
         output = self.reportdir + problems_report + ISA_filesystem.img_name + "_" + self.timestamp + '.xml' 
         tree.write(output, encoding = 'UTF-8', pretty_print = True, xml_declaration = True)
 
-    def find_fsobjects(self, init_path):
-        list_of_files = []
-        for (dirpath, dirnames, filenames) in os.walk(init_path):
-            if (dirpath != init_path):
-                list_of_files.append(str(dirpath)[:])
-            for f in filenames:
-                list_of_files.append(str(dirpath+"/"+f)[:])
-        return list_of_files
-
 #======== supported callbacks from ISA =============#
 
 def init(ISA_config):
@@ -156,19 +156,17 @@ class ISA_KernelChecker():
     def __init__(self, ISA_config):
         self.proxy = ISA_config.proxy
         self.reportdir = ISA_config.reportdir
-        self.logdir = ISA_config.logdir
+        self.log = ISA_config.open_log(log, truncate=True)
         self.timestamp = ISA_config.timestamp
         self.initialized = True
         print("Plugin ISA_KernelChecker initialized!")
-        with open(self.logdir + log, 'w') as flog:
-            flog.write("\nPlugin ISA_KernelChecker initialized!\n")
+        self.log.info("Plugin ISA_KernelChecker initialized!")
 
     def process_kernel(self, ISA_kernel):
         if (self.initialized == True):
             if (ISA_kernel.img_name and ISA_kernel.path_to_config):
-                with open(self.logdir + log, 'a') as flog:
-                    flog.write("Analyzing kernel config file at: " + ISA_kernel.path_to_config +
-                               " for the image: " + ISA_kernel.img_name + "\n")
+                self.log.info("Analyzing kernel config file at: " + ISA_kernel.path_to_config +
+                              " for the image: " + ISA_kernel.img_name)
                 with open(ISA_kernel.path_to_config, 'r') as fkernel_conf:
                     for line in fkernel_conf:
                         line = line.strip('\n')
@@ -184,11 +182,10 @@ class ISA_KernelChecker():
                         for key in self.integrity_kco:
                             if key +'=' in line:
                                 self.integrity_kco[key] = line.split('=')[1]
-                with open(self.logdir + log, 'a') as flog:
-                    flog.write("\n\nhardening_kco values: " + str(self.hardening_kco))
-                    flog.write("\n\nkeys_kco values: " + str(self.keys_kco))              
-                    flog.write("\n\nsecurity_kco values: " + str(self.security_kco))              
-                    flog.write("\n\nintegrity_kco values: " + str(self.integrity_kco))                    
+                self.log.list("hardening_kco values", (key + "=" + value for key, value in sorted(self.hardening_kco.items())))
+                self.log.list("keys_kco values", (key + "=" + value for key, value in sorted(self.keys_kco.items())))
+                self.log.list("security_kco values", (key + "=" + value for key, value in sorted(self.security_kco.items())))
+                self.log.list("integrity_kco values", (key + "=" + value for key, value in sorted(self.integrity_kco.items())))
                 with open(self.reportdir + fullreport + ISA_kernel.img_name + "_" + self.timestamp, 'w') as freport:
                     freport.write("Report for image: " + ISA_kernel.img_name + '\n')
                     freport.write("With the kernel conf at: " + ISA_kernel.path_to_config + '\n\n')
@@ -209,9 +206,8 @@ class ISA_KernelChecker():
             else:
                 print("Mandatory arguments such as image name and path to config are not provided!")
                 print("Not performing the call.")
-                with open(self.logdir + log, 'a') as flog:
-                    flog.write("Mandatory arguments such as image name and path to config are not provided!\n")
-                    flog.write("Not performing the call.\n")
+                self.log.warning("Mandatory arguments such as image name and path to config are not provided!")
+                self.log.warning("Not performing the call.")
         else:
             print("Plugin hasn't initialized! Not performing the call.")    
 
@@ -27,16 +27,29 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-import subprocess
 import os
-import re
+import sqlite3
+import sys
+from ._spdx import Expression, license_names
+from ._spec import find_spec_files, spec_licenses, license_expression
+from ._cache import ResultCache
+from ._licensetext import LicenseIndex, find_license_files, read_text
 
 LicenseChecker = None
 
 flicenses = "/configs/la/licenses"
 fapproved_non_osi = "/configs/la/approved-non-osi"
 fexceptions = "/configs/la/exceptions"
+# the index of the license texts in ISA_config.la_license_dir, see
+# LicenseIndex, is kept in the cache dir
+license_index_file = "/la_license_index"
 log = "/isafw_lalog"
+cache_file = "/la_spec_cache.db"
+# bump when the License tags are extracted differently
+extractor_version = 1
+problems_report = "/la_problems_report_"
+delta_report = "/la_delta_report_"
+detected_report = "/la_detected_licenses_"
 
 class ISA_LicenseChecker():    
     initialized = False
@@ -44,112 +57,236 @@ class ISA_LicenseChecker():
     def __init__(self, ISA_config):
         self.proxy = ISA_config.proxy
         self.reportdir = ISA_config.reportdir
-        self.logdir = ISA_config.logdir
+        self.log = ISA_config.open_log(log)
         self.timestamp = ISA_config.timestamp
-        # check that rpm is installed (supporting only rpm packages for now)
-        rc = subprocess.call(["which", "rpm"])        
-        if rc == 0:
-                self.initialized = True
-                print("Plugin ISA_LicenseChecker initialized!")
-                with open(self.logdir + log, 'a') as flog:
-                    flog.write("\nPlugin ISA_LA initialized!\n")
-        else:
-            print("rpm tool is missing!")
-            with open(self.logdir + log, 'a') as flog:
-                flog.write("rpm tool is missing!\n")
+        self.findings = ISA_config.open_findings()
+        # the policy files are read once, the verdicts are kept per
+        # license expression and package
+        self.approved = self.read_licenses(flicenses) | self.read_licenses(fapproved_non_osi)
+        self.exceptions = self.read_exceptions(fexceptions)
+        self.expressions = {}
+        self.verdicts = {}
+        self.first_spec = ISA_config.la_first_spec
+        self.license_dir = ISA_config.la_license_dir
+        self.match_threshold = ISA_config.la_match_threshold
+        self.index = None
+        self.cachedir = ISA_config.cachedir
+        self.cache_size = int(ISA_config.la_cache_size)
+        self.cache = self.open_cache()
+        self.initialized = True
+        print("Plugin ISA_LicenseChecker initialized!")
+        self.log.info("Plugin ISA_LA initialized!")
 
     def process_package(self, ISA_pkg):
         if (self.initialized == True):
             if ISA_pkg.name:
-                if (not ISA_pkg.licenses):
+                if (not ISA_pkg.licenses and not ISA_pkg.license_expression):
                     # need to determine licenses first
                     if (not ISA_pkg.source_files):
                         if (not ISA_pkg.path_to_sources):
                             print("No path to sources or source file list is provided!")
                             print("Not able to determine licenses for package: ", ISA_pkg.name)
                             self.initialized = False
-                            with open(self.logdir + log, 'a') as flog:
-                                flog.write("No path to sources or source file list is provided!")
-                                flog.write("\nNot able to determine licenses for package: " + ISA_pkg.name)
+                            self.log.warning("No path to sources or source file list is provided!")
+                            self.log.warning("Not able to determine licenses for package: " + ISA_pkg.name)
                             return 
                         # need to build list of source files
-                        ISA_pkg.source_files = self.find_files(ISA_pkg.path_to_sources)
-                    for i in ISA_pkg.source_files:
-                        if (i.endswith(".spec")): # supporting rpm only for now
-                            args = ("rpm", "-q", "--queryformat","%{LICENSE} ", "--specfile", i)
-                            try:
-                                popen = subprocess.Popen(args, stdout=subprocess.PIPE)
-                                popen.wait()
-                                ISA_pkg.licenses = popen.stdout.read().split()
-                            except:
-                                print("Error in executing rpm query: ", sys.exc_info())
-                                print("Not able to process package: ", ISA_pkg.name)
-                                self.initialized = False
-                                with open(self.logdir + log, 'a') as flog:
-                                    flog.write("Error in executing rpm query: " + sys.exc_info())
-                                    flog.write("\nNot able to process package: " + ISA_pkg.name)
-                                return 
-                for l in ISA_pkg.licenses:                                               
-                    if (not self.check_license(l, flicenses) 
-                    and not self.check_license(l, fapproved_non_osi)
-                    and not self.check_exceptions(ISA_pkg.name, l, fexceptions)):
-                        # log the package as not following correct license
-                        with open(self.reportdir + "/la_problems_report_" + self.timestamp, 'a') as freport:
-                            freport.write(ISA_pkg.name + ": " + l + "\n")
+                        ISA_pkg.source_files = find_spec_files(ISA_pkg.path_to_sources, self.first_spec)
+                    licenses = self.find_licenses(ISA_pkg.source_files)
+                    if licenses:
+                        ISA_pkg.license_expression = license_expression(licenses)
+                    elif ISA_pkg.path_to_sources:
+                        ISA_pkg.license_expression = " & ".join(self.detect_licenses(ISA_pkg))
+                expression = ISA_pkg.license_expression or " & ".join(ISA_pkg.licenses)
+                self.findings.mark("LA")
+                if not expression:
+                    self.log.info("No licenses found for package: " + ISA_pkg.name)
+                    return
+                # record the package as not following correct license
+                for l in self.check_expression(ISA_pkg.name, expression):
+                    self.findings.add("LA", "license", ISA_pkg.name, l)
             else:
                 print("Mandatory argument package name is not provided!")
                 print("Not performing the call.")
                 self.initialized = False
-                with open(self.logdir + log, 'a') as flog:
-                    flog.write("Mandatory argument package name is not provided!\n")
-                    flog.write("Not performing the call.\n")
+                self.log.warning("Mandatory argument package name is not provided!")
+                self.log.warning("Not performing the call.")
         else:
             print("Plugin hasn't initialized! Not performing the call.")
-            with open(self.logdir + log, 'a') as flog:
-                flog.write("Plugin hasn't initialized! Not performing the call.")
+            self.log.warning("Plugin hasn't initialized! Not performing the call.")
 
     def process_report(self):
+        if self.cache:
+            try:
+                self.cache.close()
+            except sqlite3.Error as e:
+                self.log.warning("Not able to update the spec file cache: " + str(e))
+            self.cache = None
         if (self.initialized == True):
+            violations = self.findings.findings("LA", "license")
+            print("Creating report in text format.")
+            self.log.info("Creating report in text format.")
+            with open(self.reportdir + problems_report + self.timestamp, 'w') as freport:
+                for name, license in violations:
+                    freport.write(name + ": " + license + "\n")
             print("Creating report in XML format.")
-            with open(self.logdir + log, 'a') as flog:
-                flog.write("Creating report in XML format.\n")
-            self.write_report_xml()
+            self.log.info("Creating report in XML format.")
+            self.write_report_xml(violations)
+            detected = self.findings.findings("LA", "detected")
+            if detected:
+                with open(self.reportdir + detected_report + self.timestamp, 'w') as fdetected:
+                    for name, detail in detected:
+                        fdetected.write(name + ": " + detail + "\n")
+            self.write_delta_report()
 
-    def write_report_xml(self):
+    def write_report_xml(self, violations):
         from lxml import etree
         root = etree.Element('testsuite', name='LA_Plugin', tests='1')
         tcase1 = etree.SubElement(root, 'testcase', classname='ISA_LAChecker', name='license_violations')
-        with open(self.reportdir + "/la_problems_report_" + self.timestamp, 'r') as f:
-            for line in f:
-                line = line.strip()
-                failrs1 = etree.SubElement(tcase1, 'failure', message=line, type='violation')
+        for name, license in violations:
+            failrs1 = etree.SubElement(tcase1, 'failure', message=name + ": " + license, type='violation')
         tree = etree.ElementTree(root)
-        output = self.reportdir + "/la_problems_report_" + self.timestamp + '.xml' 
+        output = self.reportdir + problems_report + self.timestamp + '.xml'
         tree.write(output, encoding= 'UTF-8', pretty_print=True, xml_declaration=True)
 
+    # changes since the previous build in the findings database, which only
+    # has earlier builds when ISA_config.findings_db is set
+    def write_delta_report(self):
+        previous = self.findings.previous_builds("LA")
+        if not previous:
+            self.log.info("No previous build in the findings database, not writing the delta report")
+            return
+        with open(self.reportdir + delta_report + self.timestamp, 'w') as fdelta_report:
+            fdelta_report.write("Changes since build: " + previous[0] + "\n\n")
+            for heading, rows in (("New license violations", self.findings.new_since("LA", "license", previous[0])),
+                                  ("Fixed license violations", self.findings.new_since("LA", "license", self.timestamp,
+                                                                                       build=previous[0]))):
+                fdelta_report.write(heading + ":\n")
+                for name, license in rows:
+                    fdelta_report.write(name + ": " + license + "\n")
+                fdelta_report.write("\n")
+
+
+    # the License tags of the spec files in source_files, cached by the
+    # content of the spec files
+    def find_licenses(self, source_files):
+        cache = self.cache
+        licenses = []
+        for i in source_files:
+            if not i.endswith(".spec"): # supporting rpm only for now
+                continue
+            try:
+                key, found = cache.lookup(i) if cache else (None, None)
+                if found is None:
+                    found = spec_licenses(i)
+                    if cache:
+                        cache.store(key, found)
+                elif cache:
+                    cache.touch(key)
+            except (EnvironmentError, sqlite3.Error) as e:
+                self.log.warning("Not able to read the licenses of " + i + ": " + str(e))
+                continue
+            licenses.extend(l for l in found if l not in licenses)
+        # the recipe tasks exit without process_report()
+        if cache:
+            try:
+                cache.commit()
+            except sqlite3.Error as e:
+                self.log.warning("Not able to update the spec file cache: " + str(e))
+        return licenses
+
+    # the licenses whose texts are found in the license files of the
+    # sources, or else in the first comments of the source files
+    def detect_licenses(self, ISA_pkg):
+        index = self.load_index()
+        if not index:
+            return []
+        licenses = []
+        for file_name, size in find_license_files(ISA_pkg.path_to_sources):
+            try:
+                found = index.match(read_text(file_name, size), self.match_threshold)
+            except EnvironmentError as e:
+                self.log.warning("Not able to read " + file_name + ": " + str(e))
+                continue
+            for license, confidence in found:
+                detail = "%s (%d%% confidence, %s)" % (license, confidence * 100,
+                                                     os.path.relpath(file_name, ISA_pkg.path_to_sources))
+                self.log.info("Detected license of " + ISA_pkg.name + ": " + detail)
+                self.findings.add("LA", "detected", ISA_pkg.name, detail)
+                if license not in licenses:
+                    licenses.append(license)
+        return licenses
+
+    def load_index(self):
+        if self.index is not None:
+            return self.index
+        self.index = False
+        try:
+            if self.license_dir and os.path.isdir(self.license_dir):
+                source = LicenseIndex.source(self.license_dir)
+                index_file = self.cachedir + license_index_file if self.cachedir else None
+                if index_file and os.path.isfile(index_file):
+                    self.index = LicenseIndex.load(index_file, source)
+                if not self.index:
+                    self.index = LicenseIndex.build(self.license_dir)
+                    if index_file:
+                        if not os.path.isdir(self.cachedir):
+                            os.makedirs(self.cachedir)
+                        self.index.save(index_file, source)
+        except (EnvironmentError, ValueError) as e:
+            self.log.warning("Not able to load the license text index: " + str(e))
+        if not self.index:
+            self.log.warning("No license text index, not able to detect licenses from the sources")
+            self.index = False
+        return self.index
 
-    def find_files(self, init_path):
-        list_of_files = []
-        for (dirpath, dirnames, filenames) in os.walk(init_path):
-            for f in filenames:
-                list_of_files.append(str(dirpath+"/"+f)[:])
-        return list_of_files
-
-    def check_license(self, license, file_path):
-            with open(os.path.dirname(__file__) + file_path, 'r') as f:
-                for line in f:
-                    s = line.rstrip()
-                    if s == license:
-                        return True
-            return False
-
-    def check_exceptions(self, pkg_name, license, file_path):
-            with open(os.path.dirname(__file__) + file_path, 'r') as f:
-                for line in f:
-                    s = line.rstrip()
-                    if s == pkg_name + " " + license:
-                        return True
-            return False
+    def open_cache(self):
+        if not self.cachedir:
+            return None
+        try:
+            if not os.path.isdir(self.cachedir):
+                os.makedirs(self.cachedir)
+            return ResultCache(self.cachedir + cache_file, extractor_version, self.cache_size)
+        except (sqlite3.Error, EnvironmentError) as e:
+            self.log.warning("Not able to open the spec file cache: " + str(e))
+            return None
+
+    def read_licenses(self, file_path):
+        with open(os.path.dirname(__file__) + file_path, 'r') as f:
+            return set(line.strip() for line in f if line.strip())
+
+    # package name -> licenses accepted for that package only
+    def read_exceptions(self, file_path):
+        exceptions = {}
+        with open(os.path.dirname(__file__) + file_path, 'r') as f:
+            for line in f:
+                fields = line.split(None, 1)
+                if len(fields) == 2:
+                    exceptions.setdefault(fields[0], set()).add(fields[1].strip())
+        return exceptions
+
+    def check_license(self, pkg_name, license):
+        return license in self.approved or license in self.exceptions.get(pkg_name, ())
+
+    # the licenses of the expression the package is not allowed to use,
+    # empty if the package follows the license policy
+    def check_expression(self, pkg_name, expression):
+        key = (expression, pkg_name)
+        if key not in self.verdicts:
+            if expression not in self.expressions:
+                try:
+                    self.expressions[expression] = Expression(expression)
+                except ValueError:
+                    self.log.warning("Not able to parse the license expression of " + pkg_name + ", " +
+                                     "checking every license in it: " + str(sys.exc_info()[1]))
+                    self.expressions[expression] = None
+            compiled = self.expressions[expression]
+            if compiled:
+                verdict = compiled.violations(lambda l: self.check_license(pkg_name, l))
+            else:
+                verdict = [l for l in license_names(expression) if not self.check_license(pkg_name, l)]
+            self.verdicts[key] = verdict
+        return self.verdicts[key]
 
 
 #======== supported callbacks from ISA =============#
@@ -0,0 +1,141 @@
+#
+# _cache.py - Persistent analysis result cache, part of ISA FW
+#
+# Copyright (c) 2015, Intel Corporation
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of Intel Corporation nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+hash_block_size = 1024 * 1024
+
+
+def file_digest(file_name):
+    h = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        while True:
+            block = f.read(hash_block_size)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def stat_key(st):
+    return (st.st_dev, st.st_ino, st.st_size, repr(st.st_mtime))
+
+
+class ResultCache:
+    # Results are keyed by the sha256 of the file content. A (dev, inode,
+    # size, mtime) index avoids hashing files that have not changed since
+    # they were last seen. Entries stored by a different analyzer version
+    # are dropped, and the least recently used ones are evicted once the
+    # cache holds more than max_entries results.
+    def __init__(self, path, version, max_entries):
+        self.path = path
+        self.version = str(version)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.conn = None
+        self.pid = None
+        conn = sqlite3.connect(self.path, timeout=60)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute("CREATE TABLE IF NOT EXISTS results (digest TEXT PRIMARY KEY, result TEXT, atime REAL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS stats (dev INTEGER, ino INTEGER, size INTEGER, mtime TEXT, digest TEXT, "
+                     "PRIMARY KEY (dev, ino))")
+        row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is None or row[0] != self.version:
+            conn.execute("DELETE FROM results")
+            conn.execute("DELETE FROM stats")
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (self.version,))
+        conn.commit()
+        conn.close()
+
+    # sqlite connections can not be shared with forked worker processes,
+    # so every process opens its own one on first use
+    def connect(self):
+        if self.conn is None or self.pid != os.getpid():
+            self.conn = sqlite3.connect(self.path, timeout=60)
+            self.pid = os.getpid()
+        return self.conn
+
+    # returns (key, result), result is None on a cache miss; key is what
+    # store() and touch() need to record the outcome. Temporary files,
+    # whose inodes are soon reused, are always hashed with by_stat False.
+    def lookup(self, file_name, by_stat=True):
+        conn = self.connect()
+        skey = None
+        row = None
+        if by_stat:
+            skey = stat_key(os.stat(file_name))
+            row = conn.execute("SELECT digest FROM stats WHERE dev = ? AND ino = ? AND size = ? AND mtime = ?",
+                               skey).fetchone()
+        if row:
+            digest = row[0]
+        else:
+            digest = file_digest(file_name)
+        row = conn.execute("SELECT result FROM results WHERE digest = ?", (digest,)).fetchone()
+        if row:
+            return (digest, skey), json.loads(row[0])
+        return (digest, skey), None
+
+    # the methods below are only called from the parent process
+    def touch(self, key):
+        digest, skey = key
+        self.hits += 1
+        conn = self.connect()
+        conn.execute("UPDATE results SET atime = ? WHERE digest = ?", (time.time(), digest))
+        if skey:
+            conn.execute("INSERT OR REPLACE INTO stats VALUES (?, ?, ?, ?, ?)", skey + (digest,))
+
+    def store(self, key, result):
+        digest, skey = key
+        self.misses += 1
+        conn = self.connect()
+        conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", (digest, json.dumps(result), time.time()))
+        if skey:
+            conn.execute("INSERT OR REPLACE INTO stats VALUES (?, ?, ?, ?, ?)", skey + (digest,))
+
+    # makes what was stored so far visible to other processes
+    def commit(self):
+        if self.conn is not None and self.pid == os.getpid():
+            self.conn.commit()
+
+    def close(self):
+        conn = self.connect()
+        count = conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if count > self.max_entries:
+            conn.execute("DELETE FROM results WHERE digest IN "
+                         "(SELECT digest FROM results ORDER BY atime LIMIT ?)", (count - self.max_entries,))
+            conn.execute("DELETE FROM stats WHERE digest NOT IN (SELECT digest FROM results)")
+        conn.commit()
+        conn.close()
+        self.conn = None
+        self.pid = None
@@ -0,0 +1,595 @@
+#
+# _elf.py - In-process ELF parser for hardening checks, part of ISA FW
+#
+# Copyright (c) 2015, Intel Corporation
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of Intel Corporation nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import mmap
+import re
+import struct
+
+try:
+    range = xrange
+except NameError:
+    pass
+
+ELFMAG = b'\x7fELF'
+ELFCLASS32 = 1
+ELFCLASS64 = 2
+ELFDATA2LSB = 1
+ELFDATA2MSB = 2
+
+ET_REL = 1
+ET_EXEC = 2
+ET_DYN = 3
+
+EM_386 = 3
+EM_X86_64 = 62
+
+PT_DYNAMIC = 2
+PT_GNU_STACK = 0x6474e551
+PT_GNU_RELRO = 0x6474e552
+
+PF_X = 0x1
+PF_W = 0x2
+PF_R = 0x4
+
+SHT_PROGBITS = 1
+SHT_SYMTAB = 2
+SHT_DYNSYM = 11
+SHT_GNU_verdef = 0x6ffffffd
+SHT_GNU_verneed = 0x6ffffffe
+SHT_GNU_versym = 0x6fffffff
+
+SHF_EXECINSTR = 0x4
+
+SHN_UNDEF = 0
+VERSYM_HIDDEN = 0x8000
+VERSYM_VERSION = 0x7fff
+
+DT_NULL = 0
+DT_RPATH = 15
+DT_DEBUG = 21
+DT_BIND_NOW = 24
+DT_RUNPATH = 29
+DT_FLAGS = 30
+DF_BIND_NOW = 0x8
+
+# struct layouts, indexed by ELF class
+ehdr_fmt = {ELFCLASS32: 'HHIIIIIHHHHHH', ELFCLASS64: 'HHIQQQIHHHHHH'}
+phdr_fmt = {ELFCLASS32: 'IIIIIIII', ELFCLASS64: 'IIQQQQQQ'}
+shdr_fmt = {ELFCLASS32: 'IIIIIIIIII', ELFCLASS64: 'IIQQQQIIQQ'}
+dyn_fmt = {ELFCLASS32: 'iI', ELFCLASS64: 'qQ'}
+sym_fmt = {ELFCLASS32: 'IIIBBH', ELFCLASS64: 'IBBHQQ'}
+
+# symbols that tell whether a binary changes its ids without dropping
+# supplementary groups first
+setgid_symbols = (b"setgid@GLIBC", b"setegid@GLIBC", b"setresgid@GLIBC")
+setuid_symbols = (b"setuid@GLIBC", b"seteuid@GLIBC", b"setresuid@GLIBC")
+setgroups_symbols = (b"setgroups@GLIBC", b"initgroups@GLIBC")
+
+
+# MPX instructions objdump is grepped for: bndcl (F3 0F 1A), bndcu (F2 0F 1A)
+# and bndmov (66 0F 1A / 66 0F 1B), with an optional REX prefix on x86-64.
+# The ModRM reg field has to name one of the bnd0-bnd3 registers.
+bnd_modrm = b'[\x00-\x1f\x40-\x5f\x80-\x9f\xc0-\xdf]'
+bnd_rex = b'[\x40-\x43\x48-\x4b]?'
+mpx_patterns = {
+    EM_386: re.compile(b'(?:[\xf2\xf3\x66]\x0f\x1a|\x66\x0f\x1b)' + bnd_modrm),
+    EM_X86_64: re.compile(b'(?:[\xf2\xf3\x66]' + bnd_rex + b'\x0f\x1a|\x66' + bnd_rex + b'\x0f\x1b)' + bnd_modrm),
+}
+# longest match minus one, carried over between chunks
+mpx_overlap = 4
+scan_chunk_size = 64 * 1024
+# how far before a match the code is decoded to confirm it, see resync()
+resync_window = 128
+resync_max_window = 4096
+max_insn_length = 15
+
+
+def byte_set(*ranges):
+    found = set()
+    for r in ranges:
+        if isinstance(r, tuple):
+            found.update(range(r[0], r[1] + 1))
+        else:
+            found.add(r)
+    return frozenset(found)
+
+
+# The byte patterns above also match inside displacements and immediates of
+# other instructions, so every match is confirmed by decoding the code
+# around it the way objdump does. Only the instruction lengths are needed
+# for that.
+prefixes = byte_set(0x26, 0x2e, 0x36, 0x3e, 0x64, 0x65, 0x66, 0x67, 0xf0, 0xf2, 0xf3)
+modrm_1byte = byte_set((0x00, 0x03), (0x08, 0x0b), (0x10, 0x13), (0x18, 0x1b), (0x20, 0x23), (0x28, 0x2b),
+                       (0x30, 0x33), (0x38, 0x3b), 0x62, 0x63, 0x69, 0x6b, (0x80, 0x8f), 0xc0, 0xc1,
+                       (0xc4, 0xc7), (0xd0, 0xd3), (0xd8, 0xdf), 0xf6, 0xf7, 0xfe, 0xff)
+imm8_1byte = byte_set(0x04, 0x0c, 0x14, 0x1c, 0x24, 0x2c, 0x34, 0x3c, 0x6a, 0x6b, (0x70, 0x7f), 0x80,
+                      0x82, 0x83, 0xa8, (0xb0, 0xb7), 0xc0, 0xc1, 0xc6, 0xcd, 0xd4, 0xd5, (0xe0, 0xe7), 0xeb)
+immz_1byte = byte_set(0x05, 0x0d, 0x15, 0x1d, 0x25, 0x2d, 0x35, 0x3d, 0x68, 0x69, 0x81, 0xa9, 0xc7,
+                      0xe8, 0xe9)
+no_modrm_0f = byte_set((0x04, 0x0b), 0x0e, (0x30, 0x37), 0x77, (0x80, 0x8f), (0xa0, 0xa2), (0xa8, 0xaa),
+                       (0xc8, 0xcf))
+imm8_0f = byte_set((0x70, 0x73), 0xa4, 0xac, 0xba, 0xc2, (0xc4, 0xc6))
+
+
+def modrm_length(code, pos, end, mode64, addr16):
+    if pos >= end:
+        return 1
+    modrm = code[pos]
+    mod = modrm >> 6
+    rm = modrm & 7
+    if mod == 3:
+        return 1
+    if addr16:
+        if mod == 0:
+            return 3 if rm == 6 else 1
+        return 1 + mod
+    length = 1
+    if rm == 4:
+        length += 1
+        if mod == 0 and pos + 1 < end and code[pos + 1] & 7 == 5:
+            length += 4
+    elif mod == 0 and rm == 5:
+        length += 4
+    if mod == 1:
+        length += 1
+    elif mod == 2:
+        length += 4
+    return length
+
+
+# returns the length of the instruction at pos and whether it is one of
+# the MPX instructions mpx_patterns look for
+def x86_decode(code, pos, end, mode64):
+    start = pos
+    opsize16 = addr16 = False
+    rep = None
+    while pos < end and code[pos] in prefixes:
+        b = code[pos]
+        if b == 0x66:
+            opsize16 = True
+        elif b == 0x67:
+            addr16 = True
+        elif b in (0xf2, 0xf3):
+            rep = b
+        pos += 1
+    rex_w = False
+    if mode64 and pos < end and code[pos] & 0xf0 == 0x40:
+        rex_w = bool(code[pos] & 8)
+        pos += 1
+    if pos >= end:
+        return max(pos - start, 1), False
+    immz = 2 if opsize16 else 4
+    # in 64-bit mode 0x67 switches to 32-bit addressing, not to 16-bit
+    addr_modrm16 = addr16 and not mode64
+    op = code[pos]
+    pos += 1
+    # VEX, EVEX and XOP encoded instructions
+    vex = None
+    if op in (0xc4, 0xc5, 0x62) and pos < end and (mode64 or code[pos] >= 0xc0):
+        if op == 0xc5:
+            vex = (1, pos + 1)
+        elif op == 0xc4:
+            vex = (code[pos] & 0x1f, pos + 2)
+        else:
+            vex = (code[pos] & 0x7, pos + 3)
+    elif op == 0x8f and pos < end and code[pos] & 0x1f >= 8:
+        vex = (code[pos] & 0x1f, pos + 2)
+    if vex:
+        vmap, pos = vex
+        if pos >= end:
+            return end - start, False
+        op = code[pos]
+        pos += 1
+        if not (vmap == 1 and op == 0x77):
+            pos += modrm_length(code, pos, end, mode64, addr_modrm16)
+        if vmap in (3, 8) or (vmap == 1 and op in imm8_0f):
+            pos += 1
+        elif vmap == 0xa:
+            pos += 4
+        return min(pos, end) - start, False
+    mpx = False
+    if op == 0x0f:
+        if pos >= end:
+            return end - start, False
+        op = code[pos]
+        pos += 1
+        if op in (0x38, 0x3a):
+            pos += 1 + modrm_length(code, pos + 1, end, mode64, addr_modrm16)
+            if op == 0x3a:
+                pos += 1
+        elif op == 0x0f:
+            pos += modrm_length(code, pos, end, mode64, addr_modrm16) + 1
+        elif op in no_modrm_0f:
+            if op & 0xf0 == 0x80:
+                pos += immz
+        else:
+            if op in (0x1a, 0x1b) and pos < end and (code[pos] >> 3) & 7 < 4:
+                if op == 0x1a:
+                    mpx = rep is not None or opsize16
+                else:
+                    mpx = rep is None and opsize16
+            pos += modrm_length(code, pos, end, mode64, addr_modrm16)
+            if op in imm8_0f:
+                pos += 1
+        return min(pos, end) - start, mpx
+    if op in modrm_1byte:
+        reg = (code[pos] >> 3) & 7 if pos < end else 0
+        pos += modrm_length(code, pos, end, mode64, addr_modrm16)
+        if op == 0xf6 and reg < 2:
+            pos += 1
+        elif op == 0xf7 and reg < 2:
+            pos += immz
+    if op in imm8_1byte:
+        pos += 1
+    elif op in immz_1byte:
+        pos += immz
+    elif 0xb8 <= op <= 0xbf:
+        pos += 8 if rex_w else immz
+    elif op in (0xc2, 0xca):
+        pos += 2
+    elif op == 0xc8:
+        pos += 3
+    elif 0xa0 <= op <= 0xa3:
+        if mode64:
+            pos += 4 if addr16 else 8
+        else:
+            pos += 2 if addr16 else 4
+    elif op in (0x9a, 0xea) and not mode64:
+        pos += immz + 2
+    return min(pos, end) - start, mpx
+
+
+class ELFError(Exception):
+    pass
+
+
+class NotELFError(ELFError):
+    pass
+
+
+class Segment:
+    def __init__(self, p_type, p_flags, p_offset, p_filesz):
+        self.p_type = p_type
+        self.p_flags = p_flags
+        self.p_offset = p_offset
+        self.p_filesz = p_filesz
+
+
+class Section:
+    def __init__(self, sh_name, sh_type, sh_flags, sh_offset, sh_size, sh_link, sh_entsize):
+        self.sh_name = sh_name
+        self.sh_type = sh_type
+        self.sh_flags = sh_flags
+        self.sh_offset = sh_offset
+        self.sh_size = sh_size
+        self.sh_link = sh_link
+        self.sh_entsize = sh_entsize
+
+
+class ELFFile:
+    # data can be any buffer: an mmap of the file or its content as bytes
+    def __init__(self, data):
+        self.data = data
+        if len(data) < 16 or data[0:4] != ELFMAG:
+            raise NotELFError("Not an ELF file")
+        self.elfclass = ord(data[4:5])
+        if self.elfclass not in (ELFCLASS32, ELFCLASS64):
+            raise ELFError("Unknown ELF class %d" % self.elfclass)
+        elfdata = ord(data[5:6])
+        if elfdata == ELFDATA2LSB:
+            self.endian = '<'
+        elif elfdata == ELFDATA2MSB:
+            self.endian = '>'
+        else:
+            raise ELFError("Unknown ELF data encoding %d" % elfdata)
+        (self.e_type, self.e_machine, _, _, e_phoff, e_shoff, _, _,
+         e_phentsize, e_phnum, e_shentsize, e_shnum, _) = self.unpack(ehdr_fmt[self.elfclass], 16)
+        self.segments = self.read_segments(e_phoff, e_phentsize, e_phnum)
+        self.sections = self.read_sections(e_shoff, e_shentsize, e_shnum)
+        self.dynamic = self.read_dynamic()
+
+    # nothing to release for content that is already in memory
+    def close(self):
+        pass
+
+    def unpack(self, fmt, offset):
+        try:
+            return struct.unpack_from(self.endian + fmt, self.data, offset)
+        except struct.error:
+            raise ELFError("Truncated ELF file")
+
+    def cstring(self, offset):
+        end = self.data.find(b'\0', offset)
+        if offset < 0 or end < 0:
+            raise ELFError("Unterminated string in ELF file")
+        return self.data[offset:end]
+
+    def read_segments(self, e_phoff, e_phentsize, e_phnum):
+        segments = []
+        if not e_phoff:
+            return segments
+        for i in range(e_phnum):
+            ph = self.unpack(phdr_fmt[self.elfclass], e_phoff + i * e_phentsize)
+            if self.elfclass == ELFCLASS32:
+                segments.append(Segment(ph[0], ph[6], ph[1], ph[4]))
+            else:
+                segments.append(Segment(ph[0], ph[1], ph[2], ph[5]))
+        return segments
+
+    def read_sections(self, e_shoff, e_shentsize, e_shnum):
+        sections = []
+        if not e_shoff:
+            return sections
+        for i in range(e_shnum):
+            sh = self.unpack(shdr_fmt[self.elfclass], e_shoff + i * e_shentsize)
+            sections.append(Section(sh[0], sh[1], sh[2], sh[4], sh[5], sh[6], sh[9]))
+        return sections
+
+    def read_dynamic(self):
+        tags = {}
+        fmt = dyn_fmt[self.elfclass]
+        entsize = struct.calcsize(fmt)
+        for seg in self.segments:
+            if seg.p_type != PT_DYNAMIC:
+                continue
+            for offset in range(seg.p_offset, seg.p_offset + seg.p_filesz - entsize + 1, entsize):
+                d_tag, d_val = self.unpack(fmt, offset)
+                if d_tag == DT_NULL:
+                    break
+                tags.setdefault(d_tag, d_val)
+        return tags
+
+    def segment(self, p_type):
+        for seg in self.segments:
+            if seg.p_type == p_type:
+                return seg
+        return None
+
+    def version_names(self, verdef, verneed):
+        # maps version index to (name, defined) as used by .gnu.version
+        names = {}
+        if verdef and verdef.sh_link < len(self.sections):
+            strtab = self.sections[verdef.sh_link].sh_offset
+            offset = verdef.sh_offset
+            while True:
+                _, _, vd_ndx, vd_cnt, _, vd_aux, vd_next = self.unpack('HHHHIII', offset)
+                if vd_cnt:
+                    vda_name, _ = self.unpack('II', offset + vd_aux)
+                    names[vd_ndx] = (self.cstring(strtab + vda_name), True)
+                if not vd_next:
+                    break
+                offset += vd_next
+        if verneed and verneed.sh_link < len(self.sections):
+            strtab = self.sections[verneed.sh_link].sh_offset
+            offset = verneed.sh_offset
+            while True:
+                _, vn_cnt, _, vn_aux, vn_next = self.unpack('HHIII', offset)
+                aux = offset + vn_aux
+                for i in range(vn_cnt):
+                    _, _, vna_other, vna_name, vna_next = self.unpack('IHHII', aux)
+                    names[vna_other] = (self.cstring(strtab + vna_name), False)
+                    if not vna_next:
+                        break
+                    aux += vna_next
+                if not vn_next:
+                    break
+                offset += vn_next
+        return names
+
+    # symbol names the way "readelf -s" prints them, with version suffixes
+    def symbols(self):
+        fmt = sym_fmt[self.elfclass]
+        entsize = struct.calcsize(fmt)
+        versym = verdef = verneed = None
+        for sec in self.sections:
+            if sec.sh_type == SHT_GNU_versym:
+                versym = sec
+            elif sec.sh_type == SHT_GNU_verdef:
+                verdef = sec
+            elif sec.sh_type == SHT_GNU_verneed:
+                verneed = sec
+        versions = None
+        for sec in self.sections:
+            if sec.sh_type not in (SHT_SYMTAB, SHT_DYNSYM) or sec.sh_link >= len(self.sections):
+                continue
+            strtab = self.sections[sec.sh_link].sh_offset
+            use_versions = sec.sh_type == SHT_DYNSYM and versym is not None
+            if use_versions and versions is None:
+                versions = self.version_names(verdef, verneed)
+            if sec.sh_offset + sec.sh_size > len(self.data):
+                raise ELFError("Symbol table beyond the end of the ELF file")
+            for i in range(sec.sh_size // entsize):
+                sym = self.unpack(fmt, sec.sh_offset + i * entsize)
+                if self.elfclass == ELFCLASS32:
+                    st_name, st_shndx = sym[0], sym[5]
+                else:
+                    st_name, st_shndx = sym[0], sym[3]
+                name = self.cstring(strtab + st_name)
+                if use_versions:
+                    vs = self.unpack('H', versym.sh_offset + i * 2)[0]
+                    version = versions.get(vs & VERSYM_VERSION)
+                    if version and (vs & VERSYM_VERSION) > 1:
+                        if version[1] and st_shndx != SHN_UNDEF and not (vs & VERSYM_HIDDEN):
+                            name += b"@@" + version[0]
+                        else:
+                            name += b"@" + version[0]
+                yield name
+
+    # RELRO, canary, NX, PIE, RPATH and RUNPATH in the same wording checksec.sh uses
+    def get_security_flags(self):
+        flags = []
+        if self.segment(PT_GNU_RELRO):
+            if DT_BIND_NOW in self.dynamic or (self.dynamic.get(DT_FLAGS, 0) & DF_BIND_NOW):
+                flags.append("Full RELRO")
+            else:
+                flags.append("Partial RELRO")
+        else:
+            flags.append("No RELRO")
+        canary = False
+        for name in self.symbols():
+            if b"__stack_chk_fail" in name:
+                canary = True
+                break
+        flags.append("Canary found" if canary else "No canary found")
+        stack = self.segment(PT_GNU_STACK)
+        if stack and (stack.p_flags & (PF_R | PF_W | PF_X)) == (PF_R | PF_W | PF_X):
+            flags.append("NX disabled")
+        else:
+            flags.append("NX enabled")
+        if self.e_type == ET_EXEC:
+            flags.append("No PIE")
+        elif self.e_type == ET_DYN:
+            flags.append("PIE enabled" if DT_DEBUG in self.dynamic else "DSO")
+        else:
+            flags.append("Not an ELF file")
+        flags.append("RPATH" if DT_RPATH in self.dynamic else "No RPATH")
+        flags.append("RUNPATH" if DT_RUNPATH in self.dynamic else "No RUNPATH")
+        return flags
+
+    # 'X', '-' or '?' like "execstack -q"
+    def get_execstack(self):
+        if self.e_type not in (ET_EXEC, ET_DYN):
+            raise ELFError("Not a shared library or executable")
+        stack = self.segment(PT_GNU_STACK)
+        if stack is None:
+            return "?"
+        if stack.p_flags & PF_X:
+            return "X"
+        return "-"
+
+    # executable code ranges, the ones objdump -d disassembles
+    def code_ranges(self):
+        ranges = []
+        for sec in self.sections:
+            if sec.sh_type == SHT_PROGBITS and sec.sh_flags & SHF_EXECINSTR:
+                ranges.append((sec.sh_offset, sec.sh_size))
+        if not self.sections:
+            for seg in self.segments:
+                if seg.p_flags & PF_X:
+                    ranges.append((seg.p_offset, seg.p_filesz))
+        return ranges
+
+    # An instruction boundary at most resync_max_window bytes before the
+    # candidate. The last boundary known from the section start or from the
+    # previous candidate is used when it is close enough. Otherwise the code
+    # is decoded from two offsets before the candidate until both agree on
+    # an instruction, which x86 code does within a few instructions.
+    def resync(self, boundary, candidate, mode64):
+        window = resync_window
+        while candidate - boundary > resync_max_window:
+            lo = candidate - 2 * window
+            code = bytearray(self.data[lo:candidate])
+            a, b = 0, window
+            while a != b and b < len(code):
+                if a < b:
+                    a += x86_decode(code, a, len(code), mode64)[0]
+                else:
+                    b += x86_decode(code, b, len(code), mode64)[0]
+            if a == b and a < len(code):
+                return lo + a
+            if 2 * window >= resync_max_window:
+                return lo
+            window *= 2
+        return boundary
+
+    # looks for MPX instructions in fixed-size chunks of the code, the code
+    # decoded to confirm a match never exceeds a few KB, so memory use
+    # and time do not depend on the size of the binary
+    def has_mpx(self):
+        pattern = mpx_patterns.get(self.e_machine)
+        if pattern is None:
+            raise ELFError("MPX is not supported on this architecture")
+        mode64 = self.e_machine == EM_X86_64
+        size = len(self.data)
+        for start, length in self.code_ranges():
+            end = min(start + length, size)
+            insn = start
+            offset = start
+            while offset < end:
+                chunk = self.data[offset:min(offset + scan_chunk_size + mpx_overlap, end)]
+                for match in pattern.finditer(chunk):
+                    candidate = offset + match.start()
+                    if candidate < insn or match.start() >= scan_chunk_size:
+                        continue
+                    # decode up to the instruction that contains the match
+                    lo = self.resync(insn, candidate, mode64)
+                    hi = min(candidate + max_insn_length, end)
+                    code = bytearray(self.data[lo:hi])
+                    pos = 0
+                    while True:
+                        insn_length, mpx = x86_decode(code, pos, hi - lo, mode64)
+                        if lo + pos + insn_length > candidate:
+                            break
+                        pos += insn_length
+                    if mpx:
+                        return True
+                    insn = lo + pos + insn_length
+                offset += scan_chunk_size
+        return False
+
+    # set*id and *groups imports, the ones "readelf -s" output is grepped for
+    def get_setid_symbols(self):
+        return setid_symbols(self.symbols())
+
+
+def setid_symbols(names):
+    found = []
+    for name in names:
+        for s in setgid_symbols + setuid_symbols + setgroups_symbols:
+            if s in name:
+                found.append(name)
+                break
+    return found
+
+
+def is_nodrop_groups(symbols):
+    names = b"\n".join(symbols)
+    return (any(s in names for s in setgid_symbols)
+            and any(s in names for s in setuid_symbols)
+            and not any(s in names for s in setgroups_symbols))
+
+
+class ELFImage(ELFFile):
+    # ELF file mapped into memory once, needs to be closed
+    def __init__(self, file_name):
+        self.mm = None
+        with open(file_name, 'rb') as f:
+            try:
+                self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise NotELFError("Empty file")
+        try:
+            ELFFile.__init__(self, self.mm)
+        except:
+            self.close()
+            raise
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
@@ -0,0 +1,68 @@
+#
+# _filetype.py - File type detection by magic numbers, part of ISA FW
+#
+# Copyright (c) 2015, Intel Corporation
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of Intel Corporation nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+ELF = "elf"
+
+# classify() returns ELF for files to analyze, a reason string for known
+# files that are skipped and None for everything else
+
+# magic numbers at the start of the file and the reason for not analyzing
+# such files, longest prefixes first
+magics = [
+    (b'\xef\xbb\xbf<?xml', "File is xml"),
+    (b'\xfd7zXZ\x00', "File is an archive"),
+    (b'!<arch>\n', "File is an archive"),
+    (b'!<thin>\n', "File is an archive"),
+    (b'PK\x03\x04', "File is an archive"),
+    (b'<?xml', "File is xml"),
+    (b'%PDF-', "File is pdf"),
+    (b'\x7fELF', ELF),
+    (b'\x1f\x8b', "File is gzip"),
+    (b'%!', "File is postscript"),
+    (b'BZh', "File is an archive"),
+    (b'MZ', "File MS Windows binary"),
+]
+tar_magic_offset = 257
+header_size = 512
+
+
+def classify(header):
+    for magic, kind in magics:
+        if header.startswith(magic):
+            return kind
+    if header[tar_magic_offset:tar_magic_offset + 5] == b'ustar':
+        return "File is an archive"
+    if b'\0' in header:
+        return "File is octect-stream, can not be analyzed with checksec.sh"
+    # most likely a text file
+    return None
+
+
+def classify_file(file_name):
+    with open(file_name, 'rb') as f:
+        return classify(f.read(header_size))
@@ -0,0 +1,159 @@
+#
+# _licensetext.py - License detection from license texts, part of ISA FW
+#
+# Copyright (c) 2015, Intel Corporation
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of Intel Corporation nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import io
+import json
+import os
+import re
+import zlib
+from ._spec import pruned_dirs
+
+index_version = 1
+# license texts with fewer shingles match too much by chance
+min_shingles = 20
+# files with these names hold the license of the sources
+license_file_re = re.compile(r"^(licen[cs]e|copying|copyright|notice)([._-].*)?$", re.I)
+# the comment at the top of these is read when there is no license file
+header_file_re = re.compile(r"\.(c|cc|cpp|h|hpp|py|pl|sh|java|js|go|rs)$")
+max_header_files = 10
+header_size = 8192
+max_file_size = 1024 * 1024
+word_re = re.compile(r"[a-z0-9]+")
+
+
+# the hashes of the word trigrams of the text, which ignore case,
+# punctuation, comment markers and line breaks
+def shingles(text):
+    words = word_re.findall(text.lower())
+    return set(zlib.crc32(" ".join(words[i:i + 3]).encode('utf-8')) & 0xffffffff
+               for i in range(len(words) - 2))
+
+
+def read_text(file_name, size=max_file_size):
+    with io.open(file_name, 'r', encoding='utf-8', errors='replace') as f:
+        return f.read(size)
+
+
+# The license files below top, in os.walk() order with the directories of
+# _spec.pruned_dirs left out, or, if there is none, the beginning of the
+# first source files; returned as [(file name, size to read)]
+def find_license_files(top):
+    licenses = []
+    headers = []
+    for dirpath, dirnames, filenames in os.walk(top):
+        dirnames[:] = sorted(d for d in dirnames if d not in pruned_dirs)
+        for f in sorted(filenames):
+            if license_file_re.match(f):
+                licenses.append((os.path.join(dirpath, f), max_file_size))
+            elif header_file_re.search(f) and len(headers) < max_header_files:
+                headers.append((os.path.join(dirpath, f), header_size))
+    return licenses or headers
+
+
+class LicenseIndex:
+    # An inverted index from the trigram hashes of known license texts to
+    # the licenses containing them. A file is matched by counting, for the
+    # licenses sharing trigrams with it, how many of their trigrams it
+    # contains; only those licenses are ever looked at. Licenses with the
+    # same text, e.g. GPL-2.0 and GPL-2.0+, are kept once, under the first
+    # name.
+    def __init__(self, licenses):
+        self.names = []
+        self.sizes = []
+        self.hashes = []
+        self.postings = {}
+        for name, hashes in licenses:
+            i = len(self.names)
+            self.names.append(name)
+            self.sizes.append(len(hashes))
+            self.hashes.append(frozenset(hashes))
+            for h in hashes:
+                self.postings.setdefault(h, []).append(i)
+
+    @classmethod
+    def build(cls, license_dir):
+        licenses = []
+        seen = set()
+        for name in sorted(os.listdir(license_dir)):
+            file_name = os.path.join(license_dir, name)
+            if not os.path.isfile(file_name):
+                continue
+            hashes = frozenset(shingles(read_text(file_name)))
+            if len(hashes) >= min_shingles and hashes not in seen:
+                seen.add(hashes)
+                licenses.append((name, sorted(hashes)))
+        return cls(licenses)
+
+    # the license directory the index was built from, to notice changes
+    @staticmethod
+    def source(license_dir):
+        names = sorted(os.listdir(license_dir))
+        mtimes = [repr(os.stat(os.path.join(license_dir, name)).st_mtime) for name in names]
+        return json.dumps([index_version, license_dir, names, mtimes])
+
+    def save(self, file_name, source):
+        licenses = [[name, sorted(hashes)] for name, hashes in zip(self.names, self.hashes)]
+        tmp_name = "%s.%d" % (file_name, os.getpid())
+        with open(tmp_name, 'w') as f:
+            json.dump({"version": index_version, "source": source, "licenses": licenses}, f)
+        os.rename(tmp_name, file_name)
+
+    # returns None if the index is from another version or source
+    @classmethod
+    def load(cls, file_name, source=None):
+        with open(file_name, 'r') as f:
+            data = json.load(f)
+        if data.get("version") != index_version or (source is not None and data.get("source") != source):
+            return None
+        return cls((str(name), hashes) for name, hashes in data["licenses"])
+
+    # [(license, confidence)] of the licenses whose text the given text
+    # contains, the best first. The confidence is the share of the trigrams
+    # of the license found in the text. Once a license is chosen, the next
+    # ones are only judged on the trigrams the chosen ones do not have, so
+    # that a license text contained in another one (BSD-2-Clause in
+    # BSD-3-Clause) is not reported as well, while the LGPL next to the GPL
+    # in a COPYING file still is.
+    def match(self, text, threshold):
+        found = shingles(text)
+        hits = {}
+        for h in found:
+            for i in self.postings.get(h, ()):
+                hits[i] = hits.get(i, 0) + 1
+        candidates = sorted((-float(count) / self.sizes[i], i) for i, count in hits.items()
+                            if float(count) / self.sizes[i] >= threshold)
+        matches = []
+        chosen = set()
+        for confidence, i in candidates:
+            if chosen:
+                own = self.hashes[i] - chosen
+                if len(own) < min_shingles or float(len(own & found)) / len(own) < threshold:
+                    continue
+            matches.append((self.names[i], -confidence))
+            chosen |= self.hashes[i]
+        return matches
@@ -0,0 +1,275 @@
+#
+# _nvd.py - Offline CVE matching against NVD JSON feeds, part of ISA FW
+#
+# Copyright (c) 2015, Intel Corporation
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of Intel Corporation nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import gzip
+import json
+import os
+import re
+import sqlite3
+
+index_version = 4
+feed_re = re.compile(r"\.json(\.gz)?$")
+version_part_re = re.compile(r"\d+|[a-z]+")
+# letters that make a version sort before the release it precedes
+prerelease_re = re.compile(r"^(alpha|beta|pre|rc|dev|preview)")
+
+
+# A string that sorts like the version: numbers compare as numbers,
+# pre-release tags (1.0rc1) before the release and other letters (1.0.2a)
+# after it. Component markers: "!" pre-release, "#" end, "$" number and
+# "%" other letters.
+def version_key(version):
+    key = []
+    for part in version_part_re.findall(version.lower()):
+        if part.isdigit():
+            part = part.lstrip("0") or "0"
+            key.append("$%02d%s" % (len(part), part))
+        elif prerelease_re.match(part):
+            key.append("!" + part)
+        else:
+            key.append("%" + part)
+    return "".join(key) + "#"
+
+
+def read_feed(file_name):
+    opener = gzip.open if file_name.endswith(".gz") else open
+    with opener(file_name, 'rb') as f:
+        return json.loads(f.read().decode('utf-8'))
+
+
+# the vulnerable (product, start, start included, end, end included) ranges
+# of a feed item, None bounds being open
+def item_ranges(item):
+    ranges = []
+    nodes = list(item.get("configurations", {}).get("nodes", []))
+    while nodes:
+        node = nodes.pop()
+        nodes.extend(node.get("children", []))
+        for match in node.get("cpe_match", []):
+            if not match.get("vulnerable"):
+                continue
+            cpe = match.get("cpe23Uri", "").split(":")
+            if len(cpe) < 7:
+                continue
+            product, version, update = cpe[4].lower(), cpe[5], cpe[6]
+            bounds = [(match.get(k), k.endswith("Including")) for k in
+                      ("versionStartIncluding", "versionStartExcluding",
+                       "versionEndIncluding", "versionEndExcluding")]
+            start = [(version_key(v), incl) for v, incl in bounds[:2] if v]
+            end = [(version_key(v), incl) for v, incl in bounds[2:] if v]
+            if not start and not end and version != "*":
+                # "-" is a product without versions, which no package
+                # version can be matched against
+                if version in ("-", ""):
+                    continue
+                if update not in ("*", "-", ""):
+                    version += update
+                start = end = [(version_key(version), True)]
+            start = start[0] if start else (None, True)
+            end = end[0] if end else (None, True)
+            ranges.append((product, start[0], start[1], end[0], end[1]))
+    return ranges
+
+
+# the (CVSS base score, English description) of a feed item, the score
+# None when the item has none, the version 3 score preferred
+def item_details(item):
+    impact = item.get("impact", {})
+    score = impact.get("baseMetricV3", {}).get("cvssV3", {}).get("baseScore")
+    if score is None:
+        score = impact.get("baseMetricV2", {}).get("cvssV2", {}).get("baseScore")
+    descriptions = item["cve"].get("description", {}).get("description_data", [])
+    summary = " ".join(d.get("value", "") for d in descriptions if d.get("lang", "en") == "en")
+    return (None if score is None else str(score), summary)
+
+
+class NVDIndex:
+    # The vulnerable version ranges of the NVD JSON feeds in feed_dir, kept
+    # in an SQLite database indexed by product, with the versions stored as
+    # version_key() strings so that a package is matched by a single
+    # indexed query. The CVEs and ranges of every feed are kept, those of
+    # the most recently modified feed having a CVE being the live ones, so
+    # the modified feed updates the yearly ones. Feeds are indexed again
+    # when they are added or change, and the live feed of their CVEs
+    # chosen again among the feeds left.
+    def __init__(self, path, feed_dir):
+        self.path = path
+        self.feed_dir = feed_dir
+        self.conn = sqlite3.connect(path, timeout=600, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.create_tables()
+        except:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+        self.touched = set()
+
+    # the tables of an index of another version are made again
+    def create_tables(self):
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is None or row[0] != str(index_version):
+            for table in ("feeds", "cves", "ranges", "products"):
+                self.conn.execute("DROP TABLE IF EXISTS " + table)
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(index_version),))
+        self.conn.execute("CREATE TABLE IF NOT EXISTS feeds (name TEXT PRIMARY KEY, size INTEGER, mtime TEXT, "
+                          "modified REAL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS cves (feed TEXT, cve TEXT, live INTEGER, "
+                          "score TEXT, summary TEXT, PRIMARY KEY (feed, cve))")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS ranges (feed TEXT, cve TEXT, live INTEGER, product TEXT, "
+                          "start TEXT, start_incl INTEGER, end TEXT, end_incl INTEGER)")
+        # both cover the matching queries, see match()
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ranges_start "
+                          "ON ranges (product, live, start, end, start_incl, end_incl, cve)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ranges_end "
+                          "ON ranges (product, live, end, start, start_incl, end_incl, cve)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ranges_feed ON ranges (feed, cve)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ranges_cve ON ranges (cve, feed)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS cves_cve ON cves (cve)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS products (product TEXT PRIMARY KEY, split TEXT)")
+
+    # brings the index up to date with the feeds, returns the names of the
+    # feeds indexed again
+    def update(self):
+        feeds = []
+        for name in os.listdir(self.feed_dir):
+            if feed_re.search(name):
+                st = os.stat(os.path.join(self.feed_dir, name))
+                feeds.append((st.st_mtime, name, st.st_size, repr(st.st_mtime)))
+        feeds.sort()
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            known = dict((name, (size, mtime)) for name, size, mtime in
+                         conn.execute("SELECT name, size, mtime FROM feeds"))
+            names = set(name for _, name, _, _ in feeds)
+            changed = set()
+            for name in known:
+                if name not in names:
+                    changed.update(self.remove_feed(name))
+            updated = []
+            for modified, name, size, mtime in feeds:
+                if known.get(name) != (size, mtime):
+                    changed.update(self.add_feed(name, size, mtime, modified))
+                    updated.append(name)
+            self.choose_live(changed)
+            self.update_products()
+        except:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return updated
+
+    # removes the CVEs and ranges of the feed, returns its CVEs
+    def remove_feed(self, name):
+        cves = set(row[0] for row in self.conn.execute("SELECT cve FROM cves WHERE feed = ?", (name,)))
+        self.touched.update(row[0] for row in self.conn.execute(
+            "SELECT DISTINCT product FROM ranges WHERE feed = ?", (name,)))
+        self.conn.execute("DELETE FROM ranges WHERE feed = ?", (name,))
+        self.conn.execute("DELETE FROM cves WHERE feed = ?", (name,))
+        self.conn.execute("DELETE FROM feeds WHERE name = ?", (name,))
+        return cves
+
+    # indexes the feed again, returns its CVEs before and after, whose
+    # live feed choose_live() has to choose again
+    def add_feed(self, name, size, mtime, modified):
+        cves = self.remove_feed(name)
+        for item in read_feed(os.path.join(self.feed_dir, name)).get("CVE_Items", []):
+            cve = item["cve"]["CVE_data_meta"]["ID"]
+            cves.add(cve)
+            self.conn.execute("INSERT OR REPLACE INTO cves VALUES (?, ?, 0, ?, ?)",
+                              (name, cve) + item_details(item))
+            self.conn.execute("DELETE FROM ranges WHERE feed = ? AND cve = ?", (name, cve))
+            self.conn.executemany("INSERT INTO ranges VALUES (?, ?, 0, ?, ?, ?, ?, ?)",
+                                  [(name, cve, product, start, start_incl, end, end_incl)
+                                   for product, start, start_incl, end, end_incl in set(item_ranges(item))])
+        self.conn.execute("INSERT INTO feeds VALUES (?, ?, ?, ?)", (name, size, mtime, modified))
+        return cves
+
+    # makes the CVEs and ranges of the most recently modified feed having
+    # each of the CVEs the live ones
+    def choose_live(self, cves):
+        for cve in cves:
+            row = self.conn.execute("SELECT feed FROM cves JOIN feeds ON feeds.name = cves.feed WHERE cve = ? "
+                                    "ORDER BY modified DESC, name DESC LIMIT 1", (cve,)).fetchone()
+            feed = row[0] if row is not None else None
+            self.touched.update(row[0] for row in self.conn.execute(
+                "SELECT DISTINCT product FROM ranges WHERE cve = ?", (cve,)))
+            self.conn.execute("UPDATE cves SET live = (feed = ?) WHERE cve = ?", (feed, cve))
+            self.conn.execute("UPDATE ranges SET live = (feed = ?) WHERE cve = ?", (feed, cve))
+
+    # the median start of the ranges of every product changed by the
+    # update, which match() uses to pick a query
+    def update_products(self):
+        for product in self.touched:
+            starts = [row[0] for row in self.conn.execute(
+                "SELECT start FROM ranges WHERE product = ? AND live = 1 AND start IS NOT NULL ORDER BY start",
+                (product,))]
+            self.conn.execute("INSERT OR REPLACE INTO products VALUES (?, ?)",
+                              (product, starts[len(starts) // 2] if starts else None))
+        self.touched = set()
+
+    # The sorted CVEs of the product affecting the version. Versions below
+    # the median start of the product are looked up among the ranges
+    # starting before them, the others among the ranges ending after them,
+    # so that an index scan never reads more than half of the ranges of
+    # the product.
+    def match(self, product, version):
+        product = product.lower()
+        key = version_key(version)
+        row = self.conn.execute("SELECT split FROM products WHERE product = ?", (product,)).fetchone()
+        if row is None:
+            return []
+        start_ok = "(start < ? OR (start = ? AND start_incl))"
+        end_ok = "(end > ? OR (end = ? AND end_incl))"
+        if row[0] is not None and key < row[0]:
+            query = ("SELECT cve FROM ranges INDEXED BY ranges_start WHERE product = ? AND live = 1 AND "
+                     "start <= ? AND " + start_ok + " AND (end IS NULL OR " + end_ok + ") UNION "
+                     "SELECT cve FROM ranges INDEXED BY ranges_start WHERE product = ? AND live = 1 AND "
+                     "start IS NULL AND (end IS NULL OR end >= ?) AND (end IS NULL OR " + end_ok + ")")
+        else:
+            query = ("SELECT cve FROM ranges INDEXED BY ranges_end WHERE product = ? AND live = 1 AND "
+                     "end >= ? AND " + end_ok + " AND (start IS NULL OR " + start_ok + ") UNION "
+                     "SELECT cve FROM ranges INDEXED BY ranges_end WHERE product = ? AND live = 1 AND "
+                     "end IS NULL AND (start IS NULL OR start <= ?) AND (start IS NULL OR " + start_ok + ")")
+        rows = self.conn.execute(query, (product, key, key, key, key, key, product, key, key, key))
+        return sorted(row[0] for row in rows)
+
+    # {CVE: (score, summary)} of the CVEs found in the feeds
+    def details(self, cves):
+        details = {}
+        for cve in cves:
+            row = self.conn.execute("SELECT score, summary FROM cves WHERE cve = ? AND live = 1", (cve,)).fetchone()
+            if row is not None:
+                details[cve] = row
+        return details
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,199 @@
+#
+# _rules.py - Declarative checks over the rootfs inventory, part of ISA FW
+#
+# Copyright (c) 2015, Intel Corporation
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of Intel Corporation nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import operator
+import re
+import stat
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# fields of the inventory a rule can test
+fields = {
+    "mode": "st_mode",
+    "uid": "st_uid",
+    "gid": "st_gid",
+    "size": "st_size",
+}
+operators = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+token_re = re.compile(r"==|!=|<=|>=|<|>|&|[^\s=!<>&]+")
+
+
+# the S_* constants of the stat module; S_IFMT is a function there
+constants = dict((name, value) for name, value in vars(stat).items()
+                 if name.startswith("S_") and isinstance(value, int))
+constants["S_IFMT"] = 0o170000
+
+
+def parse_value(token):
+    if token in constants:
+        return constants[token]
+    # octal constants are usually written with a leading 0
+    if re.match(r"^0[0-7]+$", token):
+        return int(token, 8)
+    try:
+        return int(token, 0)
+    except ValueError:
+        raise ValueError("Not a number or stat constant: " + token)
+
+
+# A term is either ("path", op, path) with op "under" or "is", or
+# (column, mask, op, value) comparing the column, ANDed with the mask if
+# it is not None, with the value
+def parse_term(text):
+    tokens = token_re.findall(text)
+    if len(tokens) == 3 and tokens[0] == "path" and tokens[1] in ("under", "is"):
+        return ("path", tokens[1], tokens[2].rstrip("/"))
+    if len(tokens) == 3 and tokens[0] in fields and tokens[1] in operators:
+        return (fields[tokens[0]], None, tokens[1], parse_value(tokens[2]))
+    if (len(tokens) == 5 and tokens[0] in fields and tokens[1] == "&" and
+            tokens[3] in operators):
+        return (fields[tokens[0]], parse_value(tokens[2]), tokens[3], parse_value(tokens[4]))
+    raise ValueError("Not a valid term: " + text)
+
+
+class Rule:
+    # The expression is one or more terms joined by "and", for example
+    #   mode & S_ISUID == S_ISUID and mode & S_IWGRP == S_IWGRP
+    #   uid != 0 and path under /usr/bin
+    # A term compares mode, uid, gid or size, optionally masked, with a
+    # number or a constant of the stat module, or tests whether the path is
+    # below or equal to a path of the rootfs.
+    def __init__(self, name, title, expression):
+        self.name = name
+        self.title = title
+        self.expression = expression
+        self.terms = [parse_term(t) for t in re.split(r"\s+and\s+", expression.strip())]
+
+
+# Reads a rules file with one "name | title | expression" rule per line,
+# returns the rules and the errors of the lines that could not be parsed
+def read_rules(file_name):
+    rules = []
+    errors = []
+    with open(file_name, 'r') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                name, title, expression = [part.strip() for part in line.split("|", 2)]
+                rules.append(Rule(name, title, expression))
+            except ValueError as e:
+                errors.append(file_name + ":" + str(number) + ": " + str(e))
+    return rules, errors
+
+
+class RuleTable:
+    # The columns of an inventory the rules test, as numpy arrays if numpy
+    # is available, and its paths. The inventory lists every
+    # directory right before everything below it, so the objects below a
+    # path are a single range of rows.
+    def __init__(self, inventory):
+        self.count = len(inventory)
+        self.names = inventory.names
+        self.columns = {}
+        for column in fields.values():
+            values = inventory.column(column)
+            # the tested fields fit signed integers, which mix with Python
+            # integers on every numpy version
+            if numpy is not None:
+                values = numpy.frombuffer(values, dtype=numpy.dtype("i" + str(values.itemsize)))
+            self.columns[column] = values
+
+    def path_range(self, op, path):
+        if op == "under" and not path:
+            return 0, self.count
+        i = self.names.find(path)
+        if i is None:
+            return 0, 0
+        if op == "is":
+            return i, i + 1
+        end = i + 1
+        prefix = path + "/"
+        while end < self.count and self.names[end].startswith(prefix):
+            end += 1
+        return i + 1, end
+
+    # rows a rule can match: those within all of its path terms
+    def rule_range(self, rule):
+        lo, hi = 0, self.count
+        for term in rule.terms:
+            if term[0] == "path":
+                start, end = self.path_range(term[1], term[2])
+                lo, hi = max(lo, start), min(hi, end)
+        return lo, max(lo, hi)
+
+    # Returns the sorted rows matched by each rule. With numpy every term is
+    # a single operation on a column. Without it, the rules sharing a range
+    # of rows are evaluated once per distinct combination of the values
+    # they test, with one pass over the range.
+    def evaluate(self, rules):
+        if numpy is not None:
+            return [self.match(rule) for rule in rules]
+        results = [[] for rule in rules]
+        ranges = {}
+        for n, rule in enumerate(rules):
+            ranges.setdefault(self.rule_range(rule), []).append(n)
+        for (lo, hi), group in ranges.items():
+            used = sorted(set(t[0] for n in group for t in rules[n].terms if t[0] != "path"))
+            keys = zip(*[self.columns[c][lo:hi] for c in used]) if used else (() for i in range(lo, hi))
+            verdicts = {}
+            for row, key in enumerate(keys, lo):
+                matched = verdicts.get(key)
+                if matched is None:
+                    values = dict(zip(used, key))
+                    matched = verdicts[key] = [n for n in group if
+                                               all(compare(values[t[0]], t) for t in rules[n].terms if t[0] != "path")]
+                for n in matched:
+                    results[n].append(row)
+        return results
+
+    def match(self, rule):
+        lo, hi = self.rule_range(rule)
+        matched = numpy.ones(hi - lo, dtype=bool)
+        for term in rule.terms:
+            if term[0] != "path":
+                matched &= compare(self.columns[term[0]][lo:hi], term)
+        return (numpy.flatnonzero(matched) + lo).tolist()
+
+
+def compare(values, term):
+    column, mask, op, value = term
+    if mask is not None:
+        values = values & mask
+    return operators[op](values, value)
@@ -0,0 +1,97 @@
+#
+# _snapshot.py - Snapshots of previous image analysis runs, part of ISA FW
+#
+# Copyright (c) 2015, Intel Corporation
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of Intel Corporation nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import gzip
+import json
+import os
+
+snapshot_version = 1
+
+
+def stat_signature(st):
+    return [st.st_mode, st.st_uid, st.st_gid, st.st_size, repr(st.st_mtime)]
+
+
+class Snapshot:
+    # Keeps the stat signature and the verdict of every path of an image,
+    # keyed by the path relative to the rootfs. The snapshot of the previous
+    # run is loaded on creation, the current one is written out by save().
+    # A snapshot written by a different snapshot or analyzer version is
+    # ignored.
+    def __init__(self, file_name, version):
+        self.file_name = file_name
+        self.version = [snapshot_version, version]
+        self.previous = None
+        self.current = {}
+        try:
+            with gzip.open(file_name, 'rb') as f:
+                data = json.loads(f.read().decode('utf-8'))
+        except (EnvironmentError, ValueError):
+            return
+        if data.get("version") == self.version:
+            self.previous = data["entries"]
+
+    # returns True if the path was seen by the previous run with the same
+    # signature, so its previous verdict can be reused
+    def unchanged(self, path, signature):
+        if self.previous is None:
+            return False
+        entry = self.previous.get(path)
+        return entry is not None and entry[0] == signature
+
+    def verdict(self, path):
+        return self.previous[path][1]
+
+    def add(self, path, signature, verdict):
+        self.current[path] = [signature, verdict]
+
+    def save(self):
+        tmp_name = self.file_name + ".tmp"
+        with gzip.open(tmp_name, 'wb') as f:
+            f.write(json.dumps({"version": self.version, "entries": self.current},
+                               separators=(',', ':')).encode('utf-8'))
+        os.rename(tmp_name, self.file_name)
+
+
+# writes the findings that appeared and disappeared since the previous run;
+# previous and current map paths to the names of the failed checks, checks
+# is a list of (name, title) pairs in report order
+def write_delta_report(file_name, img_name, path_to_fs, checks, previous, current):
+    with open(file_name, 'w') as fdelta_report:
+        fdelta_report.write("Changes since the previous analysis of image: " + img_name + '\n')
+        fdelta_report.write("With rootfs location at " + path_to_fs + "\n\n")
+        for heading, old, new in (("New findings", previous, current), ("Fixed findings", current, previous)):
+            fdelta_report.write(heading + ":\n")
+            for name, title in checks:
+                items = sorted(path for path, problems in new.items()
+                               if name in problems and name not in old.get(path, ()))
+                if items:
+                    fdelta_report.write("\n" + title + ":\n")
+                    for item in items:
+                        fdelta_report.write(item + '\n')
+            fdelta_report.write("\n\n")
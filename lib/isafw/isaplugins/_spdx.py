@@ -0,0 +1,119 @@
+#
+# _spdx.py - License expressions of the packages, part of ISA FW
+#
+# Copyright (c) 2015, Intel Corporation
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of Intel Corporation nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import re
+
+# OE writes the operators as "&" and "|", SPDX as "AND" and "OR"; "&"
+# binds tighter than "|" in both. A license name runs up to the next
+# operator, parenthesis or keyword, so rpm names like "Public Domain" are
+# one token; rpm also writes "with" in lowercase.
+keyword = r"(?:AND|OR|WITH|with)(?![^\s&|()])"
+token_re = re.compile(r"[&|()]|" + keyword + r"|[^\s&|()]+(?:\s+(?!" + keyword + r")[^\s&|()]+)*")
+with_keywords = ("WITH", "with")
+operators = {
+    "&": "&",
+    "AND": "&",
+    "|": "|",
+    "OR": "|",
+}
+
+
+# A license expression parsed once into a tree: a license name is a leaf,
+# the other nodes are (operator, [operands]). "A WITH B" is one leaf.
+class Expression:
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = token_re.findall(text)
+        self.pos = 0
+        if not self.tokens:
+            raise ValueError("Empty license expression")
+        self.tree = self.parse("|")
+        if self.pos != len(self.tokens):
+            raise ValueError("Unexpected " + self.tokens[self.pos] + " in license expression: " + text)
+        del self.tokens
+
+    def next_token(self):
+        if self.pos == len(self.tokens):
+            raise ValueError("Truncated license expression: " + self.text)
+        self.pos += 1
+        return self.tokens[self.pos - 1]
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def parse(self, op):
+        operands = [self.parse("&") if op == "|" else self.parse_license()]
+        while operators.get(self.peek()) == op:
+            self.pos += 1
+            operands.append(self.parse("&") if op == "|" else self.parse_license())
+        return operands[0] if len(operands) == 1 else (op, operands)
+
+    def parse_license(self):
+        token = self.next_token()
+        if token == "(":
+            tree = self.parse("|")
+            token = self.next_token()
+            if token != ")":
+                raise ValueError("Unexpected " + token + " instead of ) in license expression: " + self.text)
+            return tree
+        if token in operators or token in with_keywords or token == ")":
+            raise ValueError("Unexpected " + token + " in license expression: " + self.text)
+        if self.peek() in with_keywords:
+            self.pos += 1
+            token += " WITH " + self.next_token()
+        return token
+
+    # the licenses that make the expression fail, in the order they appear;
+    # empty if approved(license) holds for a choice of the licenses
+    def violations(self, approved):
+        found = []
+        for license in evaluate(self.tree, approved):
+            if license not in found:
+                found.append(license)
+        return found
+
+
+# the license names of an expression, for the ones that can not be parsed
+def license_names(text):
+    return [t for t in token_re.findall(text) if t not in operators and t not in with_keywords and t not in ("(", ")")]
+
+
+def evaluate(tree, approved):
+    if not isinstance(tree, tuple):
+        return [] if approved(tree) else [tree]
+    op, operands = tree
+    found = []
+    for operand in operands:
+        failed = evaluate(operand, approved)
+        # a single acceptable choice is enough
+        if op == "|" and not failed:
+            return []
+        found.extend(failed)
+    return found
+
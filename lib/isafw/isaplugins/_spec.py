@@ -0,0 +1,131 @@
+#
+# _spec.py - License tags of rpm spec files, part of ISA FW
+#
+# Copyright (c) 2015, Intel Corporation
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of Intel Corporation nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import io
+import os
+import re
+
+# directories of unpacked sources that never hold the spec file of the
+# package: version control metadata, build output and test data
+pruned_dirs = set([
+    ".git", ".hg", ".svn", ".bzr", "CVS",
+    "build", "_build", "autom4te.cache",
+    "test", "tests", "testsuite", "testdata",
+    ])
+
+tag_re = re.compile(r"^(Name|Version|Release|License)\s*:\s*(.*?)\s*$", re.I)
+define_re = re.compile(r"^%(?:define|global)\s+(\w+)(?:\(.*?\))?\s+(.*?)\s*$")
+# %name, %{name}, %{?name}, %{?name:text} and %{!?name:text}
+macro_re = re.compile(r"%%|%\{(!?\??)(\w+)(?::([^{}]*))?\}|%(\w+)")
+max_depth = 10
+# rpm License values are split on "and", "or" and parentheses only, the
+# license names in between may have spaces, like "ASL 2.0"
+rpm_split_re = re.compile(r"(\(|\)|\band\b|\bor\b)", re.I)
+rpm_operators = {"and": "&", "or": "|"}
+
+
+# the spec files below top in os.walk() order, the pruned directories
+# left out; with first_only the walk stops at the first one
+def find_spec_files(top, first_only=False):
+    found = []
+    for dirpath, dirnames, filenames in os.walk(top):
+        dirnames[:] = sorted(d for d in dirnames if d not in pruned_dirs)
+        for f in sorted(filenames):
+            if f.endswith(".spec"):
+                found.append(os.path.join(dirpath, f))
+                if first_only:
+                    return found
+    return found
+
+
+def expand(text, macros, depth=0):
+    def replace(m):
+        if m.group(0) == "%%":
+            return "%"
+        if m.group(4):
+            # %name outside of braces, unknown ones are left as they are
+            name = m.group(4)
+            return expand(macros[name], macros, depth + 1) if name in macros else m.group(0)
+        flags, name, alt = m.group(1), m.group(2), m.group(3)
+        defined = name in macros
+        if "?" in flags:
+            if defined == flags.startswith("!"):
+                return ""
+            if alt is not None:
+                return expand(alt, macros, depth + 1)
+            return expand(macros[name], macros, depth + 1) if defined else ""
+        return expand(macros[name], macros, depth + 1) if defined else m.group(0)
+    if depth > max_depth:
+        return text
+    return macro_re.sub(replace, text)
+
+
+# The License tags of the package and of its subpackages, with the macros
+# defined in the spec file and the name, version and release tags
+# expanded, as rpm -q --specfile would print them. Conditionals are not
+# evaluated, the tags of every branch are returned.
+def spec_licenses(file_name):
+    macros = {}
+    licenses = []
+    with io.open(file_name, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            m = define_re.match(line)
+            if m:
+                macros[m.group(1)] = m.group(2)
+                continue
+            m = tag_re.match(line)
+            if not m:
+                continue
+            tag, value = m.group(1).lower(), expand(m.group(2), macros)
+            # Python 2 reads unicode, the rest of ISA works with str
+            if not isinstance(value, str):
+                value = value.encode('utf-8')
+            if tag == "license":
+                if value and value not in licenses:
+                    licenses.append(value)
+            elif tag not in macros:
+                # the tags of the main package define the macros
+                macros[tag] = value
+    return licenses
+
+
+# rpm joins licenses with "and" and "or", the checker with "&" and "|"
+def rpm_expression(value):
+    tokens = []
+    for token in rpm_split_re.split(value):
+        token = " ".join(token.split())
+        if token:
+            tokens.append(rpm_operators.get(token.lower(), token))
+    return " ".join(tokens).replace("( ", "(").replace(" )", ")")
+
+
+def license_expression(licenses):
+    expressions = [rpm_expression(l) for l in licenses]
+    if len(expressions) == 1:
+        return expressions[0]
+    return " & ".join("(" + e + ")" for e in expressions)
@@ -0,0 +1,286 @@
+#
+# _tools.py - Batched runs of the external ELF analysis tools, part of ISA FW
+#
+# Copyright (c) 2015, Intel Corporation
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of Intel Corporation nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import re
+import signal
+import subprocess
+import threading
+import time
+from ._workers import set_memory_limit
+
+# reserved for the rest of the command line and for safety
+arg_margin = 4096
+# mnemonics searched for in the disassembly
+mpx_mnemonics = (b"bndcu", b"bndcl", b"bndmov")
+objdump_file_re = re.compile(br'^(.*):\s+file format ')
+
+fsencode = getattr(os, 'fsencode', lambda f: f)
+
+
+def arg_max():
+    try:
+        limit = os.sysconf('SC_ARG_MAX')
+    except (ValueError, OSError):
+        limit = 128 * 1024
+    env = sum(len(k) + len(v) + 2 for k, v in os.environ.items())
+    return limit - env - arg_margin
+
+
+# splits files into argument lists that fit into ARG_MAX together with
+# cmd, counting the pointer to every argument as well
+def arg_batches(cmd, files):
+    limit = arg_max() - sum(len(a) + 9 for a in cmd)
+    batch = []
+    size = 0
+    for f in files:
+        length = len(fsencode(f)) + 9
+        if batch and size + length > limit:
+            yield batch
+            batch = []
+            size = 0
+        batch.append(f)
+        size += length
+    if batch:
+        yield batch
+
+
+# kills a tool unless progress() is called at least every timeout seconds
+class Watchdog(threading.Thread):
+    def __init__(self, popen, timeout):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.popen = popen
+        self.timeout = timeout
+        self.deadline = time.time() + timeout
+        self.fired = False
+        self.stopped = threading.Event()
+        self.start()
+
+    def progress(self):
+        self.deadline = time.time() + self.timeout
+
+    def run(self):
+        while not self.stopped.is_set():
+            remaining = self.deadline - time.time()
+            if remaining <= 0:
+                self.fired = True
+                # checksec.sh runs readelf in child processes
+                try:
+                    os.killpg(self.popen.pid, signal.SIGKILL)
+                except OSError:
+                    pass
+                return
+            self.stopped.wait(remaining)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+# runs in the forked child before the tool is executed, the tool gets its
+# own process group so that the watchdog can kill it with its children
+def start_tool(memory_limit):
+    os.setpgrp()
+    set_memory_limit(memory_limit)
+
+
+def feed(popen, data):
+    try:
+        popen.stdin.write(data)
+        popen.stdin.close()
+    except (IOError, OSError):
+        pass
+
+
+# Runs cmd on the files of batch, passed either as arguments or on stdin.
+# Every output line is handed to handler.line(), which returns the file
+# the tool started (False) or finished (True) with that line as
+# (file, finished), or None. A tool that does not get from one file to the
+# next within timeout seconds, or that is killed by a signal, e.g. because
+# of the memory limit, is killed; the file it was busy with is added to
+# aborted and the tool is run again on the rest of the batch.
+class Tool:
+    def __init__(self, cmd, stdin=False):
+        self.cmd = cmd
+        self.stdin = stdin
+
+    def start(self, batch):
+        pass
+
+    def finish(self, batch, rc):
+        pass
+
+    def run(self, files, timeout, memory_limit, aborted):
+        batches = [files] if self.stdin else arg_batches(self.cmd, files)
+        for batch in batches:
+            self.run_batch(batch, timeout, memory_limit, aborted)
+
+    def run_batch(self, batch, timeout, memory_limit, aborted):
+        with open(os.devnull, 'w') as devnull:
+            while batch:
+                args = self.cmd if self.stdin else self.cmd + batch
+                popen = subprocess.Popen(args, stdin=subprocess.PIPE if self.stdin else None,
+                                         stdout=subprocess.PIPE, stderr=devnull,
+                                         preexec_fn=lambda: start_tool(memory_limit))
+                if self.stdin:
+                    writer = threading.Thread(target=feed,
+                                              args=(popen, b"".join(fsencode(f) + b"\n" for f in batch)))
+                    writer.daemon = True
+                    writer.start()
+                watchdog = Watchdog(popen, timeout) if timeout else None
+                self.start(batch)
+                position = dict((f, i) for i, f in enumerate(batch))
+                busy = 0
+                for line in iter(popen.stdout.readline, b""):
+                    event = self.line(line)
+                    if event is None or event[0] not in position:
+                        continue
+                    i = position[event[0]] + (1 if event[1] else 0)
+                    if i > busy:
+                        busy = i
+                        if watchdog:
+                            watchdog.progress()
+                popen.stdout.close()
+                rc = popen.wait()
+                if watchdog:
+                    watchdog.stop()
+                if not (watchdog and watchdog.fired) and rc >= 0:
+                    self.finish(batch, rc)
+                    break
+                if busy < len(batch):
+                    if watchdog and watchdog.fired:
+                        aborted[batch[busy]] = "timed out"
+                    else:
+                        aborted[batch[busy]] = "was killed by signal " + str(-rc)
+                batch = batch[busy + 1:]
+
+
+# checksec.sh reads the file names from stdin and prints one CSV line per
+# file, the file name is the last column
+class Checksec(Tool):
+    def __init__(self, names):
+        Tool.__init__(self, ['checksec.sh', '--batch', 'csv'], stdin=True)
+        self.names = names
+        self.flags = {}
+
+    def line(self, line):
+        fields = line.rstrip(b"\n").split(b",", 6)
+        if len(fields) == 7 and fields[6] in self.names:
+            f = self.names[fields[6]]
+            self.flags[f] = [field.decode("utf-8") for field in fields[:6]]
+            return f, True
+        return None
+
+
+class Execstack(Tool):
+    def __init__(self, names):
+        Tool.__init__(self, ['execstack', '-q'])
+        self.names = names
+        self.status = {}
+
+    def line(self, line):
+        fields = line.rstrip(b"\n").split(b" ", 1)
+        if len(fields) == 2 and fields[1] in self.names:
+            f = self.names[fields[1]]
+            self.status[f] = fields[0].decode("utf-8")
+            return f, True
+        return None
+
+
+# readelf prints a "File: " line before the symbols of every file when it
+# is given more than one
+class ReadelfSymbols(Tool):
+    def __init__(self, names):
+        Tool.__init__(self, ['readelf', '-W', '-s'])
+        self.names = names
+        self.symbols = {}
+        self.current = None
+
+    def start(self, batch):
+        self.current = None
+        if len(batch) == 1:
+            self.current = batch[0]
+            self.symbols[self.current] = []
+
+    def finish(self, batch, rc):
+        if len(batch) == 1 and rc != 0:
+            del self.symbols[batch[0]]
+
+    def line(self, line):
+        if line.startswith(b"File: "):
+            self.current = self.names.get(line[6:].rstrip(b"\n"))
+            if self.current is not None:
+                self.symbols[self.current] = []
+                return self.current, False
+            return None
+        fields = line.split()
+        if self.current is not None and len(fields) >= 8 and fields[0][:-1].isdigit():
+            self.symbols[self.current].append(fields[7])
+        return None
+
+
+# objdump prints "<file>:     file format <format>" before the disassembly
+# of every file; the output is streamed, it is too large to keep
+class ObjdumpMPX(Tool):
+    def __init__(self, names):
+        Tool.__init__(self, ['objdump', '-d'])
+        self.names = names
+        self.mpx = {}
+        self.current = None
+
+    def start(self, batch):
+        self.current = None
+
+    def line(self, line):
+        match = objdump_file_re.match(line)
+        if match:
+            self.current = self.names.get(match.group(1))
+            if self.current is not None:
+                self.mpx[self.current] = False
+                return self.current, False
+        elif self.current is not None and not self.mpx[self.current]:
+            if any(m in line for m in mpx_mnemonics):
+                self.mpx[self.current] = True
+        return None
+
+
+# per file results of the tools, files missing from a dictionary could
+# not be analysed by the tool; aborted maps the files that timed out or
+# were killed in at least one of the tools to the reason
+class ToolResults:
+    def __init__(self, files, timeout=0, memory_limit=0):
+        names = dict((fsencode(f), f) for f in files)
+        self.aborted = {}
+        tools = [Checksec(names), Execstack(names), ReadelfSymbols(names), ObjdumpMPX(names)]
+        for tool in tools:
+            tool.run(files, timeout, memory_limit, self.aborted)
+        self.flags = tools[0].flags
+        self.execstack = tools[1].status
+        self.symbols = tools[2].symbols
+        self.mpx = tools[3].mpx
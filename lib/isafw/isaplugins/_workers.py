@@ -0,0 +1,199 @@
+#
+# _workers.py - Worker processes with deadlines and memory limits, part of ISA FW
+#
+# Copyright (c) 2015, Intel Corporation
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of Intel Corporation nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import multiprocessing
+import os
+import select
+import signal
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# the virtual memory size of the calling process in bytes, 0 if unknown
+def address_space_size():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (EnvironmentError, ValueError, IndexError):
+        return 0
+
+
+# limits the address space of the calling process to in_use bytes plus
+# memory_limit MiB; a forked worker starts with the whole address space of
+# its parent, a tool is limited right before it is executed
+def set_memory_limit(memory_limit, in_use=0):
+    if not memory_limit or resource is None:
+        return
+    limit = in_use + memory_limit * 1024 * 1024
+    hard = resource.getrlimit(resource.RLIMIT_AS)[1]
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def kill(process):
+    process.terminate()
+    process.join(1)
+    if process.is_alive():
+        os.kill(process.pid, signal.SIGKILL)
+        process.join()
+
+
+# returned instead of a result for items whose processing was aborted
+class Aborted:
+    def __init__(self, reason):
+        self.reason = reason
+
+
+# func(item), or an Aborted instance when it raises, so that one item
+# does not stop the processing of the others
+def run(func, item):
+    try:
+        return func(item)
+    except MemoryError:
+        return Aborted("exceeded the memory limit")
+    except Exception as e:
+        return Aborted("failed: " + repr(e))
+
+
+def worker_main(conn, func, memory_limit):
+    set_memory_limit(memory_limit, address_space_size())
+    while True:
+        try:
+            item = conn.recv()
+        except EOFError:
+            break
+        if item is None:
+            break
+        conn.send(run(func, item))
+
+
+class Worker:
+    def __init__(self, ctx, func, memory_limit):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=worker_main, args=(child_conn, func, memory_limit))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+
+    def fileno(self):
+        return self.conn.fileno()
+
+
+class WorkerPool:
+    # Every worker process handles one item at a time. A worker that is
+    # still busy with an item after timeout seconds is killed and replaced,
+    # and so is one that dies, e.g. because of the memory limit. Both
+    # timeout and memory_limit (in MiB) are disabled when 0.
+    def __init__(self, func, jobs, timeout=0, memory_limit=0):
+        try:
+            self.ctx = multiprocessing.get_context("fork")
+        except AttributeError:
+            self.ctx = multiprocessing
+        self.func = func
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.workers = [self.start_worker() for i in range(jobs)]
+
+    def start_worker(self):
+        return Worker(self.ctx, self.func, self.memory_limit)
+
+    def replace(self, worker, reason):
+        self.workers.remove(worker)
+        if reason is not None:
+            kill(worker.process)
+        else:
+            worker.process.join()
+        worker.conn.close()
+        new_worker = self.start_worker()
+        self.workers.append(new_worker)
+        return new_worker
+
+    # yields the results in the order of items, an Aborted instance for the
+    # items that failed, timed out or killed their worker
+    def imap(self, items):
+        items = iter(items)
+        idle = list(self.workers)
+        busy = {}
+        results = {}
+        next_index = 0
+        index = 0
+        exhausted = False
+        while True:
+            while idle and not exhausted:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                worker = idle.pop()
+                worker.conn.send(item)
+                busy[worker] = (index, time.time() + self.timeout)
+                index += 1
+            if not busy:
+                break
+            wait = None
+            if self.timeout:
+                wait = max(min(deadline for i, deadline in busy.values()) - time.time(), 0)
+            ready = select.select(list(busy), [], [], wait)[0]
+            for worker in ready:
+                i = busy.pop(worker)[0]
+                try:
+                    results[i] = worker.conn.recv()
+                except EOFError:
+                    results[i] = Aborted("crashed its worker process")
+                    idle.append(self.replace(worker, None))
+                    continue
+                idle.append(worker)
+            if self.timeout:
+                now = time.time()
+                for worker, (i, deadline) in list(busy.items()):
+                    if now >= deadline:
+                        del busy[worker]
+                        results[i] = Aborted("timed out")
+                        idle.append(self.replace(worker, "timed out"))
+            while next_index in results:
+                yield results.pop(next_index)
+                next_index += 1
+
+    def close(self):
+        for worker in self.workers:
+            try:
+                worker.conn.send(None)
+            except (IOError, OSError):
+                pass
+        for worker in self.workers:
+            worker.process.join(1)
+            if worker.process.is_alive():
+                kill(worker.process)
+            worker.conn.close()
+        self.workers = []
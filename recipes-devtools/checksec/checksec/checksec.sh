@@ -93,6 +93,7 @@ help() {
   echo
   echo "  --file <executable-file>"
   echo "  --dir <directory> [-v]"
+  echo "  --batch [csv|json]  (reads file names from stdin)"
   echo "  --proc <process name>"
   echo "  --proc-all"
   echo "  --proc-libs <process ID>"
@@ -194,6 +195,89 @@ filecheck() {
   fi
 }
 
+# check files for batch mode, prints one result line per file without
+# colour codes; readelf runs once on all the files and prints a "File:"
+# line before the output of each one when it is given more than one, awk
+# gets the file names first to report the files readelf can not read
+filecheck_batch() {
+  awk -v format="$format" '
+    function reset() {
+      part = ""; type = ""
+      relro = 0; bind_now = 0; canary = 0; nx = 1; debug = 0; rpath = 0; runpath = 0
+    }
+    function escape(s,    i, c, e) {
+      e = ""
+      for (i = 1; i <= length(s); i++) {
+        c = substr(s, i, 1)
+        if (c == "\\" || c == "\"")
+          e = e "\\"
+        e = e c
+      }
+      return e
+    }
+    function report() {
+      if (file == "")
+        return
+      r = relro ? (bind_now ? "Full RELRO" : "Partial RELRO") : "No RELRO"
+      c = canary ? "Canary found" : "No canary found"
+      n = nx ? "NX enabled" : "NX disabled"
+      if (type == "EXEC")
+        p = "No PIE"
+      else if (type == "DYN")
+        p = debug ? "PIE enabled" : "DSO"
+      else
+        p = "Not an ELF file"
+      rp = rpath ? "RPATH" : "No RPATH"
+      ru = runpath ? "RUNPATH" : "No RUNPATH"
+      if (format == "csv")
+        printf "%s,%s,%s,%s,%s,%s,%s\n", r, c, n, p, rp, ru, file
+      else
+        printf "{\"file\": \"%s\", \"relro\": \"%s\", \"canary\": \"%s\", \"nx\": \"%s\", \"pie\": \"%s\", \"rpath\": \"%s\", \"runpath\": \"%s\"}\n", escape(file), r, c, n, p, rp, ru
+      fflush()
+      file = ""
+    }
+    # reports the current file and the listed files readelf skipped
+    # before name
+    function start(name) {
+      report()
+      if (name in listed)
+        while (next_file < count && names[next_file] != name) {
+          file = names[next_file++]
+          reset()
+          report()
+        }
+      if (next_file < count && names[next_file] == name)
+        next_file++
+      file = name
+      reset()
+    }
+    BEGIN { count = 0; next_file = 0 }
+    FNR == NR { names[count++] = $0; listed[$0] = 1; next }
+    FNR == 1 && count == 1 { start(names[0]) }
+    /^File: / { start(substr($0, 7)); next }
+    /^ELF Header:/ { part = "header" }
+    /^Program Headers:/ || /^There are no program headers/ { part = "segments" }
+    /^Dynamic section at offset/ || /^There is no dynamic section/ { part = "dynamic" }
+    /^Symbol table / { part = "symbols" }
+    part == "header" && /Type:[ \t]*EXEC/ { type = "EXEC" }
+    part == "header" && /Type:[ \t]*DYN/ { type = "DYN" }
+    part == "segments" && /GNU_RELRO/ { relro = 1 }
+    part == "segments" && /GNU_STACK/ && /RWE/ { nx = 0 }
+    part == "dynamic" && /BIND_NOW/ { bind_now = 1 }
+    part == "dynamic" && /\(DEBUG\)/ { debug = 1 }
+    part == "dynamic" && /rpath/ { rpath = 1 }
+    part == "dynamic" && /runpath/ { runpath = 1 }
+    part == "symbols" && /__stack_chk_fail/ { canary = 1 }
+    END {
+      report()
+      while (next_file < count) {
+        file = names[next_file++]
+        reset()
+        report()
+      }
+    }' <(printf '%s\n' "$@") <(readelf -W -h -l -d -s "$@" 2>/dev/null)
+}
+
 # check process(es)
 proccheck() {
   # check for RELRO support
@@ -614,6 +698,42 @@ case "$1" in
   exit 0
   ;;
  
+ --batch)
+  if [ $have_readelf -eq 0 ] ; then
+    exit 1
+  fi
+  format=${2:-csv}
+  if [ "$format" = "csv" ] ; then
+    echo "relro,canary,nx,pie,rpath,runpath,file"
+  elif [ "$format" != "json" ] ; then
+    printf "\033[31mError: Unknown batch format '$format'.\033[m\n\n"
+    exit 1
+  fi
+  # one file name per line, one result line per readable file; the files
+  # are checked in batches that fit into the argument list of readelf,
+  # half of ARG_MAX is left for the environment
+  limit=$(( `getconf ARG_MAX 2>/dev/null || echo 131072` / 2 ))
+  batch=()
+  size=0
+  while IFS= read -r N; do
+    if [ ! -r "$N" ] ; then
+      printf "Error: No read permissions for '%s'.\n" "$N" >&2
+      continue
+    fi
+    if [ ${#batch[@]} -gt 0 ] && [ $((size + ${#N} + 9)) -gt $limit ] ; then
+      filecheck_batch "${batch[@]}"
+      batch=()
+      size=0
+    fi
+    batch+=("$N")
+    size=$((size + ${#N} + 9))
+  done
+  if [ ${#batch[@]} -gt 0 ] ; then
+    filecheck_batch "${batch[@]}"
+  fi
+  exit 0
+  ;;
+
  --file)
   if [ $have_readelf -eq 0 ] ; then
     exit 1
@@ -0,0 +1,20 @@
+-- The files table of a pseudo files.db for a small rootfs. test_inventory.py
+-- moves /ROOTFS to the rootfs it creates and replaces the inode numbers,
+-- which stand for the objects listed in its pseudo_inodes, with theirs.
+CREATE TABLE files (id INTEGER PRIMARY KEY, path VARCHAR, dev INTEGER, ino INTEGER, uid INTEGER, gid INTEGER, mode INTEGER, rdev INTEGER, deleting INTEGER);
+CREATE INDEX files__path on files (path);
+CREATE INDEX files__dev_ino on files (dev, ino);
+-- mode 040755 and 0100640
+INSERT INTO files VALUES (1, '/ROOTFS/etc', 0, 1, 0, 0, 16877, 0, 0);
+INSERT INTO files VALUES (2, '/ROOTFS/etc/shadow', 0, 2, 0, 42, 33184, 0, 0);
+-- setuid binary, 0104755, also reached through a hardlink pseudo has no
+-- record of
+INSERT INTO files VALUES (3, '/ROOTFS/usr/bin/su', 0, 3, 0, 0, 35309, 0, 0);
+-- deleted without pseudo knowing, new-log got its inode; 0100600
+INSERT INTO files VALUES (4, '/ROOTFS/var/old-log', 0, 4, 1000, 1000, 33152, 0, 0);
+-- being deleted, 0100600
+INSERT INTO files VALUES (5, '/ROOTFS/var/cache', 0, 5, 1000, 1000, 33152, 0, 1);
+-- recorded as a regular file, is a symlink in the rootfs
+INSERT INTO files VALUES (6, '/ROOTFS/var/run', 0, 6, 1000, 1000, 33152, 0, 0);
+-- a record outside of the rootfs, next to it
+INSERT INTO files VALUES (7, '/ROOTFS0/etc/shadow', 0, 2, 1000, 1000, 33152, 0, 0);
@@ -0,0 +1,128 @@
+#
+# test_elf.py - Tests for the in-process ELF parser, part of ISA FW
+#
+# Copyright (c) 2015, Intel Corporation
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of Intel Corporation nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import unittest
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lib", "isafw", "isaplugins"))
+import _elf
+
+# bndmov bnd0, [rax] and the same bytes as the immediate of mov eax, imm32
+bndmov = b"\x66\x0f\x1a\x00"
+mov_imm = b"\xb8" + bndmov
+nop = b"\x90"
+
+
+# a minimal x86-64 ELF file with one executable section of code_size
+# bytes, followed by the headers of the given (type, size, entsize)
+# sections, which all start at the code
+def elf_header(code_size, sections=()):
+    shoff = 64
+    shnum = 2 + len(sections)
+    code_offset = shoff + shnum * 64
+    ehdr = b"\x7fELF\x02\x01\x01" + b"\0" * 9
+    ehdr += struct.pack("<HHIQQQIHHHHHH", _elf.ET_DYN, _elf.EM_X86_64, 1, 0, 0, shoff, 0, 64, 0, 0, 64, shnum, 0)
+    shdrs = b"\0" * 64
+    for sh_type, sh_flags, sh_size, sh_entsize in [(_elf.SHT_PROGBITS, _elf.SHF_EXECINSTR, code_size, 0)] + [
+            (sh_type, 0, sh_size, sh_entsize) for sh_type, sh_size, sh_entsize in sections]:
+        shdrs += struct.pack("<IIQQQQIIQQ", 0, sh_type, sh_flags, 0, code_offset, sh_size, 0, 0, 8, sh_entsize)
+    return ehdr + shdrs
+
+
+def elf_file(code, sections=()):
+    return _elf.ELFFile(elf_header(len(code), sections) + code)
+
+
+class SymbolsTest(unittest.TestCase):
+
+    # a symbol table whose size points far beyond the end of the file
+    def test_corrupt_symtab_size(self):
+        elf = elf_file(nop * 16, [(_elf.SHT_SYMTAB, 1 << 62, 24)])
+        self.assertRaises(_elf.ELFError, lambda: list(elf.symbols()))
+
+
+class MPXTest(unittest.TestCase):
+
+    def test_mpx_instruction(self):
+        self.assertTrue(elf_file(nop * 100 + bndmov + nop).has_mpx())
+
+    def test_pattern_inside_immediate(self):
+        self.assertFalse(elf_file(nop * 100 + mov_imm + nop).has_mpx())
+
+    def test_pattern_across_chunks(self):
+        code = nop * (_elf.scan_chunk_size - 2) + bndmov + nop
+        self.assertTrue(elf_file(code).has_mpx())
+
+    def test_far_from_section_start(self):
+        code = nop * (4 * _elf.resync_max_window)
+        self.assertTrue(elf_file(code + bndmov).has_mpx())
+        self.assertFalse(elf_file(code + mov_imm).has_mpx())
+
+    # a match at the end of a large section must not decode, nor copy, the
+    # whole section
+    def test_large_section(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for tail, expected in ((mov_imm, False), (bndmov, True)):
+                name = os.path.join(tmpdir, "large")
+                block = nop * (1 << 20)
+                blocks = 64
+                with open(name, "wb") as f:
+                    f.write(elf_header(blocks * len(block) + len(tail)))
+                    for i in range(blocks):
+                        f.write(block)
+                    f.write(tail)
+                elf = _elf.ELFImage(name)
+                try:
+                    if tracemalloc:
+                        tracemalloc.start()
+                    started = time.time()
+                    self.assertEqual(elf.has_mpx(), expected)
+                    self.assertLess(time.time() - started, 10)
+                    if tracemalloc:
+                        peak = tracemalloc.get_traced_memory()[1]
+                        tracemalloc.stop()
+                        self.assertLess(peak, 1 << 20)
+                finally:
+                    elf.close()
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+#
+# test_findings.py - Tests for the findings store, part of ISA FW
+#
+# Copyright (c) 2015, Intel Corporation
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of Intel Corporation nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lib", "isafw"))
+from findings import ISA_findings
+
+
+class FindingsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "findings.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    # nothing is created until there is something to write
+    def test_lazy(self):
+        store = ISA_findings(self.path, "b1")
+        self.assertEqual(store.findings("LA", "license"), [])
+        self.assertEqual(store.previous_builds("LA"), [])
+        store.commit()
+        store.close()
+        self.assertEqual(os.listdir(self.tmpdir), [])
+        store.add("LA", "license", "foo", "GPLv3")
+        store.close()
+        self.assertEqual(os.listdir(self.tmpdir), ["findings.db"])
+        self.assertEqual(store.findings("LA", "license"), [("foo", "GPLv3")])
+
+    def test_keep(self):
+        for i in range(4):
+            store = ISA_findings(self.path, "b%d" % i, keep=2)
+            store.add("LA", "license", "foo", "GPLv%d" % i)
+            store.close()
+        self.assertEqual(store.previous_builds("LA"), ["b2"])
+        self.assertEqual(store.findings("LA", "license", build="b1"), [])
+        self.assertEqual(store.new_since("LA", "license", "b2"), [("foo", "GPLv3")])
+        store.close()
+        self.assertEqual(os.listdir(self.tmpdir), ["findings.db"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,198 @@
+#
+# test_inventory.py - Tests for the rootfs inventory, part of ISA FW
+#
+# Copyright (c) 2015, Intel Corporation
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of Intel Corporation nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import io
+import os
+import shutil
+import sqlite3
+import stat
+import sys
+import tarfile
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lib", "isafw"))
+from inventory import ISA_inventory, ISA_names, ISA_tar_inventory
+
+fixtures = os.path.join(os.path.dirname(__file__), "fixtures")
+# the objects the inode numbers of the pseudo-files.sql fixture stand for
+pseudo_inodes = {1: "/etc", 2: "/etc/shadow", 3: "/usr/bin/su", 4: "/var/new-log", 5: "/var/cache",
+                 6: "/var/run"}
+
+
+class NamesTest(unittest.TestCase):
+
+    def test_names(self):
+        for paths in ([], [""], ["", "/a"], ["", "/a", "/a/b", "/ab", "/c d"]):
+            names = ISA_names()
+            for path in paths:
+                names.append(path)
+            self.assertEqual(len(names), len(paths))
+            self.assertEqual(list(names), paths)
+            for i, path in enumerate(paths):
+                self.assertEqual(names[i], path)
+                self.assertEqual(names.find(path), i)
+            self.assertEqual(names.find("/a/"), None)
+            self.assertEqual(names.find("a"), None)
+            loaded = ISA_names.from_bytes(names.to_bytes(), len(paths))
+            self.assertEqual(list(loaded), paths)
+            self.assertEqual(list(loaded.offsets), list(names.offsets))
+
+
+class InventoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root, "usr", "bin"))
+        with open(os.path.join(self.root, "usr", "bin", "tool"), "w") as f:
+            f.write("tool")
+        os.symlink("tool", os.path.join(self.root, "usr", "bin", "link"))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_save_and_load(self):
+        inventory = ISA_inventory(self.root)
+        names = sorted(entry.name for entry in inventory)
+        self.assertEqual(names, ["/usr", "/usr/bin", "/usr/bin/link", "/usr/bin/tool"])
+        f = io.BytesIO()
+        inventory.write_to(f)
+        f.seek(0)
+        loaded = ISA_inventory.read_from(f)
+        self.assertEqual([(e.name, e.st_ino, e.target) for e in loaded],
+                         [(e.name, e.st_ino, e.target) for e in inventory])
+
+
+class TarInventoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_tar(self, name, mode):
+        path = os.path.join(self.tmpdir, name)
+        with tarfile.open(path, mode) as tar:
+            def add(name, data=None, link=None, kind=tarfile.REGTYPE):
+                info = tarfile.TarInfo(name)
+                info.type = kind
+                if link:
+                    info.linkname = link
+                if data is not None:
+                    info.size = len(data)
+                    tar.addfile(info, io.BytesIO(data))
+                else:
+                    tar.addfile(info)
+            add("usr/bin/tool", b"\x7fELF tool")
+            add("usr/bin/text", b"#!/bin/sh")
+            add("usr/lib/old", b"\x7fELF old")
+            add("usr/bin/link", link="tool", kind=tarfile.SYMTYPE)
+            add("usr/bin/hard", link="usr/bin/tool", kind=tarfile.LNKTYPE)
+            add("usr/lib/old", b"not an ELF")
+            add("usr/lib/lib.so", b"\x7fELF lib")
+        return path
+
+    def test_contents(self):
+        for name, mode in (("rootfs.tar", "w"), ("rootfs.tar.gz", "w:gz")):
+            inventory = ISA_tar_inventory(self.make_tar(name, mode))
+            self.assertEqual(sorted(e.name for e in inventory),
+                             ["/usr", "/usr/bin", "/usr/bin/hard", "/usr/bin/link", "/usr/bin/text",
+                              "/usr/bin/tool", "/usr/lib", "/usr/lib/lib.so", "/usr/lib/old"])
+            # only the content of the ELF files is kept, the one of a hardlink
+            # is given once
+            names = ["/usr/lib/lib.so", "/usr/bin/text", "/usr/bin/tool", "/usr/bin/hard", "/usr/lib/old"]
+            self.assertEqual([(n, f.read(size)) for n, size, f in inventory.read_contents(names)],
+                             [("/usr/bin/hard", b"\x7fELF tool"), ("/usr/lib/lib.so", b"\x7fELF lib")])
+            self.assertEqual(inventory.content_position("/usr/bin/tool"),
+                             inventory.content_position("/usr/bin/hard"))
+            self.assertEqual(inventory.content_position("/usr/lib/old"), None)
+            self.assertEqual(inventory.read("/usr/lib/lib.so"), b"\x7fELF lib")
+            self.assertEqual(inventory.read("/usr/bin/text"), None)
+            name, st = inventory.resolve("/usr/bin/link")
+            self.assertEqual(name, "/usr/bin/tool")
+            self.assertTrue(stat.S_ISREG(st.st_mode))
+            self.assertRaises(OSError, inventory.resolve, "/usr/bin/missing")
+
+
+class PseudoTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmpdir, "rootfs")
+        for d in ("etc", "usr/bin", "var", "home/user"):
+            os.makedirs(os.path.join(self.root, d))
+        for name in ("etc/shadow", "usr/bin/su", "var/new-log", "var/cache", "home/user/notes"):
+            with open(os.path.join(self.root, name), "w") as f:
+                f.write(name)
+            os.chmod(os.path.join(self.root, name), 0o644)
+        os.link(os.path.join(self.root, "usr/bin/su"), os.path.join(self.root, "usr/bin/su-link"))
+        os.symlink("new-log", os.path.join(self.root, "var/run"))
+        self.db = os.path.join(self.tmpdir, "files.db")
+        conn = sqlite3.connect(self.db)
+        with open(os.path.join(fixtures, "pseudo-files.sql")) as f:
+            conn.executescript(f.read())
+        conn.execute("UPDATE files SET path = ? || substr(path, 8)", (self.root,))
+        for ino, name in pseudo_inodes.items():
+            st = os.lstat(self.root + name)
+            conn.execute("UPDATE files SET dev = ?, ino = ? WHERE ino = ?", (st.st_dev, st.st_ino, ino))
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_overlay(self):
+        inventory = ISA_inventory(self.root, pseudo_db=self.db)
+        entries = dict((e.name, e) for e in inventory)
+        native = dict((e.name, e) for e in ISA_inventory(self.root))
+        self.assertEqual(sorted(entries), sorted(native))
+        shadow = entries["/etc/shadow"]
+        self.assertEqual((shadow.st_uid, shadow.st_gid, shadow.st_mode), (0, 42, stat.S_IFREG | 0o640))
+        self.assertEqual(entries["/etc"].st_mode, stat.S_IFDIR | 0o755)
+        # hardlinks share the record of their inode
+        for name in ("/usr/bin/su", "/usr/bin/su-link"):
+            self.assertEqual(entries[name].st_mode, stat.S_IFREG | stat.S_ISUID | 0o755)
+        # the stale record of a deleted file, a record being deleted, one
+        # of another type and a missing one do not change anything
+        for name in ("/var/new-log", "/var/cache", "/var/run", "/home/user/notes"):
+            e, n = entries[name], native[name]
+            self.assertEqual((e.st_uid, e.st_gid, e.st_mode), (n.st_uid, n.st_gid, n.st_mode))
+        for name in ("/var/new-log", "/var/cache", "/home/user/notes"):
+            self.assertEqual(entries[name].st_mode, stat.S_IFREG | 0o644)
+        self.assertEqual(entries["/var/new-log"].st_size, len("var/new-log"))
+
+    # a missing database falls back to the native values
+    def test_missing_db(self):
+        inventory = ISA_inventory(self.root, pseudo_db=self.db + ".missing")
+        self.assertEqual(sorted((e.name, e.st_mode) for e in inventory),
+                         sorted((e.name, e.st_mode) for e in ISA_inventory(self.root)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+#
+# test_licenses.py - Tests for the license expressions of the LA plugin, part of ISA FW
+#
+# Copyright (c) 2015, Intel Corporation
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of Intel Corporation nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lib", "isafw", "isaplugins"))
+from _spdx import Expression, license_names
+from _spec import spec_licenses, license_expression
+
+spec = """%define lic GPLv2+
+Name: p
+License: %{lic} or MIT
+%package doc
+License: Public Domain
+%package devel
+License: ASL 2.0 and (GPLv2+ with exceptions or BSD)
+"""
+
+
+class LicenseExpressionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    # rpm license names keep their spaces, a choice satisfied by an approved
+    # license is not reported
+    def test_spec(self):
+        file_name = os.path.join(self.tmpdir, "p.spec")
+        with open(file_name, "w") as f:
+            f.write(spec)
+        expression = license_expression(spec_licenses(file_name))
+        self.assertEqual(expression, "(GPLv2+ | MIT) & (Public Domain) & (ASL 2.0 & (GPLv2+ with exceptions | BSD))")
+        tree = Expression(expression).tree
+        self.assertEqual(tree, ("&", [("|", ["GPLv2+", "MIT"]), "Public Domain",
+                                      ("&", ["ASL 2.0", ("|", ["GPLv2+ WITH exceptions", "BSD"])])]))
+        self.assertEqual(Expression(expression).violations(lambda l: l in ("MIT", "BSD")),
+                         ["Public Domain", "ASL 2.0"])
+
+    def test_oe(self):
+        self.assertEqual(Expression("GPLv2 & LGPLv2.1 | MIT").tree, ("|", [("&", ["GPLv2", "LGPLv2.1"]), "MIT"]))
+        self.assertEqual(Expression("Apache-2.0 WITH LLVM-exception OR MIT").tree,
+                         ("|", ["Apache-2.0 WITH LLVM-exception", "MIT"]))
+
+    def test_errors(self):
+        for text, token in (("(MIT (BSD))", "( instead of )"), ("MIT & with", "with"), ("MIT )", ")")):
+            try:
+                Expression(text)
+            except ValueError as e:
+                self.assertTrue(str(e).startswith("Unexpected " + token + " "), str(e))
+            else:
+                self.fail(text)
+        self.assertEqual(license_names("(Public Domain | MIT) & GPLv2 with"), ["Public Domain", "MIT", "GPLv2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+#
+# test_nvd.py - Tests for the NVD feed index, part of ISA FW
+#
+# Copyright (c) 2015, Intel Corporation
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of Intel Corporation nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lib", "isafw", "isaplugins"))
+from _nvd import NVDIndex
+
+fixtures = os.path.join(os.path.dirname(__file__), "fixtures", "nvd")
+yearly_feed = "nvdcve-1.1-2020.json"
+modified_feed = "nvdcve-1.1-modified.json"
+
+
+class NVDIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.feed_dir = os.path.join(self.tmpdir, "feeds")
+        os.makedirs(self.feed_dir)
+        self.indexes = []
+
+    def tearDown(self):
+        for index in self.indexes:
+            index.close()
+        shutil.rmtree(self.tmpdir)
+
+    # the fixture as the named feed, last modified at mtime
+    def add_feed(self, fixture, name, mtime):
+        shutil.copyfile(os.path.join(fixtures, fixture), os.path.join(self.feed_dir, name))
+        os.utime(os.path.join(self.feed_dir, name), (mtime, mtime))
+
+    def index(self, name="index.db"):
+        index = NVDIndex(os.path.join(self.tmpdir, name), self.feed_dir)
+        self.indexes.append(index)
+        index.update()
+        return index
+
+    def test_version_bounds(self):
+        self.add_feed("yearly.json", yearly_feed, 1000)
+        index = self.index()
+        for product, version, cves in [
+                ("zlib", "1.1", ["CVE-2020-0001"]),
+                ("zlib", "1.2.0", ["CVE-2020-0001", "CVE-2020-0002"]),
+                ("zlib", "1.2.8", ["CVE-2020-0001", "CVE-2020-0002"]),
+                ("ZLIB", "1.2.8", ["CVE-2020-0001", "CVE-2020-0002"]),
+                ("zlib", "1.2.9", []),
+                ("openssl", "1.0.2", ["CVE-2020-0003"]),
+                ("openssl", "1.0.2beta1", ["CVE-2020-0003"]),
+                ("openssl", "1.0.2a", []),
+                ("libfoo", "2.0", []),
+                ("libfoo", "2.5", ["CVE-2020-0004"]),
+                ("libfoo", "3.0rc1", ["CVE-2020-0004"]),
+                ("libfoo", "3.0", []),
+                ("unknown", "1.0", [])]:
+            self.assertEqual(index.match(product, version), cves, (product, version))
+
+    # "*" is every version, "-" a product without versions
+    def test_versionless(self):
+        self.add_feed("yearly.json", yearly_feed, 1000)
+        index = self.index()
+        for version in ("0.1", "1.0", "20200101"):
+            self.assertEqual(index.match("libbaz", version), ["CVE-2020-0006"])
+            self.assertEqual(index.match("libbar", version), [])
+
+    def test_modified_feed(self):
+        self.add_feed("yearly.json", yearly_feed, 1000)
+        self.add_feed("modified.json", modified_feed, 2000)
+        index = self.index()
+        self.assertEqual(index.match("zlib", "1.2.10"), ["CVE-2020-0001", "CVE-2020-0008"])
+        self.assertEqual(index.match("zlib", "1.2.8"), ["CVE-2020-0001", "CVE-2020-0002", "CVE-2020-0008"])
+        self.assertEqual(index.details(["CVE-2020-0001", "CVE-2020-0009"]),
+                         {"CVE-2020-0001": ("9.8", "Overflow in zlib before 1.2.11")})
+        self.assertEqual(index.update(), [])
+
+    # CVEs leaving the modified feed fall back to the yearly feeds
+    def test_rollover(self):
+        self.add_feed("yearly.json", yearly_feed, 1000)
+        self.add_feed("modified.json", modified_feed, 2000)
+        index = self.index()
+        self.add_feed("modified-rollover.json", modified_feed, 3000)
+        self.assertEqual(index.update(), [modified_feed])
+        fresh = self.index("fresh.db")
+        for version, cves in [
+                ("1.2.8", ["CVE-2020-0001", "CVE-2020-0002", "CVE-2020-0008"]),
+                ("1.2.10", ["CVE-2020-0008"]),
+                ("1.3", [])]:
+            self.assertEqual(index.match("zlib", version), cves, version)
+            self.assertEqual(fresh.match("zlib", version), cves, version)
+        self.assertEqual(index.details(["CVE-2020-0001"]),
+                         {"CVE-2020-0001": ("7.5", "Overflow in zlib before 1.2.9")})
+
+    def test_removed_feed(self):
+        self.add_feed("yearly.json", yearly_feed, 1000)
+        self.add_feed("modified.json", modified_feed, 2000)
+        index = self.index()
+        os.remove(os.path.join(self.feed_dir, modified_feed))
+        self.assertEqual(index.update(), [])
+        self.assertEqual(index.match("zlib", "1.2.8"), ["CVE-2020-0001", "CVE-2020-0002"])
+        self.assertEqual(index.match("zlib", "1.2.10"), [])
+        os.remove(os.path.join(self.feed_dir, yearly_feed))
+        index.update()
+        self.assertEqual(index.match("zlib", "1.2.8"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+#
+# test_workers.py - Tests for the CFA worker processes, part of ISA FW
+#
+# Copyright (c) 2015, Intel Corporation
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright notice,
+#      this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer in the
+#      documentation and/or other materials provided with the distribution.
+#    * Neither the name of Intel Corporation nor the names of its contributors
+#      may be used to endorse or promote products derived from this software
+#      without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import mmap
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lib", "isafw", "isaplugins"))
+from _workers import WorkerPool, Aborted, run
+
+
+def analyse(item):
+    if item == "fail":
+        raise ValueError("corrupt file")
+    if item == "hang":
+        time.sleep(60)
+    return item.upper()
+
+
+def allocate(mib):
+    return len(bytearray(mib << 20))
+
+
+class WorkerPoolTest(unittest.TestCase):
+
+    def check(self, results):
+        self.assertEqual(results[0], "A")
+        self.assertTrue(isinstance(results[1], Aborted))
+        self.assertTrue(results[1].reason.startswith("failed: ValueError"))
+        self.assertEqual(results[2], "B")
+
+    # an item whose processing raises does not stop the other ones
+    def test_failing_item(self):
+        pool = WorkerPool(analyse, 2)
+        try:
+            self.check(list(pool.imap(["a", "fail", "b"])))
+        finally:
+            pool.close()
+
+    def test_failing_item_serial(self):
+        self.check([run(analyse, item) for item in ["a", "fail", "b"]])
+
+    def test_timeout(self):
+        pool = WorkerPool(analyse, 2, timeout=1)
+        try:
+            results = list(pool.imap(["a", "hang", "b"]))
+        finally:
+            pool.close()
+        self.assertEqual(results[0], "A")
+        self.assertEqual(results[1].reason, "timed out")
+        self.assertEqual(results[2], "B")
+
+
+    # the limit counts from the address space the worker inherits
+    def test_memory_limit(self):
+        inherited = mmap.mmap(-1, 1 << 30)
+        pool = WorkerPool(allocate, 1, memory_limit=256)
+        try:
+            results = list(pool.imap([1, 512]))
+        finally:
+            pool.close()
+            inherited.close()
+        self.assertEqual(results[0], 1 << 20)
+        self.assertEqual(results[1].reason, "exceeded the memory limit")
+
+
+if __name__ == "__main__":
+    unittest.main()